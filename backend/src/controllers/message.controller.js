@@ -99,7 +99,13 @@ export const sendMessage = async (req, res) => {
     let analysisResult;
     try {
       console.log("🔍 Analyzing sentiment...");
-      analysisResult = await analyzeTextToxicityWithEnhancedSentiment(text, selectedModel || 'svc');
+      // Groups and direct chats each get their own mood rollup on the Django side
+      const conversationId = groupId
+        ? `group:${groupId}`
+        : `dm:${[senderId.toString(), receiverId].sort().join(":")}`;
+      analysisResult = await analyzeTextToxicityWithEnhancedSentiment(
+        text, selectedModel || 'svc', conversationId, groupId ? groupId.toString() : null
+      );
       console.log("✅ Analysis complete:", analysisResult.sentiment.value);
     } catch (error) {
       console.error("❌ Sentiment analysis failed:", error);
@@ -0,0 +1,88 @@
+import net from "net";
+
+// Persistent, pipelined connection to Django's `manage.py serve_inference`.
+// Requests are newline-delimited JSON frames tagged with an id; Django answers
+// them out of order as each analysis finishes, and the id matches them up.
+export class InferenceSocketClient {
+  constructor(socketPath, { timeout = 5000 } = {}) {
+    this.socketPath = socketPath;
+    this.timeout = timeout;
+    this.socket = null;
+    this.buffer = "";
+    this.nextId = 0;
+    this.pending = new Map(); // id -> { resolve, reject, timer }
+  }
+
+  connect() {
+    if (this.socket) return this.socket;
+
+    const socket = net.createConnection(this.socketPath);
+    socket.setEncoding("utf8");
+    socket.on("data", (chunk) => this.onData(chunk));
+    socket.on("error", (error) => this.failAll(error));
+    socket.on("close", () => {
+      this.socket = null;
+      this.buffer = "";
+      this.failAll(new Error("Inference socket closed"));
+    });
+    this.socket = socket;
+    return socket;
+  }
+
+  onData(chunk) {
+    this.buffer += chunk;
+    let newline;
+    while ((newline = this.buffer.indexOf("\n")) !== -1) {
+      const line = this.buffer.slice(0, newline);
+      this.buffer = this.buffer.slice(newline + 1);
+      if (!line.trim()) continue;
+
+      let frame;
+      try {
+        frame = JSON.parse(line);
+      } catch (error) {
+        console.error("❌ Invalid frame from inference socket:", error.message);
+        continue;
+      }
+
+      if (frame.id == null) {
+        // Connection-level error (e.g. 413 frame too large): Django answered
+        // everything it could and is closing, so nothing pending will be answered
+        const reason = frame.data?.error || "connection error";
+        this.failAll(new Error(`Inference socket error ${frame.status}: ${reason}`));
+        continue;
+      }
+
+      const request = this.pending.get(frame.id);
+      if (!request) continue; // Timed out already
+      this.pending.delete(frame.id);
+      clearTimeout(request.timer);
+      request.resolve(frame);
+    }
+  }
+
+  failAll(error) {
+    for (const { reject, timer } of this.pending.values()) {
+      clearTimeout(timer);
+      reject(error);
+    }
+    this.pending.clear();
+  }
+
+  // Resolves with { status, data } like an HTTP response from the same endpoint.
+  // `deadline` (epoch ms) lets Django skip or abandon work we will no longer wait for
+  request(endpoint, data, deadline = null) {
+    const socket = this.connect();
+    const id = String(++this.nextId);
+
+    return new Promise((resolve, reject) => {
+      const timer = setTimeout(() => {
+        this.pending.delete(id);
+        reject(new Error(`Inference request ${id} timed out after ${this.timeout}ms`));
+      }, this.timeout);
+
+      this.pending.set(id, { resolve, reject, timer });
+      socket.write(JSON.stringify({ id, endpoint, data, deadline }) + "\n");
+    });
+  }
+}
@@ -1,4 +1,5 @@
 import { config } from "dotenv";
+import { InferenceSocketClient } from "./inferenceSocket.js";
 
 config();
 
@@ -7,6 +8,8 @@ const PERSPECTIVE_API_URL = "https://commentanalyzer.googleapis.com/v1alpha1/com
 const DJANGO_TOXICITY_URL = process.env.DJANGO_TOXICITY_URL || "http://127.0.0.1:8000/api/sentiment/toxicity/";
 const DJANGO_ENHANCED_SENTIMENT_URL = process.env.DJANGO_ENHANCED_SENTIMENT_URL || "http://127.0.0.1:8000/api/sentiment/enhanced/";
 const DJANGO_SENTIMENT_API = process.env.DJANGO_SENTIMENT_API || 'http://127.0.0.1:8000/api/sentiment';
+// When set, Django calls go over one pipelined socket (`manage.py serve_inference`) instead of HTTP
+const DJANGO_INFERENCE_SOCKET = process.env.DJANGO_INFERENCE_SOCKET;
 
 // Configuration for toxicity detection methods
 const TOXICITY_CONFIG = {
@@ -18,28 +21,50 @@ const TOXICITY_CONFIG = {
   timeout: parseInt(process.env.TOXICITY_TIMEOUT) || 5000 // 5 second timeout
 };
 
+const inferenceSocket = DJANGO_INFERENCE_SOCKET
+  ? new InferenceSocketClient(DJANGO_INFERENCE_SOCKET, { timeout: TOXICITY_CONFIG.timeout })
+  : null;
+
+// POST a JSON body to a Django analysis endpoint, over the socket when configured.
+// Django gets our give-up time so it can skip optional stages or drop the request.
+const postToDjango = async (endpoint, url, body) => {
+  const deadline = Date.now() + TOXICITY_CONFIG.timeout;
+
+  if (inferenceSocket) {
+    const frame = await inferenceSocket.request(endpoint, body, deadline);
+    return { ok: frame.status === 200, status: frame.status, statusText: "", data: frame.data };
+  }
+
+  const response = await fetch(url, {
+    method: "POST",
+    headers: {
+      "Content-Type": "application/json",
+      "X-Request-Deadline": String(deadline),
+    },
+    body: JSON.stringify(body),
+    signal: AbortSignal.timeout(TOXICITY_CONFIG.timeout),
+  });
+  const data = response.ok ? await response.json() : null;
+  return { ok: response.ok, status: response.status, statusText: response.statusText, data };
+};
+
 // Enhanced sentiment analysis with negation handling
-export async function getEnhancedSentiment(text, selectedModel = 'svc') {
+export async function getEnhancedSentiment(text, selectedModel = 'svc', conversationId = null) {
   try {
     console.log(`🔍 [getEnhancedSentiment] Using model: ${selectedModel.toUpperCase()} for text: "${text.substring(0, 50)}..."`);
     console.log(`📡 [getEnhancedSentiment] Sending request to Django with model=${selectedModel}`);
     
-    const response = await fetch(`${DJANGO_SENTIMENT_API}/enhanced/`, {
-      method: 'POST',
-      headers: {
-        'Content-Type': 'application/json',
-      },
-      body: JSON.stringify({ 
-        text,
-        model: selectedModel  // ✅ Already passing model
-      }),
+    const response = await postToDjango("enhanced", `${DJANGO_SENTIMENT_API}/enhanced/`, {
+      text,
+      model: selectedModel,  // ✅ Already passing model
+      conversation_id: conversationId // Feeds the per-conversation rollups
     });
 
     if (!response.ok) {
       throw new Error(`Django API responded with status ${response.status}`);
     }
 
-    const data = await response.json();
+    const data = response.data;
     console.log(`✅ [getEnhancedSentiment] ${selectedModel.toUpperCase()} returned: ${data.sentiment} (confidence: ${data.confidence})`);
     console.log(`📊 [getEnhancedSentiment] Model used by Django: ${data.model_used || selectedModel}`);
     
@@ -49,7 +74,9 @@ export async function getEnhancedSentiment(text, selectedModel = 'svc') {
       score: data.score || 0,
       wordAnalysis: data.word_analysis || [],
       enhanced: true,
-      model: data.model_used || selectedModel // Track which model was actually used
+      model: data.model_used || selectedModel, // Track which model was actually used
+      degraded: data.degraded || false, // Django shed the ML step under load
+      skippedStages: data.skipped_stages || [] // Stages Django skipped to meet the deadline
     };
   } catch (error) {
     console.error(`❌ [getEnhancedSentiment] Error with model ${selectedModel}:`, error);
@@ -66,27 +93,29 @@ export async function getEnhancedSentiment(text, selectedModel = 'svc') {
 }
 
 // Django ML-enhanced toxicity analysis
-export const analyzeToxicityWithML = async (text, originalSentiment = "neutral") => {
+export const analyzeToxicityWithML = async (text, originalSentiment = "neutral", conversationId = null, groupId = null) => {
   try {
     console.log("🤖 Analyzing toxicity with Django ML models...");
     
-    const response = await fetch(DJANGO_TOXICITY_URL, {
-      method: "POST",
-      headers: {
-        "Content-Type": "application/json",
-      },
-      body: JSON.stringify({
-        text: text,
-        use_ml: true,
-        sentiment: originalSentiment
-      }),
+    // Only the verdict is used here: ask for the minimal profile, compactly encoded
+    const toxicityUrl = new URL(DJANGO_TOXICITY_URL);
+    toxicityUrl.searchParams.set("format", "compact");
+
+    const response = await postToDjango("toxicity", toxicityUrl, {
+      text: text,
+      use_ml: true,
+      sentiment: originalSentiment,
+      conversation_id: conversationId,
+      group_id: groupId, // the group's own blocked/allowed words apply on top of the global lists
+      detail: "minimal",
+      fields: ["toxicity"] // Django only runs the stages this needs
     });
 
     if (!response.ok) {
       throw new Error(`Django toxicity API error: ${response.status} ${response.statusText}`);
     }
 
-    const result = await response.json();
+    const result = response.data;
     
     if (result.error) {
       throw new Error(result.error);
@@ -102,7 +131,9 @@ export const analyzeToxicityWithML = async (text, originalSentiment = "neutral")
       method: "django_ml",
       detectedKeywords: result.toxicity.detectedKeywords,
       sentiment: result.sentiment,
-      sentimentOverridden: result.sentimentOverridden
+      sentimentOverridden: result.sentimentOverridden,
+      degraded: result.degraded || false, // Django shed the ML step under load
+      skippedStages: result.skipped_stages || [] // Stages Django skipped to meet the deadline
     };
 
   } catch (error) {
@@ -246,13 +277,13 @@ export const analyzeKeywordToxicity = (text) => {
 };
 
 // Enhanced toxicity analysis with multiple methods and fallbacks
-export const analyzeTextToxicity = async (text) => {
+export const analyzeTextToxicity = async (text, conversationId = null, groupId = null) => {
   console.log("🛡️ Starting toxicity analysis with method:", TOXICITY_CONFIG.preferredMethod);
 
   // If a specific method is requested, try only that method
   if (TOXICITY_CONFIG.preferredMethod === "django" && TOXICITY_CONFIG.enableDjango) {
     try {
-      return await analyzeToxicityWithML(text);
+      return await analyzeToxicityWithML(text, "neutral", conversationId, groupId);
     } catch (error) {
       console.error("❌ Django ML analysis failed:", error.message);
       if (!TOXICITY_CONFIG.enableKeywordFallback) throw error;
@@ -281,7 +312,7 @@ export const analyzeTextToxicity = async (text) => {
   // Method 1: Try Django ML models first (most accurate)
   if (TOXICITY_CONFIG.enableDjango) {
     try {
-      const result = await analyzeToxicityWithML(text);
+      const result = await analyzeToxicityWithML(text, "neutral", conversationId, groupId);
       console.log("✅ Django ML analysis successful");
       return result;
     } catch (error) {
@@ -332,18 +363,18 @@ export const getSentimentFromToxicity = (toxicityData, originalSentiment = "neut
 };
 
 // Enhanced function to analyze toxicity with improved sentiment analysis
-export async function analyzeTextToxicityWithEnhancedSentiment(text, selectedModel = 'svc') {
+export async function analyzeTextToxicityWithEnhancedSentiment(text, selectedModel = 'svc', conversationId = null, groupId = null) {
   try {
     console.log(`🛡️ [analyzeTextToxicityWithEnhancedSentiment] Starting analysis with model: ${selectedModel.toUpperCase()}`);
     
     // Step 1: Get enhanced sentiment analysis (with negation handling)
     let sentimentData = null;
     if (TOXICITY_CONFIG.enableEnhancedSentiment) {
-      sentimentData = await getEnhancedSentiment(text, selectedModel);
+      sentimentData = await getEnhancedSentiment(text, selectedModel, conversationId);
     }
     
     // Step 2: Analyze toxicity
-    const toxicityData = await analyzeTextToxicity(text);
+    const toxicityData = await analyzeTextToxicity(text, conversationId, groupId);
     
     // Step 3: Determine final sentiment
     let finalSentiment;
@@ -0,0 +1,238 @@
+"""
+Build the extended sentiment lexicon from the trained Naive Bayes model.
+
+The hand-picked lexicon in ``EnhancedSentimentAnalyzer`` knows ~55 words, so
+most messages contain none of them and fall through to the slower ML
+verification. This script derives polarity scores for many more words from
+the NB model's per-class word counts:
+
+- smoothed log-odds of the word in positive vs negative messages
+  (add-alpha smoothing over the model's vocabulary),
+- a z-score of that log-odds, so rare words need a larger gap to qualify,
+- a frequency threshold, and a minimum log ratio against the neutral class
+  so words common in neutral messages ("day", "work") are left out.
+
+The NB vocabulary is built from preprocessed (lemmatized, apostrophe-free)
+tokens, while the analyzer sees raw chat tokens. A word is only kept when
+it is mostly seen as itself in the raw training messages, so lemmas
+("amaze", "annoy") and mangled contractions ("weve") that never match a
+message are left out.
+
+Scores are the log-odds divided by ``--scale``, clipped to [-1, 1]; words
+scoring below ``--min-score`` are dropped, as they would only pull a
+message's average towards neutral and back into the fallback. Hand-picked
+words, negations and intensifiers are never overridden, and the training
+data's merged negation tokens ("not_good") are skipped since the analyzer
+handles negation itself. Topical words the training data happens to skew on
+(Mother's Day, Star Wars day) and names are left out via ``--exclude``.
+
+The result is written with a content version to extended_lexicon.json,
+together with a report of the fallback rate, accuracy and per-message
+latency on the raw test messages with and without the extension.
+
+    python build_lexicon.py
+    python build_lexicon.py --min-count 20 --min-z 3.5
+"""
+
+import argparse
+import hashlib
+import json
+import math
+import os
+import pickle
+import sys
+import time
+from collections import Counter
+
+import numpy as np
+import pandas as pd
+
+BEYONDER_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(BEYONDER_DIR)
+sys.path.append(os.path.dirname(BEYONDER_DIR))
+
+from sentiment.enhanced_sentiment import LEXICON_TOKEN, EnhancedSentimentAnalyzer, iter_tokens  # noqa: E402
+
+NB_MODEL_PATH = os.path.join(BEYONDER_DIR, 'nb_classifier.pkl')
+SVC_MODEL_PATH = os.path.join(BEYONDER_DIR, 'svm_classifier.pkl')
+# Raw messages, tokenized as the analyzer tokenizes chat messages
+TRAIN_PATH = os.path.join(BEYONDER_DIR, 'train.csv')
+TEST_PATH = os.path.join(BEYONDER_DIR, 'test.csv')
+OUTPUT_PATH = os.path.join(BEYONDER_DIR, 'extended_lexicon.json')
+
+# Words that skew positive or negative in the training tweets only because of
+# the events they cover, not because of their meaning
+DEFAULT_EXCLUDE = [
+    'brazil', 'henrie', 'internet', 'john', 'knee', 'momma', 'mother', 'moms', 'mummy', 'snl', 'star',
+    'throat', 'truck', 'twin', 'war',
+]
+
+
+def file_sha1(path):
+    sha = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+def surface_counts(texts):
+    """Occurrences of each token in raw messages, as the analyzer tokenizes them"""
+    return Counter(token for text in texts for token in iter_tokens(text))
+
+
+def derive_scores(nb, surface, alpha=1.0, min_count=10, min_z=3.0, scale=2.5, min_score=0.5,
+                  min_vs_neutral=0.5, min_surface_share=0.8, exclude=()):
+    """
+    Word -> polarity score from the NB count tables
+
+    ``surface`` counts the raw tokens (see surface_counts); a word must
+    occur as itself at least ``min_surface_share`` times as often as the
+    NB model counted it.
+    """
+    counts = nb.class_word_counts
+    totals = {cls: sum(words.values()) for cls, words in counts.items()}
+    vocab_size = len(nb.vocab)
+    analyzer = EnhancedSentimentAnalyzer()
+    reserved = set(analyzer.word_sentiments) | analyzer.negation_words | analyzer.intensifier_parts | set(exclude)
+
+    def rate(cls, word):
+        return (counts[cls].get(word, 0) + alpha) / (totals[cls] + alpha * vocab_size)
+
+    scores = {}
+    for word in nb.vocab:
+        if word in reserved or '_' in word or len(word) < 2 or not LEXICON_TOKEN.fullmatch(word):
+            continue
+        if any(c.isdigit() for c in word):
+            continue
+        positive = counts['positive'].get(word, 0)
+        negative = counts['negative'].get(word, 0)
+        if positive + negative < min_count:
+            continue
+        if surface.get(word, 0) < min_surface_share * sum(words.get(word, 0) for words in counts.values()):
+            continue
+
+        log_odds = math.log(rate('positive', word)) - math.log(rate('negative', word))
+        z = log_odds / math.sqrt(1 / (positive + alpha) + 1 / (negative + alpha))
+        if abs(z) < min_z:
+            continue
+
+        side = 'positive' if log_odds > 0 else 'negative'
+        if math.log(rate(side, word) / rate('neutral', word)) < min_vs_neutral:
+            continue
+
+        score = max(-1.0, min(1.0, log_odds / scale))
+        if abs(score) >= min_score:
+            scores[word] = round(score, 3)
+    return dict(sorted(scores.items()))
+
+
+def evaluate(analyzer, texts, labels, fallback):
+    """
+    Fallback rate, accuracy and latency of the enhanced endpoint's logic:
+    the lexicon verdict, verified by the ML model when it is unsure
+    """
+    fallbacks = 0
+    correct = 0
+    lexicon_correct = 0
+    latencies = []
+
+    for text, label in zip(texts, labels):
+        started = time.perf_counter()
+        result = analyzer.analyze_sentiment(text, explain=False)
+        sentiment = result['sentiment']
+        if result['confidence'] < 0.5 or sentiment == 'neutral':
+            fallbacks += 1
+            ml_sentiment = fallback(text) or 'neutral'
+            if sentiment == 'neutral' and ml_sentiment != 'neutral':
+                sentiment = ml_sentiment
+        else:
+            lexicon_correct += sentiment == label
+        latencies.append(time.perf_counter() - started)
+        correct += sentiment == label
+
+    decided = len(texts) - fallbacks
+    return {
+        'fallback_rate': round(fallbacks / len(texts) * 100, 2),
+        'accuracy': round(correct / len(texts) * 100, 2),
+        'lexicon_decided_accuracy': round(lexicon_correct / decided * 100, 2) if decided else None,
+        'mean_ms': round(float(np.mean(latencies)) * 1000, 4),
+        'p50_ms': round(float(np.percentile(latencies, 50)) * 1000, 4),
+        'p99_ms': round(float(np.percentile(latencies, 99)) * 1000, 4),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--alpha', type=float, default=1.0, help='Add-alpha smoothing of the word counts')
+    parser.add_argument('--min-count', type=int, default=10,
+                        help='Minimum occurrences in positive and negative messages together')
+    parser.add_argument('--min-z', type=float, default=3.0, help='Minimum |z-score| of the log-odds')
+    parser.add_argument('--scale', type=float, default=2.5, help='Log-odds that map to a score of 1.0')
+    parser.add_argument('--min-score', type=float, default=0.5, help='Drop words scoring below this')
+    parser.add_argument('--min-vs-neutral', type=float, default=0.5,
+                        help='Minimum log ratio of the word in its polar class vs the neutral class')
+    parser.add_argument('--min-surface-share', type=float, default=0.8,
+                        help='Minimum raw occurrences of a word, as a share of its NB count')
+    parser.add_argument('--exclude', nargs='*', default=DEFAULT_EXCLUDE, help='Words never to include')
+    parser.add_argument('--fallback-model', choices=['nb', 'svc'], default='svc',
+                        help='Model the report uses for unsure verdicts (the endpoint default is svc)')
+    parser.add_argument('--output', default=OUTPUT_PATH)
+    args = parser.parse_args()
+
+    with open(NB_MODEL_PATH, 'rb') as f:
+        nb = pickle.load(f)
+
+    params = {
+        'alpha': args.alpha,
+        'min_count': args.min_count,
+        'min_z': args.min_z,
+        'scale': args.scale,
+        'min_score': args.min_score,
+        'min_vs_neutral': args.min_vs_neutral,
+        'min_surface_share': args.min_surface_share,
+        'exclude': sorted(args.exclude),
+    }
+    surface = surface_counts(pd.read_csv(TRAIN_PATH).dropna()['text'])
+    words = derive_scores(nb, surface, **params)
+    version = hashlib.sha1(json.dumps(words, sort_keys=True).encode('utf-8')).hexdigest()[:12]
+    positive = sum(score > 0 for score in words.values())
+    print(f"📚 Derived {len(words)} words ({positive} positive, {len(words) - positive} negative), version {version}")
+
+    if args.fallback_model == 'nb':
+        fallback = lambda text: nb.predict([text])[0]  # noqa: E731
+    else:
+        with open(SVC_MODEL_PATH, 'rb') as f:
+            tfidf_vectorizer, svm_classifier = pickle.load(f)
+        fallback = lambda text: svm_classifier.predict(tfidf_vectorizer.transform([text]))[0]  # noqa: E731
+
+    test = pd.read_csv(TEST_PATH).dropna()
+    texts, labels = test['text'].tolist(), test['sentiment'].tolist()
+    print(f"⏱️ Evaluating on {len(texts)} test messages with {args.fallback_model.upper()} as the fallback...")
+    report = {
+        'test_samples': len(texts),
+        'fallback_model': args.fallback_model,
+        'base': evaluate(EnhancedSentimentAnalyzer(), texts, labels, fallback),
+        'extended': evaluate(EnhancedSentimentAnalyzer(extended_lexicon=words), texts, labels, fallback),
+    }
+
+    with open(args.output, 'w') as f:
+        json.dump({
+            'version': version,
+            'built_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+            'source': {'model': os.path.basename(NB_MODEL_PATH), 'model_sha1': file_sha1(NB_MODEL_PATH)[:12]},
+            'params': params,
+            'report': report,
+            'words': words,
+        }, f, indent=2)
+
+    print(f"\n📊 {'':<10} {'fallback %':>10} {'accuracy %':>10} {'mean ms':>9} {'p50 ms':>8} {'p99 ms':>8}")
+    for name in ('base', 'extended'):
+        row = report[name]
+        print(f"   {name:<10} {row['fallback_rate']:>10} {row['accuracy']:>10} "
+              f"{row['mean_ms']:>9.3f} {row['p50_ms']:>8.3f} {row['p99_ms']:>8.3f}")
+    print(f"\n✅ Extended lexicon saved to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -7,21 +7,52 @@ import string
 from sklearn.feature_extraction.text import TfidfVectorizer
 import sys
 import os
+import time
+import tracemalloc
 
-# Add the current directory to the path to import nb_classifier
+# Add the current directory to the path to import nb_classifier, and the
+# Django project for the lexicon analyzer
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from feature_store import FeatureStore
+from sentiment.enhanced_sentiment import EnhancedSentimentAnalyzer, load_extended_lexicon
+
+# Cleaned text and TF-IDF matrices are reused across runs until the data,
+# clean_text or the vectorizer changes
+feature_store = FeatureStore()
+
+# clean_text's patterns, written so they run in linear time on untrusted text.
+# The training-time forms r'\[.*?\]', r'<.*?>+' and r'\w*\d\w*' retry from
+# every '[', '<' or letter and backtrack to the end of the line or word, which
+# is quadratic on inputs like '[[[[...' or a long run of letters.
+#
+# An opening bracket (or '<') consumes everything up to the closing one or the
+# end of the line; the span is removed only when the closing character was
+# found. An unclosed span is kept as it is, and scanning resumes after it: no
+# later opening character on that line can be closed either.
+BRACKETED = re.compile(r'\[[^\]\n]*(\])?')
+TAG = re.compile(r'<[^>\n]*(>+)?')
+URL = re.compile(r'https?://\S+|www\.\S+')
+PUNCTUATION = re.compile('[%s]' % re.escape(string.punctuation))
+# Words containing a digit; anchored at word starts so each word is scanned once
+WORD_WITH_DIGIT = re.compile(r'\b\w*\d\w*')
+
+
+def _remove_closed(match):
+    return '' if match.group(1) else match.group()
+
 
 def clean_text(text):
     """Clean text function (same as used in training)"""
     text = str(text).lower()
     
-    # Use raw strings (prefix with r) to prevent SyntaxWarnings
-    text = re.sub(r'\[.*?\]', '', text)
-    text = re.sub(r'https?://\S+|www\.\S+', '', text)
-    text = re.sub(r'<.*?>+', '', text)
-    text = re.sub('[%s]' % re.escape(string.punctuation), '', text)
-    text = re.sub(r'\n', '', text)
-    text = re.sub(r'\w*\d\w*', '', text)
+    text = BRACKETED.sub(_remove_closed, text)
+    text = URL.sub('', text)
+    text = TAG.sub(_remove_closed, text)
+    text = PUNCTUATION.sub('', text)
+    text = text.replace('\n', '')
+    text = WORD_WITH_DIGIT.sub('', text)
     
     # Dictionary for common typos and slangs
     typos_slangs = {
@@ -38,26 +69,123 @@ def clean_text(text):
     
     return text
 
+# Test messages timed one at a time for the single-message latency percentiles
+LATENCY_SAMPLES = 500
+
+def measure_load(path):
+    """Load a pickled model, returning it with its load time and memory footprint"""
+    started = time.perf_counter()
+    with open(path, 'rb') as f:
+        model = pickle.load(f)
+    load_seconds = time.perf_counter() - started
+
+    # Load a second copy under tracemalloc so tracing doesn't skew the timing
+    tracemalloc.start()
+    with open(path, 'rb') as f:
+        copy = pickle.load(f)
+    memory_bytes = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del copy
+
+    return model, load_seconds, memory_bytes
+
+def measure_runtime(predict, texts, load_seconds, memory_bytes, batch_seconds=None):
+    """
+    Single-message latency and batch throughput of ``predict`` (a list of texts -> labels)
+
+    Pass ``batch_seconds`` when the whole of ``texts`` was already predicted and timed.
+    """
+    latencies = []
+    for text in texts[:LATENCY_SAMPLES]:
+        started = time.perf_counter()
+        predict([text])
+        latencies.append(time.perf_counter() - started)
+
+    if batch_seconds is None:
+        started = time.perf_counter()
+        predict(texts)
+        batch_seconds = time.perf_counter() - started
+
+    runtime = {
+        'load_seconds': round(load_seconds, 4),
+        'memory_mb': round(memory_bytes / (1024 * 1024), 2),
+        'p50_ms': round(float(np.percentile(latencies, 50)) * 1000, 4),
+        'p99_ms': round(float(np.percentile(latencies, 99)) * 1000, 4),
+        'throughput_per_s': round(len(texts) / batch_seconds, 1) if batch_seconds else 0.0,
+    }
+    print(f"   Load: {runtime['load_seconds']}s, {runtime['memory_mb']} MB")
+    print(f"   Latency: p50 {runtime['p50_ms']}ms, p99 {runtime['p99_ms']}ms")
+    print(f"   Throughput: {runtime['throughput_per_s']} messages/s")
+    return runtime
+
+# Score histograms of the drift baseline; must match sentiment/drift.py
+HISTOGRAM_BINS = 20
+LEXICON_SCORE_RANGE = (-1.0, 1.0)
+
+
+def class_counts(predictions):
+    return {str(label): int(count) for label, count in pd.Series(list(predictions)).value_counts().items()}
+
+
+def measure_drift_baseline(texts):
+    """
+    What the live drift monitor (sentiment/drift.py) compares traffic with:
+    each analysis path's output on the test messages as the API receives
+    them (before clean_text), and their rate of words missing from the NB
+    vocabulary
+    """
+    print("\n📐 Measuring the drift baseline on the raw test messages...")
+    baseline = {}
+
+    try:
+        extended_lexicon, _ = load_extended_lexicon('extended_lexicon.json')
+    except (OSError, ValueError, KeyError):
+        extended_lexicon = None
+    analyzer = EnhancedSentimentAnalyzer(extended_lexicon=extended_lexicon)
+    lexicon_results = [analyzer.analyze_sentiment(text, explain=False) for text in texts]
+    scores = np.clip([result['score'] for result in lexicon_results], *LEXICON_SCORE_RANGE)
+    histogram, _ = np.histogram(scores, bins=HISTOGRAM_BINS, range=LEXICON_SCORE_RANGE)
+    baseline['lexicon'] = {
+        'classes': class_counts(result['sentiment'] for result in lexicon_results),
+        'score_histogram': [int(count) for count in histogram],
+    }
+
+    with open('nb_classifier.pkl', 'rb') as f:
+        nb_model = pickle.load(f)
+    # Words as the NB model splits them
+    words = [word for text in texts for word in text.split()]
+    oov_rate = round(sum(word not in nb_model.vocab for word in words) / len(words), 4) if words else None
+    baseline['nb'] = {'classes': class_counts(nb_model.predict(texts)), 'oov_rate': oov_rate}
+
+    with open('svm_classifier.pkl', 'rb') as f:
+        svc_tfidf, svc_model = pickle.load(f)
+    baseline['svc'] = {'classes': class_counts(svc_model.predict(svc_tfidf.transform(texts))), 'oov_rate': oov_rate}
+
+    for name, path in baseline.items():
+        print(f"   {name}: {path['classes']}")
+    print(f"   OOV rate: {oov_rate}")
+    return baseline
+
+
 def load_and_evaluate_models():
     """Load models and evaluate their performance"""
     print("🔍 Starting model evaluation...")
     
-    # Load test data
+    # Load test data (cleaned once, then served from the feature store)
     print("📊 Loading test data...")
+    test_path = 'processed_test_data.csv'
+    sample = None
     try:
-        test_data = pd.read_csv('processed_test_data.csv')
-        print(f"✅ Test data loaded: {len(test_data)} samples")
+        X_test, y_test = feature_store.cleaned_texts(test_path, clean_text)
+        print(f"✅ Test data loaded: {len(X_test)} samples")
     except FileNotFoundError:
         print("❌ Test data not found. Using train data for evaluation...")
-        test_data = pd.read_csv('processed_train_data.csv').sample(1000)  # Sample for faster evaluation
+        test_path = 'processed_train_data.csv'
+        X_test, y_test = feature_store.cleaned_texts(test_path, clean_text)
+        sample = np.sort(np.random.choice(len(X_test), min(1000, len(X_test)), replace=False))  # Sample for faster evaluation
+        X_test = [X_test[i] for i in sample]
     
-    # Clean test data
-    test_data.dropna(inplace=True)
-    test_data['cleaned_text'] = test_data['text'].apply(clean_text)
-    
-    # Prepare data
-    X_test = test_data['cleaned_text']
-    y_test = test_data['sentiment']
+    y_test = pd.Series(y_test if sample is None else y_test[sample])
     
     print(f"📈 Evaluating on {len(X_test)} samples")
     print(f"📊 Class distribution: {y_test.value_counts().to_dict()}")
@@ -67,11 +195,12 @@ def load_and_evaluate_models():
     # Evaluate SVC Model
     print("\n🔍 Evaluating SVC Model...")
     try:
-        with open('svm_classifier.pkl', 'rb') as f:
-            svc_tfidf, svc_model = pickle.load(f)
+        (svc_tfidf, svc_model), svc_load_seconds, svc_memory = measure_load('svm_classifier.pkl')
         
-        # Transform test data
-        X_test_tfidf = svc_tfidf.transform(X_test)
+        # Transform test data (cached per vectorizer)
+        X_test_tfidf, _ = feature_store.features(test_path, clean_text, svc_tfidf)
+        if sample is not None:
+            X_test_tfidf = X_test_tfidf[sample]
         
         # Make predictions
         svc_predictions = svc_model.predict(X_test_tfidf)
@@ -95,6 +224,12 @@ def load_and_evaluate_models():
         print(f"   Recall:    {results['svc']['recall']}%")
         print(f"   F1-Score:  {results['svc']['f1_score']}%")
         
+        # Runtime cost, including vectorization of the raw cleaned text
+        results['svc']['runtime'] = measure_runtime(
+            lambda texts: svc_model.predict(svc_tfidf.transform(texts)),
+            list(X_test), svc_load_seconds, svc_memory
+        )
+        
     except Exception as e:
         print(f"❌ Error evaluating SVC model: {e}")
         results['svc'] = {
@@ -108,16 +243,17 @@ def load_and_evaluate_models():
     print("\n🔍 Evaluating Naive Bayes Model...")
     try:
         # Load the custom Naive Bayes classifier
-        with open('nb_classifier.pkl', 'rb') as f:
-            nb_model = pickle.load(f)
+        nb_model, nb_load_seconds, nb_memory = measure_load('nb_classifier.pkl')
         
         print(f"📝 Loaded NB model type: {type(nb_model)}")
         
         # Convert test data to list for the custom predict method
-        X_test_list = X_test.tolist()
+        X_test_list = list(X_test)
         
         # Make predictions using the custom classifier
+        started = time.perf_counter()
         nb_predictions = nb_model.predict(X_test_list)
+        nb_batch_seconds = time.perf_counter() - started
         
         # Calculate metrics
         nb_accuracy = accuracy_score(y_test, nb_predictions)
@@ -138,6 +274,11 @@ def load_and_evaluate_models():
         print(f"   Recall:    {results['naive_bayes']['recall']}%")
         print(f"   F1-Score:  {results['naive_bayes']['f1_score']}%")
         
+        # The full-set prediction above already timed the batch
+        results['naive_bayes']['runtime'] = measure_runtime(
+            nb_model.predict, X_test_list, nb_load_seconds, nb_memory, batch_seconds=nb_batch_seconds
+        )
+        
     except Exception as e:
         print(f"❌ Error evaluating Naive Bayes model: {e}")
         # Try alternative approach with naive_b_classifier.pkl
@@ -167,11 +308,19 @@ def load_and_evaluate_models():
                 'f1_score': 0.0
             }
     
+    try:
+        raw_texts = pd.read_csv(test_path).dropna()['text'].tolist()
+        if sample is not None:
+            raw_texts = [raw_texts[i] for i in sample]
+        results['drift_baseline'] = measure_drift_baseline(raw_texts)
+    except Exception as e:
+        print(f"❌ Error measuring the drift baseline: {e}")
+    
     # Add dataset statistics
     results['dataset_stats'] = {
-        'total_samples': len(test_data),
+        'total_samples': len(y_test),
         'training_samples': 0,  # Will update this
-        'test_samples': len(test_data),
+        'test_samples': len(y_test),
         'classes': len(y_test.unique()),
         'class_distribution': y_test.value_counts().to_dict()
     }
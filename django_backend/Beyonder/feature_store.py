@@ -0,0 +1,216 @@
+"""
+Cached, columnar feature store for the training and evaluation scripts.
+
+Parsing a CSV, running ``clean_text`` over every row and vectorizing the
+result dominates each evaluation run, yet the output only changes when the
+data, the cleaning function or the vectorizer changes. The store keeps:
+
+- cleaned texts as one UTF-8 blob plus an offsets array,
+- labels as a fixed-width unicode array,
+- vectorized matrices as the three CSR arrays (data, indices, indptr),
+
+each in its own ``.npy`` file, loaded with ``mmap_mode='r'`` so a cached
+dataset opens instantly and is paged in only as it is read. Entries are keyed
+by a hash of the source file contents, the cleaning function's source and the
+fitted vectorizer, so any change to one of them builds a fresh entry.
+
+Usage::
+
+    store = FeatureStore()
+    texts, labels = store.cleaned_texts('processed_test_data.csv', clean_text)
+    X, labels = store.features('processed_test_data.csv', clean_text, tfidf)
+"""
+
+import hashlib
+import inspect
+import json
+import os
+import pickle
+import re
+import shutil
+import tempfile
+
+import numpy as np
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.feature_cache')
+
+
+def file_fingerprint(path):
+    sha = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+def _global_names(code):
+    """Global names a code object and the functions nested in it refer to"""
+    names = set(code.co_names)
+    for const in code.co_consts:
+        if inspect.iscode(const):
+            names |= _global_names(const)
+    return names
+
+
+def function_fingerprint(fn):
+    """
+    Hash of a function's source and of what it uses from its module: the
+    source of module-level helper functions (recursively) and the value of
+    compiled patterns and constants. Moving logic out of ``fn`` into module
+    globals, as clean_text's linear-time patterns do, still changes the key.
+    """
+    sha = hashlib.sha1()
+    seen = set()
+    pending = [fn]
+    while pending:
+        current = pending.pop()
+        if id(current) in seen:
+            continue
+        seen.add(id(current))
+        try:
+            source = inspect.getsource(current)
+        except (OSError, TypeError):
+            source = f'{current.__module__}.{current.__qualname__}'
+        sha.update(source.encode('utf-8'))
+
+        for name in sorted(_global_names(current.__code__)):
+            value = current.__globals__.get(name)
+            if inspect.isfunction(value):
+                pending.append(value)
+            elif isinstance(value, re.Pattern):
+                sha.update(f'{name}={value.pattern!r}/{value.flags}'.encode('utf-8'))
+            elif isinstance(value, (str, bytes, int, float, tuple, frozenset)):
+                sha.update(f'{name}={value!r}'.encode('utf-8'))
+    return sha.hexdigest()
+
+
+def vectorizer_fingerprint(vectorizer):
+    """Hash of a fitted vectorizer's pickled state (vocabulary, idf weights, parameters)"""
+    return hashlib.sha1(pickle.dumps(vectorizer, protocol=4)).hexdigest()
+
+
+class CachedTexts:
+    """Read-only sequence of cleaned texts backed by a memory-mapped blob"""
+
+    def __init__(self, blob, offsets):
+        self._blob = blob
+        self._offsets = offsets
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('text index out of range')
+        start, end = self._offsets[index], self._offsets[index + 1]
+        return bytes(self._blob[start:end]).decode('utf-8')
+
+    def __iter__(self):
+        blob = bytes(self._blob)
+        offsets = self._offsets.tolist()
+        for start, end in zip(offsets, offsets[1:]):
+            yield blob[start:end].decode('utf-8')
+
+    def tolist(self):
+        return list(self)
+
+
+class FeatureStore:
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, verbose=True):
+        self.cache_dir = cache_dir
+        self.verbose = verbose
+
+    def _log(self, message):
+        if self.verbose:
+            print(message)
+
+    def _entry_dir(self, kind, *parts):
+        key = hashlib.sha1('\0'.join(parts).encode('utf-8')).hexdigest()[:20]
+        return os.path.join(self.cache_dir, f'{kind}-{key}')
+
+    def _write_entry(self, entry_dir, arrays, meta):
+        # Build in a scratch directory and rename it into place, so a crash
+        # never leaves a half-written entry behind
+        os.makedirs(self.cache_dir, exist_ok=True)
+        scratch = tempfile.mkdtemp(dir=self.cache_dir, prefix='.tmp-')
+        try:
+            for name, array in arrays.items():
+                np.save(os.path.join(scratch, f'{name}.npy'), array, allow_pickle=False)
+            with open(os.path.join(scratch, 'meta.json'), 'w') as f:
+                json.dump(meta, f, indent=2)
+            os.replace(scratch, entry_dir)
+        except OSError:
+            shutil.rmtree(scratch, ignore_errors=True)
+            if not os.path.isdir(entry_dir):
+                raise
+
+    @staticmethod
+    def _load(entry_dir, name):
+        return np.load(os.path.join(entry_dir, f'{name}.npy'), mmap_mode='r', allow_pickle=False)
+
+    def cleaned_texts(self, csv_path, clean_fn, text_column='text', label_column='sentiment'):
+        """
+        Cleaned texts and labels of a CSV, rows with missing values dropped
+        (the ``dropna`` + ``apply(clean_fn)`` the scripts used to repeat)
+        """
+        entry_dir = self._entry_dir(
+            'texts', file_fingerprint(csv_path), function_fingerprint(clean_fn), text_column, label_column
+        )
+        if not os.path.isdir(entry_dir):
+            import pandas as pd
+
+            self._log(f'🧹 Cleaning {csv_path} (not cached yet)...')
+            data = pd.read_csv(csv_path).dropna()
+            encoded = [clean_fn(text).encode('utf-8') for text in data[text_column]]
+            offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+            np.cumsum([len(text) for text in encoded], out=offsets[1:])
+            self._write_entry(
+                entry_dir,
+                {
+                    'text_blob': np.frombuffer(b''.join(encoded), dtype=np.uint8),
+                    'text_offsets': offsets,
+                    'labels': data[label_column].to_numpy(dtype=str),
+                },
+                {'source': os.path.abspath(csv_path), 'rows': len(encoded)},
+            )
+        else:
+            self._log(f'⚡ Using cached cleaned text for {csv_path}')
+
+        texts = CachedTexts(self._load(entry_dir, 'text_blob'), self._load(entry_dir, 'text_offsets'))
+        return texts, self._load(entry_dir, 'labels')
+
+    def features(self, csv_path, clean_fn, vectorizer, text_column='text', label_column='sentiment'):
+        """Vectorized (CSR matrix) cleaned texts of a CSV, plus their labels"""
+        from scipy.sparse import csr_matrix
+
+        texts, labels = self.cleaned_texts(csv_path, clean_fn, text_column, label_column)
+        entry_dir = self._entry_dir(
+            'features', file_fingerprint(csv_path), function_fingerprint(clean_fn),
+            vectorizer_fingerprint(vectorizer), text_column, label_column
+        )
+        if not os.path.isdir(entry_dir):
+            self._log(f'🔢 Vectorizing {csv_path} (not cached yet)...')
+            matrix = vectorizer.transform(texts.tolist()).tocsr()
+            self._write_entry(
+                entry_dir,
+                {'data': matrix.data, 'indices': matrix.indices, 'indptr': matrix.indptr},
+                {'source': os.path.abspath(csv_path), 'shape': list(matrix.shape)},
+            )
+        else:
+            self._log(f'⚡ Using cached features for {csv_path}')
+
+        with open(os.path.join(entry_dir, 'meta.json')) as f:
+            shape = tuple(json.load(f)['shape'])
+        matrix = csr_matrix(
+            (self._load(entry_dir, 'data'), self._load(entry_dir, 'indices'), self._load(entry_dir, 'indptr')),
+            shape=shape,
+            copy=False,
+        )
+        return matrix, labels
+
+    def clear(self):
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
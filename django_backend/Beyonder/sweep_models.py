@@ -0,0 +1,327 @@
+"""
+Parallel hyperparameter sweep for the NB and SVC sentiment models.
+
+Grid or random search over vectorizer settings (vocabulary cutoffs, TF-IDF
+options) and classifier settings (NB smoothing, SVC C/kernel), scored with
+stratified k-fold cross-validation on the cleaned training set from the
+feature store. Work is split into (vectorizer settings, fold) tasks spread
+over all cores; each task vectorizes its fold once and fits every classifier
+setting that shares it.
+
+For every configuration the sweep records cross-validated accuracy, pickled
+model size and a screening latency (single-message p50/p99 and batch
+throughput, timed inside the busy worker pool, so only comparable with each
+other), and marks the configurations on the accuracy/latency frontier. Once
+the pool has shut down, the frontier configurations are refitted one at a
+time on the full training set (even with ``--sample``) for held-out test
+accuracy, and timed with nothing else running; those are the latencies to
+quote.
+
+    python sweep_models.py --model svc --search random --n-iter 12
+    python sweep_models.py --model nb --folds 5
+
+Note: the NB sweep uses scikit-learn's MultinomialNB, the vectorized
+equivalent of the from-scratch classifier in nb_classifier.py (add-alpha
+smoothing; words outside the vocabulary are ignored).
+"""
+
+import argparse
+import itertools
+import json
+import os
+import pickle
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from evaluate_models import clean_text
+from feature_store import FeatureStore
+
+TRAIN_PATH = 'processed_train_data.csv'
+TEST_PATH = 'processed_test_data.csv'
+
+# Vectorizer parameters first, classifier parameters second
+GRIDS = {
+    'nb': {
+        'vectorizer': {
+            'min_df': [1, 2, 5],
+            'max_features': [None, 20000, 5000],
+            'ngram_range': [(1, 1), (1, 2)],
+        },
+        'classifier': {
+            'alpha': [0.1, 0.5, 1.0, 2.0],
+        },
+    },
+    'svc': {
+        'vectorizer': {
+            'min_df': [1, 2],
+            'max_features': [None, 20000],
+            'ngram_range': [(1, 1), (1, 2)],
+            'sublinear_tf': [False, True],
+        },
+        'classifier': {
+            'C': [0.1, 1.0, 10.0],
+            'kernel': ['linear', 'rbf'],
+        },
+    },
+}
+
+# Messages timed one at a time for the latency percentiles
+LATENCY_SAMPLES = 200
+
+_worker = {}
+
+
+def expand(grid):
+    keys = sorted(grid)
+    return [dict(zip(keys, values)) for values in itertools.product(*(grid[key] for key in keys))]
+
+
+def make_vectorizer(model, params):
+    from sklearn.feature_extraction.text import CountVectorizer, TfidfVectorizer
+    if model == 'nb':
+        return CountVectorizer(**params)
+    return TfidfVectorizer(**params)
+
+
+def make_classifier(model, params):
+    if model == 'nb':
+        from sklearn.naive_bayes import MultinomialNB
+        return MultinomialNB(**params)
+    from sklearn.svm import SVC
+    return SVC(**params)
+
+
+def config_id(vectorizer_params, classifier_params):
+    return json.dumps({'vectorizer': vectorizer_params, 'classifier': classifier_params}, sort_keys=True)
+
+
+def measure(vectorizer, classifier, texts):
+    """Model size, single-message latency and batch throughput of a fitted model"""
+    size = len(pickle.dumps((vectorizer, classifier), protocol=4))
+
+    latencies = []
+    for text in texts[:LATENCY_SAMPLES]:
+        started = time.perf_counter()
+        classifier.predict(vectorizer.transform([text]))
+        latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    classifier.predict(vectorizer.transform(texts))
+    elapsed = time.perf_counter() - started
+
+    return {
+        'model_size_bytes': size,
+        'p50_ms': float(np.percentile(latencies, 50) * 1000),
+        'p99_ms': float(np.percentile(latencies, 99) * 1000),
+        'throughput_per_s': len(texts) / elapsed if elapsed else 0.0,
+    }
+
+
+def _init_worker(model, folds, seed, sample):
+    from sklearn.model_selection import StratifiedKFold
+
+    texts, labels = FeatureStore(verbose=False).cleaned_texts(TRAIN_PATH, clean_text)
+    texts, labels = texts.tolist(), np.asarray(labels)
+    if sample and sample < len(texts):
+        keep = np.sort(np.random.default_rng(seed).choice(len(texts), sample, replace=False))
+        texts, labels = [texts[i] for i in keep], labels[keep]
+
+    _worker['model'] = model
+    _worker['texts'] = texts
+    _worker['labels'] = labels
+    _worker['splits'] = list(StratifiedKFold(folds, shuffle=True, random_state=seed).split(texts, labels))
+
+
+def run_fold(vectorizer_params, classifier_grid, fold):
+    """Fit every classifier setting on one fold of one vectorizer setting"""
+    from sklearn.metrics import accuracy_score
+
+    model, texts, labels = _worker['model'], _worker['texts'], _worker['labels']
+    train_index, valid_index = _worker['splits'][fold]
+    train_texts = [texts[i] for i in train_index]
+    valid_texts = [texts[i] for i in valid_index]
+
+    vectorizer = make_vectorizer(model, vectorizer_params)
+    X_train = vectorizer.fit_transform(train_texts)
+    X_valid = vectorizer.transform(valid_texts)
+
+    results = []
+    for classifier_params in classifier_grid:
+        classifier = make_classifier(model, classifier_params)
+        started = time.perf_counter()
+        classifier.fit(X_train, labels[train_index])
+        fit_seconds = time.perf_counter() - started
+
+        accuracy = accuracy_score(labels[valid_index], classifier.predict(X_valid))
+        result = {
+            'config': config_id(vectorizer_params, classifier_params),
+            'fold': fold,
+            'accuracy': float(accuracy),
+            'fit_seconds': fit_seconds,
+        }
+        result.update(measure(vectorizer, classifier, valid_texts))
+        results.append(result)
+    return results
+
+
+def refit_on_full_train(model, config, train, test):
+    """
+    Fit a configuration on the whole training set, score it on the test set
+    and time it. Runs in the main process after the sweep, so the timing is
+    not skewed by other fits.
+    """
+    from sklearn.metrics import accuracy_score
+
+    params = json.loads(config)
+    vectorizer = make_vectorizer(model, {
+        key: tuple(value) if isinstance(value, list) else value
+        for key, value in params['vectorizer'].items()
+    })
+    classifier = make_classifier(model, params['classifier'])
+    classifier.fit(vectorizer.fit_transform(train[0]), train[1])
+
+    accuracy = accuracy_score(test[1], classifier.predict(vectorizer.transform(test[0])))
+    return float(accuracy), measure(vectorizer, classifier, test[0])
+
+
+def pareto_frontier(configs):
+    """Configurations no other configuration beats on both accuracy and screening p50 latency"""
+    frontier = []
+    for config in configs:
+        dominated = any(
+            other['cv_accuracy'] >= config['cv_accuracy'] and other['screen_p50_ms'] <= config['screen_p50_ms']
+            and (other['cv_accuracy'] > config['cv_accuracy'] or other['screen_p50_ms'] < config['screen_p50_ms'])
+            for other in configs
+        )
+        if not dominated:
+            frontier.append(config['config'])
+    return frontier
+
+
+def summarize(fold_results):
+    by_config = {}
+    for result in fold_results:
+        by_config.setdefault(result['config'], []).append(result)
+
+    summary = []
+    for config, results in by_config.items():
+        summary.append({
+            'config': config,
+            'params': json.loads(config),
+            'cv_accuracy': round(float(np.mean([r['accuracy'] for r in results])) * 100, 2),
+            'cv_accuracy_std': round(float(np.std([r['accuracy'] for r in results])) * 100, 2),
+            'fit_seconds': round(float(np.mean([r['fit_seconds'] for r in results])), 3),
+            'model_size_bytes': int(np.mean([r['model_size_bytes'] for r in results])),
+            # Timed in the busy pool: for ranking configurations only
+            'screen_p50_ms': round(float(np.median([r['p50_ms'] for r in results])), 4),
+            'screen_p99_ms': round(float(np.median([r['p99_ms'] for r in results])), 4),
+            'screen_throughput_per_s': round(float(np.mean([r['throughput_per_s'] for r in results])), 1),
+        })
+    summary.sort(key=lambda c: -c['cv_accuracy'])
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--model', choices=sorted(GRIDS), default='svc')
+    parser.add_argument('--search', choices=['grid', 'random'], default='grid')
+    parser.add_argument('--n-iter', type=int, default=10, help='Configurations tried by a random search')
+    parser.add_argument('--folds', type=int, default=3)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--sample', type=int, default=None,
+                        help='Sweep on a random subset of this many training rows')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--no-refit', action='store_true',
+                        help='Skip refitting frontier configurations on the full training set')
+    parser.add_argument('--output', default=None, help='Default: sweep_<model>.json')
+    args = parser.parse_args()
+
+    grid = GRIDS[args.model]
+    vectorizer_grid = expand(grid['vectorizer'])
+    classifier_grid = expand(grid['classifier'])
+
+    # Random search samples whole configurations, then groups them by
+    # vectorizer settings so each fold is still vectorized only once
+    plan = {}
+    if args.search == 'random':
+        space = list(itertools.product(range(len(vectorizer_grid)), range(len(classifier_grid))))
+        chosen = random.Random(args.seed).sample(space, min(args.n_iter, len(space)))
+        for v, c in chosen:
+            plan.setdefault(v, []).append(classifier_grid[c])
+    else:
+        plan = {v: classifier_grid for v in range(len(vectorizer_grid))}
+
+    # Make sure the cleaned text is cached before the workers open it
+    FeatureStore().cleaned_texts(TRAIN_PATH, clean_text)
+    FeatureStore().cleaned_texts(TEST_PATH, clean_text)
+
+    n_configs = sum(len(c) for c in plan.values())
+    print(f"🔍 Sweeping {n_configs} {args.model.upper()} configurations × {args.folds} folds "
+          f"on {args.workers} workers")
+
+    started = time.perf_counter()
+    fold_results = []
+    with ProcessPoolExecutor(args.workers, initializer=_init_worker,
+                             initargs=(args.model, args.folds, args.seed, args.sample)) as pool:
+        futures = [
+            pool.submit(run_fold, vectorizer_grid[v], classifiers, fold)
+            for v, classifiers in plan.items()
+            for fold in range(args.folds)
+        ]
+        for done, future in enumerate(futures, 1):
+            fold_results.extend(future.result())
+            print(f"   {done}/{len(futures)} tasks done ({time.perf_counter() - started:.0f}s)")
+
+    configs = summarize(fold_results)
+    frontier = pareto_frontier(configs)
+    for config in configs:
+        config['on_frontier'] = config['config'] in frontier
+
+    if not args.no_refit:
+        print(f"🏁 Refitting and timing {len(frontier)} frontier configurations on the full training set, "
+              f"one at a time")
+        train_texts, train_labels = FeatureStore(verbose=False).cleaned_texts(TRAIN_PATH, clean_text)
+        test_texts, test_labels = FeatureStore(verbose=False).cleaned_texts(TEST_PATH, clean_text)
+        train = (train_texts.tolist(), np.asarray(train_labels))
+        test = (test_texts.tolist(), np.asarray(test_labels))
+        by_config = {config['config']: config for config in configs}
+        for config in frontier:
+            accuracy, measured = refit_on_full_train(args.model, config, train, test)
+            by_config[config]['test_accuracy'] = round(accuracy * 100, 2)
+            by_config[config]['full_model'] = {key: round(value, 4) for key, value in measured.items()}
+
+    output = args.output or f'sweep_{args.model}.json'
+    with open(output, 'w') as f:
+        json.dump({
+            'model': args.model,
+            'search': args.search,
+            'folds': args.folds,
+            'sample': args.sample,
+            'seconds': round(time.perf_counter() - started, 1),
+            'configurations': [{k: v for k, v in c.items() if k != 'config'} for c in configs],
+        }, f, indent=2)
+
+    print(f"\n📊 {'CV acc':>7} {'p50 ms':>8} {'p99 ms':>8} {'msg/s':>9} {'size KB':>9}  params")
+    for config in configs:
+        marker = '⭐' if config['on_frontier'] else '  '
+        # Serial timings of the full-training-set model where there is one
+        full = config.get('full_model')
+        p50, p99, throughput = (
+            (full['p50_ms'], full['p99_ms'], full['throughput_per_s']) if full else
+            (config['screen_p50_ms'], config['screen_p99_ms'], config['screen_throughput_per_s'])
+        )
+        print(f"{marker} {config['cv_accuracy']:>6}% {p50:>8.3f} {p99:>8.3f} "
+              f"{throughput:>9.0f} {config['model_size_bytes'] / 1024:>9.0f}  "
+              f"{json.dumps(config['params'], sort_keys=True)}")
+    print(f"\n✅ Results saved to {output} (⭐ = accuracy/latency frontier; its latencies are timed serially "
+          f"on the full-training-set model, the others' in the busy worker pool)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,198 @@
+"""
+Out-of-core retraining of the SVC sentiment model on hashed features.
+
+svm-72.ipynb fits a TF-IDF vocabulary and an SVC on the whole corpus in
+memory, and the pickle grows with the vocabulary. This script streams the
+training data instead:
+
+- CSV or JSONL files are read ``--chunk-size`` rows at a time;
+- texts are cleaned with the training-time ``clean_text`` and hashed into a
+  fixed ``2 ** --hash-bits`` feature space by a stateless HashingVectorizer,
+  so no vocabulary is ever built;
+- a linear SVM (SGDClassifier, hinge loss) is trained incrementally with
+  ``partial_fit``, over ``--epochs`` passes of the data.
+
+Rows go through a shuffle buffer of ``--shuffle-buffer`` rows, so files
+sorted by label still train well. Memory is bounded by the buffer and the
+weights, and the pickle is always ``classes x 2 ** hash_bits`` weights,
+however large the corpus is.
+
+The model is scored on processed_test_data.csv, next to the current SVC's
+accuracy from model_performance.json. It is saved in the serving format,
+a ``(vectorizer, classifier)`` pair, so it can be trialled as a shadow
+candidate (SENTIMENT_SHADOW_CANDIDATES) before it replaces svm_classifier.pkl.
+
+    python train_hashed_svc.py processed_train_data.csv
+    python train_hashed_svc.py messages-*.jsonl --epochs 3 --output svm_hashed_classifier.pkl
+"""
+
+import argparse
+import json
+import os
+import pickle
+import resource
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from evaluate_models import clean_text
+from feature_store import FeatureStore
+
+BEYONDER_DIR = os.path.dirname(os.path.abspath(__file__))
+TEST_PATH = os.path.join(BEYONDER_DIR, 'processed_test_data.csv')
+PERFORMANCE_PATH = os.path.join(BEYONDER_DIR, 'model_performance.json')
+OUTPUT_PATH = os.path.join(BEYONDER_DIR, 'svm_hashed_classifier.pkl')
+CLASSES = ['negative', 'neutral', 'positive']
+
+
+def read_chunks(path, chunk_size, text_column, label_column):
+    """``(texts, labels)`` lists of up to ``chunk_size`` labelled rows of a CSV or JSONL file"""
+    if path.endswith(('.jsonl', '.ndjson', '.json')):
+        texts, labels = [], []
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                row = json.loads(line)
+                text, label = row.get(text_column), row.get(label_column)
+                if not isinstance(text, str) or label is None:
+                    continue
+                texts.append(text)
+                labels.append(str(label))
+                if len(texts) == chunk_size:
+                    yield texts, labels
+                    texts, labels = [], []
+        if texts:
+            yield texts, labels
+        return
+
+    for chunk in pd.read_csv(path, usecols=[text_column, label_column], chunksize=chunk_size):
+        chunk = chunk.dropna()
+        if len(chunk):
+            yield chunk[text_column].astype(str).tolist(), chunk[label_column].astype(str).tolist()
+
+
+def shuffled_batches(paths, args, rng):
+    """Cleaned ``(texts, labels)`` batches of ``chunk_size`` rows, shuffled within the buffer"""
+    texts, labels = [], []
+
+    def drain():
+        order = rng.permutation(len(texts))
+        for start in range(0, len(order), args.chunk_size):
+            batch = order[start:start + args.chunk_size]
+            yield [texts[i] for i in batch], [labels[i] for i in batch]
+
+    for path in paths:
+        for chunk_texts, chunk_labels in read_chunks(path, args.chunk_size, args.text_column, args.label_column):
+            texts.extend(clean_text(text) for text in chunk_texts)
+            labels.extend(chunk_labels)
+            if len(texts) >= args.shuffle_buffer:
+                yield from drain()
+                texts, labels = [], []
+    if texts:
+        yield from drain()
+
+
+def peak_memory_mb():
+    # ru_maxrss is in KB on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def train(paths, args):
+    from sklearn.feature_extraction.text import HashingVectorizer
+    from sklearn.linear_model import SGDClassifier
+
+    vectorizer = HashingVectorizer(
+        n_features=2 ** args.hash_bits,
+        ngram_range=(1, args.max_ngram),
+        alternate_sign=False,
+    )
+    classifier = SGDClassifier(loss='hinge', alpha=args.alpha, random_state=args.seed)
+    classes = np.array(args.classes)
+    known = set(args.classes)
+    rng = np.random.default_rng(args.seed)
+
+    for epoch in range(1, args.epochs + 1):
+        started = time.perf_counter()
+        rows = skipped = 0
+        for texts, labels in shuffled_batches(paths, args, rng):
+            keep = [i for i, label in enumerate(labels) if label in known]
+            skipped += len(labels) - len(keep)
+            if not keep:
+                continue
+            classifier.partial_fit(
+                vectorizer.transform([texts[i] for i in keep]),
+                np.array([labels[i] for i in keep]),
+                classes=classes,
+            )
+            rows += len(keep)
+        if not rows:
+            raise SystemExit(f"❌ No rows labelled {', '.join(args.classes)} in {', '.join(paths)}")
+        print(f"   epoch {epoch}/{args.epochs}: {rows:,} rows in {time.perf_counter() - started:.1f}s"
+              + (f" ({skipped:,} with other labels skipped)" if skipped else "")
+              + f", peak memory {peak_memory_mb()} MB")
+    return vectorizer, classifier
+
+
+def evaluate(vectorizer, classifier):
+    from sklearn.metrics import accuracy_score, f1_score, precision_score, recall_score
+
+    texts, labels = FeatureStore(verbose=False).cleaned_texts(TEST_PATH, clean_text)
+    labels = np.asarray(labels)
+    predictions = classifier.predict(vectorizer.transform(texts.tolist()))
+    return {
+        'test_samples': len(labels),
+        'accuracy': round(accuracy_score(labels, predictions) * 100, 1),
+        'precision': round(precision_score(labels, predictions, average='weighted', zero_division=0) * 100, 1),
+        'recall': round(recall_score(labels, predictions, average='weighted', zero_division=0) * 100, 1),
+        'f1_score': round(f1_score(labels, predictions, average='weighted', zero_division=0) * 100, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('inputs', nargs='+', help='Training CSV or JSONL files')
+    parser.add_argument('--text-column', default='text')
+    parser.add_argument('--label-column', default='sentiment')
+    parser.add_argument('--classes', nargs='+', default=CLASSES, help='Labels trained on; other rows are skipped')
+    parser.add_argument('--chunk-size', type=int, default=5000, help='Rows read and trained on at a time')
+    parser.add_argument('--shuffle-buffer', type=int, default=50000, help='Rows shuffled together')
+    parser.add_argument('--hash-bits', type=int, default=18, help='Feature space of 2 ** hash-bits dimensions')
+    parser.add_argument('--max-ngram', type=int, default=1, help='Longest word n-gram hashed')
+    parser.add_argument('--alpha', type=float, default=5e-5, help='L2 regularization strength')
+    parser.add_argument('--epochs', type=int, default=8, help='Passes over the training data')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', default=OUTPUT_PATH)
+    args = parser.parse_args()
+
+    print(f"🏋️ Training a hashed linear SVM ({2 ** args.hash_bits:,} features) on {', '.join(args.inputs)}")
+    started = time.perf_counter()
+    vectorizer, classifier = train(args.inputs, args)
+    train_seconds = time.perf_counter() - started
+
+    with open(args.output, 'wb') as f:
+        pickle.dump((vectorizer, classifier), f)
+
+    report = evaluate(vectorizer, classifier)
+    try:
+        with open(PERFORMANCE_PATH) as f:
+            current = json.load(f)['svc']['accuracy']
+    except (OSError, ValueError, KeyError):
+        current = None
+
+    print(f"\n📊 Test accuracy {report['accuracy']}% (precision {report['precision']}%, "
+          f"recall {report['recall']}%, F1 {report['f1_score']}%) on {report['test_samples']} messages")
+    if current is not None:
+        print(f"   Current SVC: {current}% ({report['accuracy'] - current:+.1f} points)")
+    print(f"   Trained in {train_seconds:.1f}s, peak memory {peak_memory_mb()} MB, "
+          f"model {os.path.getsize(args.output) / (1024 * 1024):.1f} MB")
+    print(f"\n✅ Model saved to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
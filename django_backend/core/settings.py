@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -44,6 +45,7 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'corsheaders.middleware.CorsMiddleware',  # <-- must be first
+    'sentiment.profiling.RequestProfilingMiddleware',  # removes itself unless profiling is configured
     'django.middleware.common.CommonMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -128,3 +130,128 @@ STATIC_URL = 'static/'
 #
 # CORS configuration for development
 CORS_ALLOW_ALL_ORIGINS = True
+
+
+# Sentiment service warm-up
+# 'background' loads models in a thread at startup, 'blocking' loads them
+# before the first request is served, 'off' loads them lazily on first use.
+# /ready/ answers 503 until warm-up has finished.
+SENTIMENT_WARMUP = os.environ.get('SENTIMENT_WARMUP', 'background')
+SENTIMENT_WARMUP_MODELS = ['svc', 'nb']
+
+# Per-conversation rollups (/api/sentiment/rollups/<id>/)
+SENTIMENT_ROLLUP_MAX_KEYS = 10000
+SENTIMENT_ROLLUP_IDLE_SECONDS = 24 * 60 * 60
+SENTIMENT_ROLLUP_BUCKET_SECONDS = 60 * 60
+SENTIMENT_ROLLUP_BUCKETS = 24
+SENTIMENT_ROLLUP_EWMA_ALPHA = 0.1
+# Reads need `X-Rollup-Token: <ROLLUP_TOKEN>`, sent by the chat backend after
+# checking the caller may see the conversation; unset, rollups are not served
+SENTIMENT_ROLLUP_TOKEN = os.environ.get('SENTIMENT_ROLLUP_TOKEN')
+
+# Near-duplicate verdict reuse for spam/raid floods
+SENTIMENT_NEAR_DUP_MAX_ENTRIES = 50000
+SENTIMENT_NEAR_DUP_TTL_SECONDS = 10 * 60
+SENTIMENT_NEAR_DUP_MIN_SIMILARITY = 0.8
+SENTIMENT_NEAR_DUP_MIN_LENGTH = 24
+# 0 fingerprints nothing, leaving exact (normalized) matches only
+SENTIMENT_NEAR_DUP_MAX_LENGTH = int(os.environ.get('SENTIMENT_NEAR_DUP_MAX_LENGTH', 4096))
+SENTIMENT_NEAR_DUP_FLOOD_HALF_LIFE = 60
+SENTIMENT_NEAR_DUP_FLOOD_THRESHOLD = 50
+
+# Persistent verdict store in DATABASES['default'], shared by all workers
+SENTIMENT_VERDICT_STORE = os.environ.get('SENTIMENT_VERDICT_STORE', 'on') != 'off'
+SENTIMENT_VERDICT_STORE_MAX_ROWS = 200000
+SENTIMENT_VERDICT_STORE_TTL_SECONDS = 7 * 24 * 60 * 60
+SENTIMENT_VERDICT_STORE_FLUSH_INTERVAL = 1.0
+
+# Admission control for the ML models: at most MAX_CONCURRENCY predictions
+# per model at once; up to MAX_QUEUE more wait for QUEUE_TIMEOUT seconds,
+# anything beyond is answered lexicon/keyword-only and flagged `degraded`.
+# Per-model overrides go in SENTIMENT_ADMISSION_MODELS, e.g. {'svc': {'max_concurrency': 2}}
+SENTIMENT_ADMISSION_MAX_CONCURRENCY = 4
+SENTIMENT_ADMISSION_MAX_QUEUE = 16
+SENTIMENT_ADMISSION_QUEUE_TIMEOUT = 0.25
+SENTIMENT_ADMISSION_MODELS = {}
+
+# Deadline handling (X-Request-Deadline, epoch ms): optional stages are
+# skipped when their expected cost (EWMA of recent runs x HEADROOM, seeded
+# with these defaults, in seconds) exceeds the remaining budget
+SENTIMENT_STAGE_COST_DEFAULTS = {'ml_fallback': 0.01, 'toxicity_boost': 0.002}
+SENTIMENT_STAGE_COST_ALPHA = 0.1
+SENTIMENT_STAGE_COST_HEADROOM = 1.5
+
+# Work bounds for very long messages: lexicon and keyword scans stop after
+# MAX_WORDS tokens (the response is flagged `truncated`), at most
+# MAX_EXPLAINED_WORDS words are explained, and the ML models score only the
+# first MAX_MODEL_CHARS characters
+SENTIMENT_MAX_WORDS = 20000
+SENTIMENT_MAX_EXPLAINED_WORDS = 100
+SENTIMENT_MAX_MODEL_CHARS = 2000
+
+# Word scores derived from the NB model (Beyonder/build_lexicon.py), merged
+# under the hand-picked lexicon; None uses the hand-picked lexicon only
+SENTIMENT_EXTENDED_LEXICON = BASE_DIR / 'Beyonder' / 'extended_lexicon.json'
+
+# Per-group moderation lists (PUT /api/sentiment/groups/<group_id>/lists/):
+# compiled matchers are kept in an LRU pool of at most POOL_BYTES, and a
+# cached group's list version is rechecked at most every RECHECK_SECONDS
+SENTIMENT_GROUP_MATCHER_POOL_BYTES = 32 * 1024 * 1024
+SENTIMENT_GROUP_LIST_RECHECK_SECONDS = 5.0
+# Writes (PUT/DELETE) need `X-Moderation-Token: <GROUP_LISTS_TOKEN>`, sent
+# by the chat backend after its group-admin check; unset, lists are read-only
+SENTIMENT_GROUP_LISTS_TOKEN = os.environ.get('SENTIMENT_GROUP_LISTS_TOKEN')
+
+# Trending toxic terms (/api/sentiment/trending/): a ring of BUCKETS time
+# buckets of BUCKET_SECONDS, each with a WIDTH x DEPTH Count-Min sketch and
+# the CAPACITY heaviest terms per category; memory does not grow with traffic
+SENTIMENT_TRENDING_BUCKET_SECONDS = 5 * 60
+SENTIMENT_TRENDING_BUCKETS = 24
+SENTIMENT_TRENDING_SKETCH_WIDTH = 1024
+SENTIMENT_TRENDING_SKETCH_DEPTH = 4
+SENTIMENT_TRENDING_CAPACITY = 64
+
+# Prediction-drift monitor (the `drift` section of /api/sentiment/analytics/):
+# recent distributions decay with HALF_LIFE_SECONDS; words missing from the
+# NB vocabulary are counted for OOV_SAMPLE_RATE of model calls; a path is
+# reported as drifting once it has MIN_OBSERVATIONS and its Jensen-Shannon
+# distance from the test-set baseline reaches ALERT_THRESHOLD
+SENTIMENT_DRIFT_HALF_LIFE_SECONDS = 60 * 60
+SENTIMENT_DRIFT_RESERVOIR_SIZE = 100
+SENTIMENT_DRIFT_OOV_SAMPLE_RATE = 0.1
+SENTIMENT_DRIFT_MIN_OBSERVATIONS = 100
+SENTIMENT_DRIFT_ALERT_THRESHOLD = 0.2
+
+# Shadow evaluation (/api/sentiment/shadow/): candidate pickles, in the
+# serving model's format, keyed by the model they shadow, e.g.
+#   {'svc': BASE_DIR / 'Beyonder' / 'candidates' / 'svm_classifier.pkl'}
+# SAMPLE_RATE of that model's predictions are re-scored by the candidate
+# after the response is sent, in WORKERS low-priority processes that are
+# idled to use CPU_SHARE of one core on average; jobs beyond MAX_QUEUE are dropped
+SENTIMENT_SHADOW_CANDIDATES = {}
+SENTIMENT_SHADOW_SAMPLE_RATE = 0.05
+SENTIMENT_SHADOW_MAX_QUEUE = 256
+SENTIMENT_SHADOW_WORKERS = 1
+SENTIMENT_SHADOW_CPU_SHARE = 0.1
+
+# On-demand request profiling: /api/sentiment/ requests carrying
+# `X-Profile-Request: <PROFILE_TOKEN>` (socket frames: a `profile` field), and
+# PROFILE_SAMPLE_RATE of all others, are stack-sampled every PROFILE_INTERVAL
+# seconds into collapsed-stack files in PROFILE_DIR (newest PROFILE_MAX_FILES
+# kept). No token and a zero rate switch profiling off entirely.
+SENTIMENT_PROFILE_TOKEN = os.environ.get('SENTIMENT_PROFILE_TOKEN')
+SENTIMENT_PROFILE_SAMPLE_RATE = float(os.environ.get('SENTIMENT_PROFILE_SAMPLE_RATE', 0))
+SENTIMENT_PROFILE_INTERVAL = 0.002
+SENTIMENT_PROFILE_DIR = BASE_DIR / 'profiles'
+SENTIMENT_PROFILE_MAX_FILES = 100
+
+# Memory accounting (/api/sentiment/memory/, needs the profiling token):
+# deep sizes of models, lexicons, caches and aggregates, and tracemalloc
+# snapshots, of which the newest MEMORY_MAX_SNAPSHOTS are kept for diffs
+SENTIMENT_MEMORY_MAX_SNAPSHOTS = 4
+
+# EnhancedSentimentAnalyzer.batch_analyze: batches of at least
+# BATCH_PARALLEL_SIZE texts are split across BATCH_WORKERS processes. Every
+# web worker may start that many for one request, so it is opt-in
+SENTIMENT_BATCH_WORKERS = int(os.environ.get('SENTIMENT_BATCH_WORKERS', 1))
+SENTIMENT_BATCH_PARALLEL_SIZE = 20000
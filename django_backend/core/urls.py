@@ -1,9 +1,13 @@
 from django.contrib import admin
 from django.urls import path, include  # ✅ include is required to include app URLs
+from sentiment.readiness import ReadinessAPIView
 
 urlpatterns = [
     path('admin/', admin.site.urls),
 
     # ✅ Include the sentiment app's URL patterns
     path('api/sentiment/', include('sentiment.urls')),
+
+    # Readiness probe for rolling deploys
+    path('ready/', ReadinessAPIView.as_view(), name='ready'),
 ]
@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings')
 
 application = get_wsgi_application()
+
+# Prime models and caches so /ready/ only flips once this worker is warm
+from sentiment.readiness import start_warmup  # noqa: E402
+
+start_warmup()
@@ -0,0 +1,158 @@
+"""
+Admission control for the ML models.
+
+Every model call passes through that model's gate. A gate lets at most
+``max_concurrency`` predictions run at once. Further requests wait, for at
+most ``queue_timeout`` seconds, and only while fewer than ``max_queue`` are
+already waiting. A request that is not admitted is shed. The caller then
+answers from the lexicon analyzer and keyword toxicity alone, and flags the
+response as ``degraded``. During a spike, requests therefore stay fast and
+only lose the ML refinement, instead of every request queueing behind the
+models until the Node side times out.
+
+Gate counters are served at /api/sentiment/admission/.
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.http import JsonResponse
+from django.views import View
+
+from sentiment import model_store
+from sentiment.drift import drift_monitor
+from sentiment.shadow import shadow_evaluator
+
+
+class ModelGate:
+    def __init__(self, name, max_concurrency=4, max_queue=16, queue_timeout=0.25):
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._lock = threading.Lock()
+
+        self.in_flight = 0
+        self.waiting = 0
+        self.peak_waiting = 0
+        self.admitted = 0
+        self.shed_queue_full = 0
+        self.shed_timeout = 0
+        self.last_shed_at = None
+
+    def acquire(self, max_wait=None):
+        """
+        Take a slot, waiting if allowed; False means the request is shed
+
+        ``max_wait`` caps the wait below ``queue_timeout``, e.g. to the
+        request's remaining deadline budget.
+        """
+        if self._slots.acquire(blocking=False):
+            with self._lock:
+                self.in_flight += 1
+                self.admitted += 1
+            return True
+
+        with self._lock:
+            if self.waiting >= self.max_queue:
+                self.shed_queue_full += 1
+                self.last_shed_at = time.time()
+                return False
+            self.waiting += 1
+            self.peak_waiting = max(self.peak_waiting, self.waiting)
+
+        timeout = self.queue_timeout if max_wait is None else max(min(self.queue_timeout, max_wait), 0)
+        admitted = self._slots.acquire(timeout=timeout)
+        with self._lock:
+            self.waiting -= 1
+            if admitted:
+                self.in_flight += 1
+                self.admitted += 1
+            else:
+                self.shed_timeout += 1
+                self.last_shed_at = time.time()
+        return admitted
+
+    def release(self):
+        with self._lock:
+            self.in_flight -= 1
+        self._slots.release()
+
+    @contextmanager
+    def admit(self, max_wait=None):
+        """``with gate.admit() as admitted:`` - run the model only if admitted"""
+        admitted = self.acquire(max_wait)
+        try:
+            yield admitted
+        finally:
+            if admitted:
+                self.release()
+
+    @property
+    def shed(self):
+        return self.shed_queue_full + self.shed_timeout
+
+    def stats(self):
+        total = self.admitted + self.shed
+        return {
+            'max_concurrency': self.max_concurrency,
+            'max_queue': self.max_queue,
+            'queue_timeout': self.queue_timeout,
+            'in_flight': self.in_flight,
+            'waiting': self.waiting,
+            'peak_waiting': self.peak_waiting,
+            'admitted': self.admitted,
+            'shed': self.shed,
+            'shed_queue_full': self.shed_queue_full,
+            'shed_timeout': self.shed_timeout,
+            'shed_rate': round(self.shed / total, 4) if total else 0.0,
+            'last_shed_at': self.last_shed_at,
+        }
+
+
+def _build_gates():
+    defaults = {
+        'max_concurrency': getattr(settings, 'SENTIMENT_ADMISSION_MAX_CONCURRENCY', 4),
+        'max_queue': getattr(settings, 'SENTIMENT_ADMISSION_MAX_QUEUE', 16),
+        'queue_timeout': getattr(settings, 'SENTIMENT_ADMISSION_QUEUE_TIMEOUT', 0.25),
+    }
+    overrides = getattr(settings, 'SENTIMENT_ADMISSION_MODELS', {})
+    return {
+        name: ModelGate(name, **{**defaults, **overrides.get(name, {})})
+        for name in model_store.MODEL_SPECS
+    }
+
+
+gates = _build_gates()
+
+
+def gated_predict(name, text, max_wait=None):
+    """
+    Predict through the model's gate.
+
+    Returns ``(label, True)`` when admitted, or ``(None, False)`` when the
+    request was shed and the caller should degrade.
+    """
+    with gates[name].admit(max_wait) as admitted:
+        if not admitted:
+            return None, False
+        started = time.perf_counter()
+        label = model_store.predict(name, text)
+        seconds = time.perf_counter() - started
+    drift_monitor.observe_model(name, text, label)
+    shadow_evaluator.record(name, text, label, seconds)
+    return label, True
+
+
+class AdmissionStatsAPIView(View):
+    """Admission gate state and load-shed counters per model"""
+
+    def get(self, request):
+        return JsonResponse({
+            'success': True,
+            'data': {name: gate.stats() for name, gate in gates.items()}
+        })
@@ -5,6 +5,9 @@ from django.views import View
 from django.utils.decorators import method_decorator
 from django.views.decorators.csrf import csrf_exempt
 
+from sentiment.drift import drift_monitor
+from sentiment.profiling import PROFILE_HEADER, request_profiler
+
 @method_decorator(csrf_exempt, name='dispatch')
 class ModelAnalyticsAPIView(View):
     """API endpoint to provide model performance analytics"""
@@ -13,6 +16,14 @@ class ModelAnalyticsAPIView(View):
         try:
             # Get the model parameter from the request (for future use)
             model_filter = request.GET.get('model', None)
+            # Reservoir samples of live messages, for labeling; off by default.
+            # They are raw user text, so only internal callers get them
+            include_samples = request.GET.get('drift_samples') in ('1', 'true')
+            if include_samples and not request_profiler.authorized(request.headers.get(PROFILE_HEADER)):
+                return JsonResponse({
+                    'success': False,
+                    'error': f'Drift samples need a valid {PROFILE_HEADER} header'
+                }, status=403)
             
             # Path to the performance JSON file
             performance_file = os.path.join(
@@ -39,6 +50,7 @@ class ModelAnalyticsAPIView(View):
                     'precision': performance_data['naive_bayes']['precision'],
                     'recall': performance_data['naive_bayes']['recall'],
                     'f1_score': performance_data['naive_bayes']['f1_score'],
+                    'runtime': performance_data['naive_bayes'].get('runtime'),
                     'selected': model_filter == 'nb'
                 },
                 'svc': {
@@ -47,6 +59,7 @@ class ModelAnalyticsAPIView(View):
                     'precision': performance_data['svc']['precision'],
                     'recall': performance_data['svc']['recall'],
                     'f1_score': performance_data['svc']['f1_score'],
+                    'runtime': performance_data['svc'].get('runtime'),
                     'selected': model_filter == 'svc'
                 }
             }
@@ -64,7 +77,9 @@ class ModelAnalyticsAPIView(View):
                         'classes': performance_data['dataset_stats']['classes'],
                         'class_distribution': performance_data['dataset_stats']['class_distribution']
                     },
-                    'insights': self.generate_insights(performance_data)
+                    'insights': self.generate_insights(performance_data),
+                    # Live traffic vs the test set behind these numbers
+                    'drift': drift_monitor.report(performance_data.get('drift_baseline'), include_samples)
                 }
             }
             
@@ -153,28 +168,73 @@ class ModelAnalyticsAPIView(View):
                 'color': 'green'
             })
         
-        # Speed vs accuracy insight
-        insights.append({
-            'type': 'speed_accuracy',
-            'title': 'Speed vs Accuracy Trade-off',
-            'message': 'Naive Bayes offers faster training and prediction times, while SVC provides better accuracy for complex patterns.',
-            'color': 'blue'
-        })
+        svc_runtime = performance_data['svc'].get('runtime')
+        nb_runtime = performance_data['naive_bayes'].get('runtime')
         
-        # Recommendation
-        if svc_acc > nb_acc:
+        if not svc_runtime or not nb_runtime:
+            # Older performance files only carry accuracy metrics
             insights.append({
-                'type': 'recommendation',
-                'title': 'Recommendation',
-                'message': 'Use SVC for higher accuracy requirements, or Naive Bayes for faster real-time processing needs.',
-                'color': 'yellow'
+                'type': 'speed_accuracy',
+                'title': 'Speed vs Accuracy Trade-off',
+                'message': 'Latency and throughput have not been measured yet. Re-run Beyonder/evaluate_models.py to compare the models on speed.',
+                'color': 'blue'
             })
-        else:
             insights.append({
                 'type': 'recommendation',
                 'title': 'Recommendation',
-                'message': 'Use Naive Bayes for optimal performance, or SVC when dealing with complex non-linear patterns.',
+                'message': f"Use {'SVC' if svc_acc >= nb_acc else 'Naive Bayes'} for the highest accuracy.",
                 'color': 'yellow'
             })
+            return insights
+        
+        models = {
+            'SVC': (svc_acc, svc_runtime),
+            'Naive Bayes': (nb_acc, nb_runtime),
+        }
+        accurate = 'SVC' if svc_acc >= nb_acc else 'Naive Bayes'
+        fast = min(models, key=lambda name: models[name][1]['p50_ms'])
+        high_throughput = max(models, key=lambda name: models[name][1]['throughput_per_s'])
+        other = {'SVC': 'Naive Bayes', 'Naive Bayes': 'SVC'}
+        
+        fast_p50 = models[fast][1]['p50_ms']
+        slow_p50 = models[other[fast]][1]['p50_ms']
+        speedup = round(slow_p50 / fast_p50, 1) if fast_p50 else 0.0
+        
+        # Speed vs accuracy insight, from the measured runtime
+        message = (
+            f"{fast} answers a single message in {fast_p50:.2f}ms (p50) vs {slow_p50:.2f}ms for "
+            f"{other[fast]}, {speedup}x faster. In batches {high_throughput} sustains "
+            f"{models[high_throughput][1]['throughput_per_s']:.0f} messages/s vs "
+            f"{models[other[high_throughput]][1]['throughput_per_s']:.0f}."
+        )
+        insights.append({
+            'type': 'speed_accuracy',
+            'title': 'Speed vs Accuracy Trade-off',
+            'message': message,
+            'color': 'blue'
+        })
+        
+        # Recommendation
+        accuracy_gap = round(abs(svc_acc - nb_acc), 1)
+        if accurate == fast:
+            message = (
+                f"Use {accurate}: it is both more accurate (+{accuracy_gap}%) and faster per message "
+                f"(p99 {models[accurate][1]['p99_ms']:.2f}ms), and loads in {models[accurate][1]['load_seconds']}s "
+                f"using {models[accurate][1]['memory_mb']} MB."
+            )
+        else:
+            message = (
+                f"Use {accurate} where accuracy matters (+{accuracy_gap}%), or {fast} for real-time chat "
+                f"with a tight latency budget (p99 {models[fast][1]['p99_ms']:.2f}ms vs "
+                f"{models[accurate][1]['p99_ms']:.2f}ms)."
+            )
+            if high_throughput == accurate:
+                message += f" For bulk re-scoring {accurate} is also the faster choice."
+        insights.append({
+            'type': 'recommendation',
+            'title': 'Recommendation',
+            'message': message,
+            'color': 'yellow'
+        })
         
         return insights
\ No newline at end of file
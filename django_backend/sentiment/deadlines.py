@@ -0,0 +1,116 @@
+"""
+Request deadlines and budget checks between analysis stages.
+
+Callers send the moment they will give up as ``X-Request-Deadline``, in Unix
+epoch milliseconds. Pipelined socket frames send it as a ``deadline`` field.
+The views check the remaining budget between stages. A request that has
+already expired is abandoned with a 504. An optional stage (the ML fallback,
+the toxicity sentiment boost) is skipped when its expected cost no longer
+fits the budget, and the response lists it under ``skipped_stages``.
+
+Expected stage costs are learned from the stages' own recent timings, an
+EWMA with headroom, starting from ``SENTIMENT_STAGE_COST_DEFAULTS``.
+"""
+
+import math
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from rest_framework import status
+from rest_framework.response import Response
+
+DEADLINE_HEADER = 'X-Request-Deadline'
+
+
+class DeadlineExceeded(Exception):
+    pass
+
+
+class StageCosts:
+    """EWMA of each stage's duration, used to predict whether it still fits"""
+
+    def __init__(self, defaults, alpha=0.1, headroom=1.5):
+        self.alpha = alpha
+        self.headroom = headroom
+        self._ewma = dict(defaults)
+        self._lock = threading.Lock()
+
+    def estimate(self, stage):
+        return self._ewma.get(stage, 0.0) * self.headroom
+
+    def observe(self, stage, seconds):
+        with self._lock:
+            previous = self._ewma.get(stage)
+            self._ewma[stage] = seconds if previous is None else previous + self.alpha * (seconds - previous)
+
+    def snapshot(self):
+        return {stage: round(seconds * 1000, 3) for stage, seconds in self._ewma.items()}
+
+
+stage_costs = StageCosts(
+    getattr(settings, 'SENTIMENT_STAGE_COST_DEFAULTS', {'ml_fallback': 0.01, 'toxicity_boost': 0.002}),
+    alpha=getattr(settings, 'SENTIMENT_STAGE_COST_ALPHA', 0.1),
+    headroom=getattr(settings, 'SENTIMENT_STAGE_COST_HEADROOM', 1.5),
+)
+
+
+class Deadline:
+    """
+    Time budget of one request; ``Deadline()`` is an unlimited budget.
+
+    ``allows(stage)`` says whether an optional stage still fits, recording it
+    as skipped when it doesn't; ``check()`` raises DeadlineExceeded once the
+    budget is gone.
+    """
+
+    def __init__(self, expires_at=None):
+        self.expires_at = expires_at
+        self.skipped = []
+
+    @classmethod
+    def from_request(cls, request):
+        """The request's deadline; a missing or malformed one (NaN, infinite, not positive) is unlimited"""
+        value = request.headers.get(DEADLINE_HEADER)
+        try:
+            expires_at = float(value) / 1000
+        except (TypeError, ValueError):
+            return cls()
+        if not math.isfinite(expires_at) or expires_at <= 0:
+            return cls()
+        return cls(expires_at)
+
+    def remaining(self):
+        if self.expires_at is None:
+            return float('inf')
+        return self.expires_at - time.time()
+
+    def expired(self):
+        return self.remaining() <= 0
+
+    def check(self):
+        if self.expired():
+            raise DeadlineExceeded()
+
+    def allows(self, stage):
+        if self.remaining() >= stage_costs.estimate(stage):
+            return True
+        self.skipped.append(stage)
+        return False
+
+    @contextmanager
+    def timed(self, stage, record=True):
+        """Time a stage to refine its cost estimate; ``record=False`` skips unrepresentative runs"""
+        started = time.perf_counter()
+        yield
+        if record:
+            stage_costs.observe(stage, time.perf_counter() - started)
+
+
+def deadline_exceeded_response(deadline):
+    print("⏱️ Request deadline passed, abandoning analysis")
+    return Response({
+        'error': 'Deadline exceeded',
+        'skipped_stages': deadline.skipped
+    }, status=status.HTTP_504_GATEWAY_TIMEOUT)
@@ -0,0 +1,230 @@
+"""
+Streaming prediction-drift monitor.
+
+Each analysis path keeps a few fixed-size statistics of its fresh
+predictions:
+
+- lexicon:  sentiment classes and a histogram of lexicon scores
+- nb, svc:  predicted classes and the rate of words missing from the NB
+            vocabulary (sampled, only while the NB model is loaded)
+- toxicity: toxic/clean verdicts and a histogram of toxicity scores
+
+Distributions decay with a half-life, so they describe recent traffic, and
+lifetime counts are kept next to them. Each path also keeps a reservoir
+sample of recent inputs for later labeling. The samples are raw user text,
+so the analytics endpoint only returns them with the internal
+``X-Profile-Request`` token. Memory is constant, and an observation costs a
+few dict and list updates.
+
+The analytics endpoint compares the decayed distributions with the baseline
+that Beyonder/evaluate_models.py measures on the test set, using the
+Jensen-Shannon distance (0 = identical, 1 = disjoint). Verdicts served from
+the caches are not counted again, so a flood of one message doesn't swamp
+the distributions.
+"""
+
+import math
+import random
+import threading
+import time
+
+from django.conf import settings
+
+from sentiment import model_store
+
+SENTIMENT_CLASSES = ('positive', 'negative', 'neutral')
+TOXICITY_CLASSES = ('toxic', 'clean')
+# Score histograms: HISTOGRAM_BINS equal bins over each path's score range
+HISTOGRAM_BINS = 20
+SCORE_RANGES = {'lexicon': (-1.0, 1.0), 'toxicity': (0.0, 1.0)}
+# Characters of each sampled message kept in the reservoir
+SAMPLE_CHARS = 280
+
+
+def histogram_bin(value, low, high, bins=HISTOGRAM_BINS):
+    position = int((value - low) / (high - low) * bins)
+    return min(max(position, 0), bins - 1)
+
+
+def js_distance(observed, expected):
+    """Jensen-Shannon distance (base 2) between two count vectors"""
+    observed_total, expected_total = sum(observed), sum(expected)
+    if not observed_total or not expected_total:
+        return None
+    divergence = 0.0
+    for o, e in zip(observed, expected):
+        p, q = o / observed_total, e / expected_total
+        m = (p + q) / 2
+        if p:
+            divergence += p * math.log2(p / m) / 2
+        if q:
+            divergence += q * math.log2(q / m) / 2
+    return round(math.sqrt(max(divergence, 0.0)), 4)
+
+
+class PathStats:
+    """Decayed and lifetime statistics of one analysis path"""
+
+    def __init__(self, classes, score_range=None, half_life=3600.0, reservoir_size=100):
+        self.classes = classes
+        self.score_range = score_range
+        self.half_life = half_life
+        self.reservoir_size = reservoir_size
+
+        self.class_counts = dict.fromkeys(classes, 0)
+        self.recent_classes = dict.fromkeys(classes, 0.0)
+        self.histogram = [0.0] * HISTOGRAM_BINS if score_range else None
+        self.oov_words = 0.0
+        self.words = 0.0
+        self.observed = 0
+        self.reservoir = []
+        self.decayed_at = time.time()
+
+    def _decay(self, now):
+        # Decay at most once a second, so observations stay O(1) in practice
+        elapsed = now - self.decayed_at
+        if elapsed < 1.0:
+            return
+        factor = 0.5 ** (elapsed / self.half_life)
+        for label in self.recent_classes:
+            self.recent_classes[label] *= factor
+        if self.histogram is not None:
+            self.histogram = [count * factor for count in self.histogram]
+        self.oov_words *= factor
+        self.words *= factor
+        self.decayed_at = now
+
+    def observe(self, label, text, score=None, oov=None, now=None):
+        """``oov`` is ``(missing words, words)`` when it was measured"""
+        now = time.time() if now is None else now
+        self._decay(now)
+        self.observed += 1
+        if label in self.class_counts:
+            self.class_counts[label] += 1
+            self.recent_classes[label] += 1
+        if score is not None and self.histogram is not None:
+            self.histogram[histogram_bin(score, *self.score_range)] += 1
+        if oov is not None:
+            self.oov_words += oov[0]
+            self.words += oov[1]
+
+        # Algorithm R: every observation so far is in the sample with equal probability
+        sample = {'text': text[:SAMPLE_CHARS], 'label': label, 'score': score, 'at': round(now, 3)}
+        if len(self.reservoir) < self.reservoir_size:
+            self.reservoir.append(sample)
+        else:
+            slot = random.randrange(self.observed)
+            if slot < self.reservoir_size:
+                self.reservoir[slot] = sample
+
+    def report(self, baseline=None, include_samples=False):
+        recent_total = sum(self.recent_classes.values())
+        report = {
+            'observed': self.observed,
+            'class_counts': dict(self.class_counts),
+            'recent_distribution': {
+                label: round(count / recent_total, 4) if recent_total else None
+                for label, count in self.recent_classes.items()
+            },
+        }
+        if self.histogram is not None:
+            report['score_histogram'] = {
+                'range': list(self.score_range),
+                'counts': [round(count, 2) for count in self.histogram],
+            }
+        if self.words:
+            report['oov_rate'] = round(self.oov_words / self.words, 4)
+
+        divergence = {}
+        if baseline:
+            if baseline.get('classes'):
+                divergence['classes'] = js_distance(
+                    [self.recent_classes[label] for label in self.classes],
+                    [baseline['classes'].get(label, 0) for label in self.classes],
+                )
+            if self.histogram is not None and len(baseline.get('score_histogram') or ()) == HISTOGRAM_BINS:
+                divergence['scores'] = js_distance(self.histogram, baseline['score_histogram'])
+            if self.words and baseline.get('oov_rate') is not None:
+                divergence['oov_rate_change'] = round(report['oov_rate'] - baseline['oov_rate'], 4)
+        report['divergence'] = divergence
+        scores = [value for key, value in divergence.items() if key != 'oov_rate_change' and value is not None]
+        report['drift_score'] = max(scores) if scores else None
+        if include_samples:
+            report['samples'] = list(self.reservoir)
+        return report
+
+
+class DriftMonitor:
+    def __init__(self, half_life=3600.0, reservoir_size=100, oov_sample_rate=0.1, min_observations=100,
+                 alert_threshold=0.2):
+        self.oov_sample_rate = oov_sample_rate
+        self.min_observations = min_observations
+        self.alert_threshold = alert_threshold
+        self._lock = threading.Lock()
+
+        def stats(classes, score_range=None):
+            return PathStats(classes, score_range, half_life, reservoir_size)
+
+        self.paths = {
+            'lexicon': stats(SENTIMENT_CLASSES, SCORE_RANGES['lexicon']),
+            'nb': stats(SENTIMENT_CLASSES),
+            'svc': stats(SENTIMENT_CLASSES),
+            'toxicity': stats(TOXICITY_CLASSES, SCORE_RANGES['toxicity']),
+        }
+
+    def oov_counts(self, text):
+        """``(missing words, words)`` of ``text`` against the NB vocabulary, for a sample of calls"""
+        if random.random() >= self.oov_sample_rate or not model_store.is_loaded('nb'):
+            return None
+        words = text.split()  # NB's own tokenization
+        vocab = model_store.get_model('nb').vocab
+        return sum(word not in vocab for word in words), len(words)
+
+    def observe_lexicon(self, text, result):
+        with self._lock:
+            self.paths['lexicon'].observe(result['sentiment'], text, score=result['score'])
+
+    def observe_model(self, name, text, label):
+        """A prediction of the ``nb`` or ``svc`` model on its (truncated) input"""
+        oov = self.oov_counts(text)
+        with self._lock:
+            self.paths[name].observe(label, text, oov=oov)
+
+    def observe_toxicity(self, text, result):
+        with self._lock:
+            self.paths['toxicity'].observe(
+                'toxic' if result['isToxic'] else 'clean', text, score=result['toxicityScore']
+            )
+
+    def report(self, baseline=None, include_samples=False):
+        """
+        Per-path statistics and their divergence from ``baseline`` (the
+        ``drift_baseline`` section of model_performance.json)
+        """
+        baseline = baseline or {}
+        with self._lock:
+            paths = {
+                name: stats.report(baseline.get(name), include_samples)
+                for name, stats in self.paths.items()
+            }
+        drifting = [
+            name for name, path in paths.items()
+            if path['drift_score'] is not None and path['observed'] >= self.min_observations
+            and path['drift_score'] >= self.alert_threshold
+        ]
+        return {
+            'paths': paths,
+            'baseline': 'test set' if baseline else None,
+            'alert_threshold': self.alert_threshold,
+            'min_observations': self.min_observations,
+            'drifting': drifting,
+        }
+
+
+drift_monitor = DriftMonitor(
+    half_life=getattr(settings, 'SENTIMENT_DRIFT_HALF_LIFE_SECONDS', 3600.0),
+    reservoir_size=getattr(settings, 'SENTIMENT_DRIFT_RESERVOIR_SIZE', 100),
+    oov_sample_rate=getattr(settings, 'SENTIMENT_DRIFT_OOV_SAMPLE_RATE', 0.1),
+    min_observations=getattr(settings, 'SENTIMENT_DRIFT_MIN_OBSERVATIONS', 100),
+    alert_threshold=getattr(settings, 'SENTIMENT_DRIFT_ALERT_THRESHOLD', 0.2),
+)
@@ -1,16 +1,79 @@
 # Enhanced sentiment analysis with negation handling for Django backend
 # Add this to django_backend/sentiment/enhanced_sentiment.py
 
+import json
 import re
-from typing import Dict, List, Tuple, Optional
+from collections import deque
+from itertools import chain, islice, repeat
+from typing import Dict, Iterator, List, Tuple, Optional
+
+# Tokens as produced by preprocess_text: runs of word characters and apostrophes
+LEXICON_TOKEN = re.compile(r"[\w']+")
+# Tokens without apostrophes, as used by the keyword toxicity check
+WORD_TOKEN = re.compile(r"\w+")
+_WHITESPACE = re.compile(r"\s")
+
+# Characters lowercased and tokenized at a time by iter_tokens
+CHUNK_SIZE = 8192
+
+
+def iter_tokens(text: str, token_pattern=LEXICON_TOKEN, chunk_size: int = CHUNK_SIZE) -> Iterator[str]:
+    """
+    Lowercased tokens of ``text``, produced lazily chunk by chunk
+
+    Chunks end on whitespace, so no token straddles two chunks and the
+    tokens are exactly those of lowercasing and splitting the whole text.
+    """
+    start, length = 0, len(text)
+    while start < length:
+        end = min(start + chunk_size, length)
+        if end < length:
+            match = _WHITESPACE.search(text, end)
+            end = match.start() if match else length
+        for match in token_pattern.finditer(text[start:end].lower()):
+            yield match.group()
+        start = end
+
+
+def load_extended_lexicon(path: str) -> Tuple[Dict[str, float], str]:
+    """Word scores and version of a lexicon built by Beyonder/build_lexicon.py"""
+    with open(path, encoding='utf-8') as f:
+        data = json.load(f)
+    return data['words'], data['version']
+
 
 class EnhancedSentimentAnalyzer:
     """
     Enhanced sentiment analyzer that handles negation and context
     to improve accuracy over basic word-level models
+
+    Text is scanned as a token stream, so cost is bounded by ``max_words``
+    (tokens scanned per text) and ``max_explained`` (``word_analysis``
+    entries kept) however long the input is.
+
+    ``extended_lexicon`` adds derived word scores (see load_extended_lexicon);
+    the hand-picked scores below take precedence over them.
+
+    ``batch_analyze`` splits batches of at least ``parallel_batch_size`` texts
+    across ``batch_workers`` processes.
     """
     
-    def __init__(self):
+    # Longest look-back of find_negation_context / find_intensity_modifier
+    CONTEXT_WINDOW = 3
+    # Look-back of find_intensity_modifier
+    INTENSITY_WINDOW = 2
+    
+    def __init__(self, max_words: int = 20000, max_explained: int = 100,
+                 extended_lexicon: Optional[Dict[str, float]] = None, lexicon_version: Optional[str] = None,
+                 batch_workers: int = 1, parallel_batch_size: int = 20000):
+        self.max_words = max_words
+        self.max_explained = max_explained
+        self.lexicon_version = lexicon_version
+        self.batch_workers = batch_workers
+        self.parallel_batch_size = parallel_batch_size
+        # Lexicon arrays for batch_analyze, built on its first call
+        self._batch_tables = None
+        
         # Negation words that flip sentiment
         self.negation_words = {
             "not", "never", "no", "none", "nobody", "nothing", "neither", "nowhere",
@@ -38,6 +101,8 @@ class EnhancedSentimentAnalyzer:
             "pretty": 1.2,
             "fairly": 1.1
         }
+        # Single words that make up multi-word intensifiers such as "a bit"
+        self.intensifier_parts = {part for phrase in self.intensifiers for part in phrase.split()}
         
         # Enhanced word sentiment scores (-1 to +1)
         self.word_sentiments = {
@@ -59,6 +124,8 @@ class EnhancedSentimentAnalyzer:
             "pathetic": -0.8, "useless": -0.7, "worthless": -0.8, "dreadful": -0.9,
             "miserable": -0.8, "depressing": -0.8, "negative": -0.6, "painful": -0.7
         }
+        if extended_lexicon:
+            self.word_sentiments = {**extended_lexicon, **self.word_sentiments}
     
     def preprocess_text(self, text: str) -> List[str]:
         """Clean and tokenize text"""
@@ -69,6 +136,13 @@ class EnhancedSentimentAnalyzer:
         words = text.split()
         return [word.strip() for word in words if word.strip()]
     
+    def salient_tokens(self, text: str) -> Tuple[str, ...]:
+        """Tokens that can change the lexicon verdict (sentiment words, negations, intensifiers)"""
+        return tuple(
+            word for word in islice(iter_tokens(text), self.max_words)
+            if word in self.word_sentiments or word in self.negation_words or word in self.intensifier_parts
+        )
+    
     def find_negation_context(self, words: List[str], position: int, window: int = 3) -> bool:
         """Check if a word at given position is negated within the context window"""
         start = max(0, position - window)
@@ -91,54 +165,86 @@ class EnhancedSentimentAnalyzer:
                     return self.intensifiers[two_word]
         return 1.0
     
-    def analyze_sentiment(self, text: str) -> Dict:
+    def analyze_sentiment(self, text: str, explain: bool = True) -> Dict:
         """
         Analyze sentiment with negation and context awareness
         
+        Args:
+            text: Text to analyze
+            explain: Build the per-word ``word_analysis`` list. Callers that
+                only need the verdict can skip it.
+        
         Returns:
             Dict containing sentiment analysis results
         """
         if not text or not text.strip():
-            return {
-                "sentiment": "neutral",
-                "confidence": 0.0,
-                "score": 0.0,
-                "word_analysis": [],
-                "method": "enhanced_context_aware"
-            }
-        
-        words = self.preprocess_text(text)
+            return self.empty_result()
+        
         total_score = 0.0
         sentiment_word_count = 0
+        word_count = 0
+        truncated = False
         word_analysis = []
+        explanations_omitted = 0
+        # The few preceding words negation and intensity look back at
+        context = deque(maxlen=self.CONTEXT_WINDOW)
         
-        for i, word in enumerate(words):
+        for word in iter_tokens(text):
+            if word_count >= self.max_words:
+                truncated = True
+                break
+            word_count += 1
+            
             if word in self.word_sentiments:
+                window = [*context, word]
+                position = len(window) - 1
                 original_score = self.word_sentiments[word]
                 current_score = original_score
                 
                 # Check for negation
-                is_negated = self.find_negation_context(words, i)
+                is_negated = self.find_negation_context(window, position)
                 if is_negated:
                     current_score = -current_score
                 
                 # Apply intensity modifiers
-                intensity = self.find_intensity_modifier(words, i)
+                intensity = self.find_intensity_modifier(window, position)
                 current_score *= intensity
                 
                 total_score += current_score
                 sentiment_word_count += 1
                 
-                word_analysis.append({
-                    "word": word,
-                    "original_score": original_score,
-                    "final_score": current_score,
-                    "is_negated": is_negated,
-                    "intensity_multiplier": intensity,
-                    "sentiment": "positive" if current_score > 0 else "negative" if current_score < 0 else "neutral"
-                })
-        
-        # Calculate final sentiment
+                if explain and len(word_analysis) >= self.max_explained:
+                    explanations_omitted += 1
+                elif explain:
+                    word_analysis.append({
+                        "word": word,
+                        "original_score": original_score,
+                        "final_score": current_score,
+                        "is_negated": is_negated,
+                        "intensity_multiplier": intensity,
+                        "sentiment": "positive" if current_score > 0 else "negative" if current_score < 0 else "neutral"
+                    })
+            
+            context.append(word)
+        
+        return self.build_result(text, total_score, sentiment_word_count, word_count, truncated,
+                                 word_analysis, explanations_omitted)
+    
+    @staticmethod
+    def empty_result() -> Dict:
+        """Result for an empty or blank text"""
+        return {
+            "sentiment": "neutral",
+            "confidence": 0.0,
+            "score": 0.0,
+            "word_analysis": [],
+            "method": "enhanced_context_aware"
+        }
+    
+    @staticmethod
+    def build_result(text: str, total_score: float, sentiment_word_count: int, word_count: int,
+                     truncated: bool, word_analysis: List[Dict], explanations_omitted: int) -> Dict:
+        """Final verdict of a text from its summed word scores"""
         if sentiment_word_count == 0:
             avg_score = 0.0
             sentiment = "neutral"
@@ -164,13 +270,142 @@ class EnhancedSentimentAnalyzer:
             "word_analysis": word_analysis,
             "method": "enhanced_context_aware",
             "text": text,
-            "word_count": len(words),
-            "sentiment_words_found": sentiment_word_count
+            "word_count": word_count,
+            "sentiment_words_found": sentiment_word_count,
+            "truncated": truncated,
+            "explanations_omitted": explanations_omitted
         }
     
-    def batch_analyze(self, texts: List[str]) -> List[Dict]:
-        """Analyze multiple texts efficiently"""
-        return [self.analyze_sentiment(text) for text in texts]
+    def batch_analyze(self, texts: List[str], explain: bool = True) -> List[Dict]:
+        """
+        Analyze multiple texts at once; the results equal ``analyze_sentiment``'s
+        
+        Tokens are mapped to integer ids once, and negation, intensity and
+        scores are computed with array operations over the whole batch
+        instead of word by word. Batches of at least ``parallel_batch_size``
+        texts are split across ``batch_workers`` processes.
+        """
+        texts = list(texts)
+        if self.batch_workers > 1 and len(texts) >= self.parallel_batch_size:
+            from concurrent.futures import ProcessPoolExecutor
+            
+            size = -(-len(texts) // self.batch_workers)
+            chunks = [texts[start:start + size] for start in range(0, len(texts), size)]
+            with ProcessPoolExecutor(len(chunks)) as pool:
+                return list(chain.from_iterable(pool.map(self._analyze_batch, chunks, repeat(explain))))
+        return self._analyze_batch(texts, explain)
+    
+    def __getstate__(self):
+        # Sent to batch worker processes without the tables; they rebuild them
+        return {**self.__dict__, '_batch_tables': None}
+    
+    def batch_tables(self):
+        """Token ids and per-id lexicon arrays used by batch_analyze"""
+        if self._batch_tables is None:
+            # numpy is only needed once the first batch is analyzed
+            import numpy as np
+            
+            vocabulary = sorted(set(self.word_sentiments) | self.negation_words | self.intensifier_parts)
+            # Id 0 stands for every other token
+            token_ids = {word: token_id for token_id, word in enumerate(vocabulary, start=1)}
+            scores = np.zeros(len(vocabulary) + 1)
+            is_sentiment = np.zeros(len(vocabulary) + 1, dtype=bool)
+            is_negation = np.zeros(len(vocabulary) + 1, dtype=bool)
+            intensity = np.zeros(len(vocabulary) + 1)  # 0: not an intensifier
+            for word, score in self.word_sentiments.items():
+                scores[token_ids[word]] = score
+                is_sentiment[token_ids[word]] = True
+            for word in self.negation_words:
+                is_negation[token_ids[word]] = True
+            # Two-word intensifiers by the ids of their words; longer phrases never match
+            pairs = {}
+            for phrase, multiplier in self.intensifiers.items():
+                parts = phrase.split()
+                if len(parts) == 1:
+                    intensity[token_ids[phrase]] = multiplier
+                elif len(parts) == 2:
+                    pairs[token_ids[parts[0]], token_ids[parts[1]]] = multiplier
+            self._batch_tables = (np, token_ids, scores, is_sentiment, is_negation, intensity, pairs)
+        return self._batch_tables
+    
+    def _analyze_batch(self, texts: List[str], explain: bool) -> List[Dict]:
+        np, token_ids, scores, is_sentiment, is_negation, intensity, pairs = self.batch_tables()
+        
+        results = [None] * len(texts)
+        analyzed, token_lists, truncated = [], [], []
+        for index, text in enumerate(texts):
+            if not text or not text.strip():
+                results[index] = self.empty_result()
+                continue
+            if len(text) <= CHUNK_SIZE:
+                # A single chunk: the same tokens as iter_tokens without the generator
+                tokens = LEXICON_TOKEN.findall(text.lower())
+            else:
+                tokens = list(islice(iter_tokens(text), self.max_words + 1))
+            truncated.append(len(tokens) > self.max_words)
+            del tokens[self.max_words:]
+            analyzed.append(index)
+            token_lists.append(tokens)
+        if not analyzed:
+            return results
+        
+        # The batch's tokens laid end to end, with each token's text and position in it
+        lengths = np.fromiter(map(len, token_lists), dtype=np.int64, count=len(token_lists))
+        starts = np.cumsum(lengths) - lengths
+        words = list(chain.from_iterable(token_lists))
+        ids = np.fromiter(map(token_ids.get, words, repeat(0)), dtype=np.int64, count=len(words))
+        owner = np.repeat(np.arange(len(token_lists)), lengths)
+        position = np.arange(len(words)) - np.repeat(starts, lengths)
+        
+        # Multiplier of the two-word intensifier starting at each token, 0 if none
+        pair_intensity = np.zeros(len(words))
+        for (first, second), multiplier in pairs.items():
+            pair_intensity[:-1][(ids[:-1] == first) & (ids[1:] == second)] = multiplier
+        
+        # Sentiment words and their context, as analyze_sentiment's look-back finds it
+        hits = np.flatnonzero(is_sentiment[ids])
+        hit_position = position[hits]
+        negated = np.zeros(len(hits), dtype=bool)
+        for offset in range(1, self.CONTEXT_WINDOW + 1):
+            before = np.where(hit_position >= offset, hits - offset, 0)
+            negated |= (hit_position >= offset) & is_negation[ids[before]]
+        # find_intensity_modifier returns the first match scanning forward, so
+        # candidates are applied nearest first and earlier ones override them
+        multiplier = np.ones(len(hits))
+        for offset in range(1, self.INTENSITY_WINDOW + 1):
+            before = np.where(hit_position >= offset, hits - offset, 0)
+            for candidate in (pair_intensity[before], intensity[ids[before]]):
+                multiplier = np.where((hit_position >= offset) & (candidate != 0), candidate, multiplier)
+        original = scores[ids[hits]]
+        final = np.where(negated, -original, original) * multiplier
+        
+        # np.add.at adds in index order, the same float sums as the single-text loop
+        hit_owner = owner[hits]
+        totals = np.zeros(len(token_lists))
+        np.add.at(totals, hit_owner, final)
+        counts = np.bincount(hit_owner, minlength=len(token_lists))
+        bounds = np.searchsorted(hit_owner, np.arange(len(token_lists) + 1)).tolist()
+        
+        hit_list, final_list = hits.tolist(), final.tolist()
+        negated_list, multiplier_list = negated.tolist(), multiplier.tolist()
+        for row, (index, total, count) in enumerate(zip(analyzed, totals.tolist(), counts.tolist())):
+            word_analysis = []
+            if explain:
+                for hit in range(bounds[row], min(bounds[row + 1], bounds[row] + self.max_explained)):
+                    word, current_score = words[hit_list[hit]], final_list[hit]
+                    word_analysis.append({
+                        "word": word,
+                        "original_score": self.word_sentiments[word],
+                        "final_score": current_score,
+                        "is_negated": negated_list[hit],
+                        "intensity_multiplier": multiplier_list[hit],
+                        "sentiment": "positive" if current_score > 0 else "negative" if current_score < 0 else "neutral"
+                    })
+            results[index] = self.build_result(
+                texts[index], total, count, len(token_lists[row]), truncated[row], word_analysis,
+                max(count - self.max_explained, 0) if explain else 0
+            )
+        return results
     
     def is_negative_sentiment(self, text: str, threshold: float = -0.2) -> bool:
         """Quick check if text has negative sentiment"""
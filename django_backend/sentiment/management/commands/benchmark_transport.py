@@ -0,0 +1,195 @@
+"""
+Local load test comparing the HTTP API with the pipelined socket transport.
+
+Both servers are started as subprocesses (unless ``--http-url`` / ``--socket``
+point at already running ones) and receive the same toxicity workload:
+HTTP with one connection per message, as ``backend/src/lib/toxicity.js``
+does, and the socket transport over a single pipelined connection.
+
+Started servers run without the persistent verdict store, so neither path
+is answered from rows the other wrote to db.sqlite3. With ``--unique``
+every message is distinct across both paths and their warm-up passes, and
+near-duplicate matching is off, so no cache answers at all.
+"""
+
+import asyncio
+import http.client
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from sentiment.transport import InferenceClient
+
+MESSAGES = [
+    "hey everyone, how's it going today?",
+    "this update is amazing, great work team",
+    "I really don't like how this turned out",
+    "you are such an idiot, nobody wants you here",
+    "can someone share the meeting notes please",
+    "lol that was hilarious 😂",
+    "this is the worst app I have ever used",
+    "thanks for the help yesterday, really appreciate it",
+]
+
+
+def _percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+
+def _summary(latencies, elapsed, errors):
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'throughput_rps': round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        'p50_ms': round(_percentile(latencies, 0.50) * 1000, 2) if latencies else None,
+        'p99_ms': round(_percentile(latencies, 0.99) * 1000, 2) if latencies else None,
+        'mean_ms': round(statistics.fmean(latencies) * 1000, 2) if latencies else None,
+    }
+
+
+def _workload(count, unique, tag):
+    # Suffixes tagged per pass keep the verdict caches from answering one
+    # path with verdicts the other (or its warm-up) computed
+    return [
+        {'text': f'{MESSAGES[i % len(MESSAGES)]} [{tag}-{i}]' if unique else MESSAGES[i % len(MESSAGES)],
+         'detail': 'minimal'}
+        for i in range(count)
+    ]
+
+
+def run_http(url, payloads, concurrency):
+    parts = urlsplit(url)
+
+    def send(payload):
+        started = time.perf_counter()
+        connection = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=30)
+        try:
+            connection.request('POST', parts.path or '/', body=json.dumps(payload),
+                               headers={'Content-Type': 'application/json'})
+            response = connection.getresponse()
+            response.read()
+            ok = response.status == 200
+        except OSError:
+            ok = False
+        finally:
+            connection.close()
+        return time.perf_counter() - started, ok
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(send, payloads))
+    elapsed = time.perf_counter() - started
+    return _summary([r[0] for r in results], elapsed, sum(1 for r in results if not r[1]))
+
+
+async def _run_socket(socket_path, payloads, concurrency):
+    client = InferenceClient(socket_path=socket_path)
+    await client.connect()
+    limit = asyncio.Semaphore(concurrency)
+    latencies, errors = [], 0
+
+    async def send(payload):
+        nonlocal errors
+        async with limit:
+            started = time.perf_counter()
+            frame = await client.request('toxicity', payload)
+            latencies.append(time.perf_counter() - started)
+            if frame.get('status') != 200:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(send(payload) for payload in payloads))
+    elapsed = time.perf_counter() - started
+    await client.close()
+    return _summary(latencies, elapsed, errors)
+
+
+def run_socket(socket_path, payloads, concurrency):
+    return asyncio.run(_run_socket(socket_path, payloads, concurrency))
+
+
+class Command(BaseCommand):
+    help = 'Compare throughput and latency of the HTTP API and the socket transport'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=500)
+        parser.add_argument('--concurrency', type=int, default=16)
+        parser.add_argument('--unique', action='store_true',
+                            help='Make every message distinct so verdict caches never answer')
+        parser.add_argument('--http-url', default=None,
+                            help='Toxicity URL of a running HTTP server (default: start one)')
+        parser.add_argument('--socket', default=None,
+                            help='Socket of a running serve_inference (default: start one)')
+        parser.add_argument('--port', type=int, default=8765,
+                            help='Port for the HTTP server started by the benchmark')
+
+    def _wait(self, check, what, timeout=120):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            try:
+                if check():
+                    return
+            except OSError:
+                pass
+            time.sleep(0.25)
+        raise CommandError(f'{what} did not become ready within {timeout}s')
+
+    def handle(self, *args, **options):
+        manage_py = os.path.join(settings.BASE_DIR, 'manage.py')
+        env = dict(os.environ, SENTIMENT_WARMUP='blocking', SENTIMENT_VERDICT_STORE='off')
+        if options['unique']:
+            env['SENTIMENT_NEAR_DUP_MAX_LENGTH'] = '0'
+        processes = []
+
+        http_url = options['http_url']
+        socket_path = options['socket']
+        try:
+            if http_url is None:
+                port = options['port']
+                http_url = f'http://127.0.0.1:{port}/api/sentiment/toxicity/'
+                processes.append(subprocess.Popen(
+                    [sys.executable, manage_py, 'runserver', '--noreload', f'127.0.0.1:{port}'],
+                    env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                ))
+                self._wait(
+                    lambda: urllib.request.urlopen(f'http://127.0.0.1:{port}/ready/', timeout=2).status == 200,
+                    'HTTP server',
+                )
+
+            if socket_path is None:
+                socket_path = os.path.join(tempfile.mkdtemp(), 'inference.sock')
+                processes.append(subprocess.Popen(
+                    [sys.executable, manage_py, 'serve_inference', '--socket', socket_path],
+                    env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                ))
+                self._wait(lambda: os.path.exists(socket_path), 'Socket transport')
+
+            count, unique, concurrency = options['requests'], options['unique'], options['concurrency']
+            # One untimed pass per path so both start with loaded models
+            run_http(http_url, _workload(concurrency, unique, 'http-warmup'), concurrency)
+            run_socket(socket_path, _workload(concurrency, unique, 'socket-warmup'), concurrency)
+
+            results = {
+                'http': run_http(http_url, _workload(count, unique, 'http'), concurrency),
+                'socket': run_socket(socket_path, _workload(count, unique, 'socket'), concurrency),
+            }
+        finally:
+            for process in processes:
+                process.terminate()
+                process.wait()
+
+        self.stdout.write(json.dumps(results, indent=2))
+        http_rps = results['http']['throughput_rps']
+        if http_rps:
+            self.stdout.write(f"📊 Socket transport: {results['socket']['throughput_rps'] / http_rps:.1f}x HTTP throughput")
@@ -0,0 +1,333 @@
+"""
+Open-loop load test of the sentiment service, for capacity sizing.
+
+Texts from Beyonder/processed_test_data.csv are replayed against
+/api/sentiment/analyze/, /enhanced/ and /toxicity/ in turn. Requests arrive
+at a fixed rate, Poisson by default, whether or not earlier ones have been
+answered. A slow server therefore builds a queue instead of slowing the
+load down, as real traffic would. Each request's latency is measured from
+its scheduled arrival, so time spent waiting for one of the ``--concurrency``
+client connections is counted (no coordinated omission).
+
+The rate steps through ``--rates``. A step is saturated when the service
+falls behind: it completes less than SATURATION_THROUGHPUT of the offered
+rate, its error rate exceeds ``--max-error-rate``, or p99 exceeds
+``--slo-ms``. The ramp stops at the first saturated step. The last
+sustained rate is the capacity of that configuration.
+
+Every configuration in ``--servers`` x ``--workers`` is started in turn on
+a local port and waited on until /ready/:
+
+- wsgi       gunicorn (gthread workers, ``--threads`` each)
+- asgi       uvicorn
+- runserver  Django's threaded development server (one process)
+
+Servers that aren't installed are skipped. ``--url`` tests one already
+running service instead. The report is printed as a table and saved as JSON.
+
+Started servers run without the persistent verdict store, so no
+configuration is answered from rows an earlier one wrote to db.sqlite3.
+With ``--unique`` they also skip near-duplicate fingerprinting, and every
+request's text carries a per-configuration nonce and its sequence number:
+no text is sent twice, even once the ramp has wrapped around the dataset,
+and the verdict caches never answer. A ``--url`` service keeps its own
+settings; disable its verdict store for ``--unique`` figures.
+The generator itself needs CPU: on a small machine, pin it away from the
+server (e.g. ``taskset``) or the measured capacity is the pair's.
+
+    python manage.py load_test --servers wsgi asgi --workers 1 2 4 --rates 10 25 50 100
+"""
+
+import asyncio
+import csv
+import importlib.util
+import json
+import os
+import random
+import secrets
+import subprocess
+import sys
+import time
+import urllib.request
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+DATASET_PATH = os.path.join(settings.BASE_DIR, 'Beyonder', 'processed_test_data.csv')
+ENDPOINTS = {
+    'analyze': ('/api/sentiment/analyze/', {'model': 'svc'}),
+    'enhanced': ('/api/sentiment/enhanced/', {}),
+    'toxicity': ('/api/sentiment/toxicity/', {}),
+}
+# Server kind -> (module that must be importable, command line)
+SERVERS = {
+    'wsgi': ('gunicorn', lambda port, workers, threads: [
+        sys.executable, '-m', 'gunicorn', 'core.wsgi:application', '--bind', f'127.0.0.1:{port}',
+        '--workers', str(workers), '--threads', str(threads), '--worker-class', 'gthread',
+    ]),
+    'asgi': ('uvicorn', lambda port, workers, threads: [
+        sys.executable, '-m', 'uvicorn', 'core.asgi:application', '--host', '127.0.0.1', '--port', str(port),
+        '--workers', str(workers), '--no-access-log',
+    ]),
+    'runserver': ('django', lambda port, workers, threads: [
+        sys.executable, os.path.join(settings.BASE_DIR, 'manage.py'), 'runserver', '--noreload', f'127.0.0.1:{port}',
+    ]),
+}
+# A step is saturated below this share of the offered rate
+SATURATION_THROUGHPUT = 0.9
+
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+
+def load_texts(path):
+    with open(path, encoding='utf-8', newline='') as f:
+        texts = [row['text'].strip() for row in csv.DictReader(f) if (row.get('text') or '').strip()]
+    if not texts:
+        raise CommandError(f'No texts in {path}')
+    return texts
+
+
+async def post(host, port, path, body):
+    """Status code of one POST, on its own connection like the chat backend's"""
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        writer.write(
+            f'POST {path} HTTP/1.1\r\nHost: {host}:{port}\r\nContent-Type: application/json\r\n'
+            f'Content-Length: {len(body)}\r\nConnection: close\r\n\r\n'.encode('ascii') + body
+        )
+        await writer.drain()
+        status_line = await reader.readline()
+        await reader.read()
+        return int(status_line.split()[1])
+    finally:
+        writer.close()
+
+
+def summarize(latencies, statuses, offered, elapsed):
+    ok = [latency for latency, status in zip(latencies, statuses) if status == 200]
+    codes = {}
+    for status in statuses:
+        key = str(status) if status is not None else 'failed'
+        codes[key] = codes.get(key, 0) + 1
+
+    def ms(value):
+        return round(value * 1000, 2) if value is not None else None
+
+    return {
+        'requests': len(statuses),
+        'offered_rps': round(offered, 2),
+        'throughput_rps': round(len(ok) / elapsed, 2) if elapsed else 0.0,
+        'error_rate': round(1 - len(ok) / len(statuses), 4) if statuses else 0.0,
+        'p50_ms': ms(percentile(ok, 0.50)),
+        'p95_ms': ms(percentile(ok, 0.95)),
+        'p99_ms': ms(percentile(ok, 0.99)),
+        'statuses': codes,
+    }
+
+
+async def run_step(url, endpoints, texts, rate, duration, concurrency, timeout, poisson, detail, rng, offset,
+                   nonce=None):
+    """
+    Offer ``rate`` requests/s for ``duration`` seconds; per-endpoint and
+    overall results. With a ``nonce``, request ``i`` of the ramp sends its
+    text suffixed with ``[nonce-i]``, so no text repeats.
+    """
+    parts = urlsplit(url)
+    host, port, prefix = parts.hostname, parts.port or 80, parts.path.rstrip('/')
+    loop = asyncio.get_running_loop()
+    slots = asyncio.Semaphore(concurrency)
+    results = []
+
+    async def send(endpoint, body):
+        path, _ = ENDPOINTS[endpoint]
+        async with slots:
+            return await post(host, port, prefix + path, body)
+
+    async def request(endpoint, body, scheduled):
+        try:
+            status = await asyncio.wait_for(send(endpoint, body), timeout - (loop.time() - scheduled))
+        except (OSError, asyncio.TimeoutError, ValueError, IndexError):
+            status = None
+        results.append((endpoint, loop.time() - scheduled, status))
+
+    tasks = []
+    started = scheduled = loop.time()
+    while scheduled < started + duration:
+        delay = scheduled - loop.time()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        i = offset + len(tasks)
+        endpoint = endpoints[i % len(endpoints)]
+        text = texts[i % len(texts)] if nonce is None else f'{texts[i % len(texts)]} [{nonce}-{i}]'
+        body = json.dumps({'text': text, 'detail': detail, **ENDPOINTS[endpoint][1]})
+        tasks.append(asyncio.create_task(request(endpoint, body.encode('utf-8'), scheduled)))
+        scheduled += rng.expovariate(rate) if poisson else 1 / rate
+    await asyncio.gather(*tasks)
+    elapsed = loop.time() - started
+
+    step = summarize([r[1] for r in results], [r[2] for r in results], len(tasks) / duration, elapsed)
+    step['endpoints'] = {}
+    for endpoint in endpoints:
+        mine = [r for r in results if r[0] == endpoint]
+        step['endpoints'][endpoint] = summarize(
+            [r[1] for r in mine], [r[2] for r in mine], len(mine) / duration, elapsed
+        )
+    return step, len(tasks)
+
+
+def saturated(step, max_error_rate, slo_ms):
+    return (
+        step['throughput_rps'] < step['offered_rps'] * SATURATION_THROUGHPUT
+        or step['error_rate'] > max_error_rate
+        or step['p99_ms'] is None or step['p99_ms'] > slo_ms
+    )
+
+
+class Command(BaseCommand):
+    help = 'Open-loop load test of the analysis endpoints across WSGI/ASGI servers and worker counts'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--servers', nargs='+', choices=sorted(SERVERS), default=['wsgi', 'asgi'])
+        parser.add_argument('--workers', nargs='+', type=int, default=[1, 2, 4],
+                            help='Worker process counts to compare (runserver always has one)')
+        parser.add_argument('--threads', type=int, default=4, help='Threads per gunicorn worker')
+        parser.add_argument('--url', default=None,
+                            help='Base URL of a running service to test instead of starting servers')
+        parser.add_argument('--rates', nargs='+', type=float, default=[5, 10, 25, 50, 100, 200],
+                            help='Arrival rates (requests/s) to step through')
+        parser.add_argument('--duration', type=float, default=15.0, help='Seconds per rate step')
+        parser.add_argument('--arrivals', choices=['poisson', 'uniform'], default='poisson')
+        parser.add_argument('--concurrency', type=int, default=256, help='Client connections open at most')
+        parser.add_argument('--timeout', type=float, default=10.0, help='Seconds before a request counts as failed')
+        parser.add_argument('--endpoints', nargs='+', choices=sorted(ENDPOINTS), default=sorted(ENDPOINTS))
+        parser.add_argument('--detail', choices=['minimal', 'standard', 'debug'], default='standard')
+        parser.add_argument('--unique', action='store_true',
+                            help='Make every request\'s text distinct so verdict caches never answer')
+        parser.add_argument('--dataset', default=DATASET_PATH)
+        parser.add_argument('--max-error-rate', type=float, default=0.01)
+        parser.add_argument('--slo-ms', type=float, default=1000.0, help='p99 latency a sustained rate must meet')
+        parser.add_argument('--port', type=int, default=8780, help='Port for the servers the test starts')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--output', default='load_test_report.json')
+
+    def _wait(self, check, what, process, timeout=120):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if process.poll() is not None:
+                raise CommandError(f'{what} exited with status {process.returncode}')
+            try:
+                if check():
+                    return
+            except OSError:
+                pass
+            time.sleep(0.25)
+        raise CommandError(f'{what} did not become ready within {timeout}s')
+
+    def _configurations(self, options):
+        if options['url']:
+            return [('external', None, options['url'].rstrip('/'))]
+        configurations = []
+        for server in options['servers']:
+            module, _ = SERVERS[server]
+            if importlib.util.find_spec(module) is None:
+                self.stdout.write(f"⚠️ Skipping {server}: {module} is not installed")
+                continue
+            for workers in ([1] if server == 'runserver' else options['workers']):
+                configurations.append((server, workers, f"http://127.0.0.1:{options['port']}"))
+        if not configurations:
+            raise CommandError('No server available to test; install gunicorn or uvicorn, or pass --url')
+        return configurations
+
+    def _ramp(self, url, texts, options):
+        rng = random.Random(options['seed'])
+        steps, offset = [], 0
+        # Fresh for every configuration and run, unlike the seeded arrivals
+        nonce = secrets.token_hex(4) if options['unique'] else None
+        for rate in options['rates']:
+            step, sent = asyncio.run(run_step(
+                url, options['endpoints'], texts, rate, options['duration'], options['concurrency'],
+                options['timeout'], options['arrivals'] == 'poisson', options['detail'], rng, offset, nonce,
+            ))
+            offset += sent
+            step['saturated'] = saturated(step, options['max_error_rate'], options['slo_ms'])
+            steps.append(step)
+            self.stdout.write(
+                f"   {rate:>7g} rps offered: {step['throughput_rps']:>7.1f} rps, "
+                f"p50 {step['p50_ms']} ms, p99 {step['p99_ms']} ms, errors {step['error_rate']:.1%}"
+                + (' ⛔ saturated' if step['saturated'] else '')
+            )
+            if step['saturated']:
+                break
+        return steps
+
+    def handle(self, *args, **options):
+        texts = load_texts(options['dataset'])
+        env = dict(os.environ, SENTIMENT_WARMUP='blocking', SENTIMENT_VERDICT_STORE='off')
+        if options['unique']:
+            env['SENTIMENT_NEAR_DUP_MAX_LENGTH'] = '0'
+        report = []
+
+        for server, workers, url in self._configurations(options):
+            label = server if workers is None else f'{server} x{workers}'
+            self.stdout.write(f"🚦 {label}: {url}")
+            process = None
+            if server != 'external':
+                _, command = SERVERS[server]
+                process = subprocess.Popen(
+                    command(options['port'], workers, options['threads']), cwd=settings.BASE_DIR, env=env,
+                    stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                )
+            try:
+                if process is not None:
+                    self._wait(
+                        lambda: urllib.request.urlopen(f'{url}/ready/', timeout=2).status == 200, label, process
+                    )
+                steps = self._ramp(url, texts, options)
+            finally:
+                if process is not None:
+                    process.terminate()
+                    process.wait()
+
+            sustained = [step for step in steps if not step['saturated']]
+            report.append({
+                'server': server,
+                'workers': workers,
+                'threads': options['threads'] if server == 'wsgi' else None,
+                'max_sustained_rps': sustained[-1]['offered_rps'] if sustained else None,
+                'max_throughput_rps': max(step['throughput_rps'] for step in steps),
+                'saturated_at_rps': steps[-1]['offered_rps'] if steps[-1]['saturated'] else None,
+                'steps': steps,
+            })
+
+        with open(options['output'], 'w') as f:
+            json.dump({
+                'endpoints': options['endpoints'],
+                'arrivals': options['arrivals'],
+                'duration_seconds': options['duration'],
+                'concurrency': options['concurrency'],
+                'slo_ms': options['slo_ms'],
+                'max_error_rate': options['max_error_rate'],
+                'texts': len(texts),
+                'unique': options['unique'],
+                'configurations': report,
+            }, f, indent=2)
+
+        self.stdout.write(f"\n📊 {'configuration':<16} {'sustained':>10} {'max rps':>9} {'p50 ms':>8} "
+                          f"{'p95 ms':>8} {'p99 ms':>8} {'errors':>7}  saturated at")
+        for entry in report:
+            label = entry['server'] if entry['workers'] is None else f"{entry['server']} x{entry['workers']}"
+            # Latency at the highest rate the configuration sustained
+            sustained = [step for step in entry['steps'] if not step['saturated']]
+            shown = sustained[-1] if sustained else entry['steps'][0]
+            self.stdout.write(
+                f"   {label:<16} {entry['max_sustained_rps'] or '-':>10} {entry['max_throughput_rps']:>9} "
+                f"{shown['p50_ms'] or '-':>8} {shown['p95_ms'] or '-':>8} {shown['p99_ms'] or '-':>8} "
+                f"{shown['error_rate']:>7.1%}  {entry['saturated_at_rps'] or '-'}"
+            )
+        self.stdout.write(f"\n✅ Report saved to {options['output']}")
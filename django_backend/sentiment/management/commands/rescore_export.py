@@ -0,0 +1,271 @@
+"""
+Re-score an exported ``messages`` collection with the current models.
+
+The input is a JSONL dump (``mongoexport``) of the chat ``messages``
+collection. It is streamed in chunks to a process pool running the same
+analyzers as the API, and one result line per input line is written in input
+order. Progress is checkpointed next to the output, so a rerun after a crash
+or Ctrl-C continues after the last checkpoint instead of starting over.
+"""
+
+import json
+import multiprocessing
+import os
+import sys
+import time
+from collections import deque
+
+from django.core.management.base import BaseCommand, CommandError
+
+CHECKPOINT_SUFFIX = '.checkpoint'
+
+# The chat backend stores message text Caesar-shifted (backend/src/lib/caesarCipher.js)
+_LOWER = 'abcdefghijklmnopqrstuvwxyz'
+_UPPER = _LOWER.upper()
+_DIGITS = '0123456789'
+_decrypt_tables = {}
+
+# Per-process analyzers, created by _init_worker
+_worker = {}
+
+
+def decrypt_caesar(text, shift=4):
+    table = _decrypt_tables.get(shift)
+    if table is None:
+        table = _decrypt_tables[shift] = str.maketrans(
+            _LOWER + _UPPER + _DIGITS,
+            _LOWER[-shift % 26:] + _LOWER[:-shift % 26]
+            + _UPPER[-shift % 26:] + _UPPER[:-shift % 26]
+            + _DIGITS[-shift % 10:] + _DIGITS[:-shift % 10],
+        )
+    return text.translate(table)
+
+
+def message_text(message):
+    """Plain text of an exported message, or None when there is nothing to score"""
+    text = message.get('text')
+    if not text or message.get('isDeleted'):
+        return None
+    if message.get('isEncrypted', True) and message.get('encryptionMethod', 'caesar') == 'caesar':
+        text = decrypt_caesar(text, message.get('encryptionKey', 4))
+    return text.strip() or None
+
+
+def _init_worker(model_name):
+    import django
+    from django.apps import apps
+    if not apps.ready:
+        django.setup()
+
+    from sentiment import model_store
+    from sentiment.views import EnhancedSentimentAPIView, ToxicityAPIView
+
+    # The analyzers log every low-confidence message; at archive scale that
+    # would drown the progress report
+    sys.stdout = open(os.devnull, 'w')
+
+    model_store.get_model(model_name)
+    _worker['model'] = model_name
+    _worker['enhanced'] = EnhancedSentimentAPIView()
+    _worker['toxicity'] = ToxicityAPIView()
+
+
+def score_message(message):
+    """Result record for one exported message, shaped like the Message schema"""
+    text = message_text(message)
+    if text is None:
+        return {'_id': message.get('_id'), 'skipped': 'no_text'}
+
+    result, _, _ = _worker['enhanced'].analyze(text, _worker['model'], explain=False)
+    toxicity = _worker['toxicity'].analyze_toxicity_with_ml(text)
+
+    # Same precedence as analyzeTextToxicityWithEnhancedSentiment in the backend
+    if toxicity['isToxic']:
+        sentiment, source = 'negative', 'toxicity_override'
+    else:
+        sentiment, source = result['sentiment'], 'enhanced_analysis'
+
+    return {
+        '_id': message.get('_id'),
+        'sentiment': sentiment,
+        'sentimentAnalysis': {
+            'value': sentiment,
+            'confidence': result['confidence'],
+            'score': result['score'],
+            'source': source,
+            'enhanced': True,
+        },
+        'sentimentOverridden': toxicity['isToxic'] and result['sentiment'] != 'negative',
+        'toxicity': {
+            'isToxic': toxicity['isToxic'],
+            'toxicityScore': toxicity['toxicityScore'],
+            'severity': toxicity['severity'],
+            'categories': toxicity['categories'],
+        },
+    }
+
+
+def _score_chunk(lines):
+    output = []
+    for line in lines:
+        try:
+            record = score_message(json.loads(line))
+        except ValueError:
+            record = {'error': 'invalid_json'}
+        except Exception as e:
+            record = {'error': str(e)}
+        output.append(json.dumps(record, separators=(',', ':'), default=str))
+    return ('\n'.join(output) + '\n').encode('utf-8')
+
+
+def _read_chunks(f, chunk_size):
+    """Yield (lines, end_offset) from the current position of a binary file"""
+    lines = []
+    while True:
+        line = f.readline()
+        if not line:
+            break
+        if line.strip():
+            lines.append(line)
+        if len(lines) >= chunk_size:
+            yield lines, f.tell()
+            lines = []
+    if lines:
+        yield lines, f.tell()
+
+
+def _format_duration(seconds):
+    seconds = int(seconds)
+    hours, seconds = divmod(seconds, 3600)
+    minutes, seconds = divmod(seconds, 60)
+    return f'{hours}h{minutes:02d}m{seconds:02d}s' if hours else f'{minutes}m{seconds:02d}s'
+
+
+class Command(BaseCommand):
+    help = 'Re-score a JSONL export of the messages collection with the current models (resumable)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('input', help='JSONL export of the messages collection')
+        parser.add_argument('output', help='JSONL file receiving one result per input message')
+        parser.add_argument('--model', choices=['svc', 'nb'], default='svc')
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+        parser.add_argument('--chunk-size', type=int, default=2000,
+                            help='Messages sent to a worker at a time')
+        parser.add_argument('--checkpoint-interval', type=float, default=10.0,
+                            help='Seconds between checkpoints')
+        parser.add_argument('--report-interval', type=float, default=5.0,
+                            help='Seconds between progress lines')
+        parser.add_argument('--restart', action='store_true',
+                            help='Ignore an existing checkpoint and start from the beginning')
+
+    def _load_checkpoint(self, path, expected, restart):
+        if restart or not os.path.exists(path):
+            return {'input_offset': 0, 'output_offset': 0, 'messages': 0}
+
+        with open(path) as f:
+            checkpoint = json.load(f)
+        for field, value in expected.items():
+            if checkpoint.get(field) != value:
+                raise CommandError(
+                    f'Checkpoint {path} was written for a different {field} '
+                    f'({checkpoint.get(field)!r}, now {value!r}); rerun with --restart'
+                )
+        return checkpoint
+
+    def _save_checkpoint(self, path, checkpoint, output):
+        # The output must be durable before the checkpoint points past it
+        output.flush()
+        os.fsync(output.fileno())
+        temporary = path + '.tmp'
+        with open(temporary, 'w') as f:
+            json.dump(checkpoint, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporary, path)
+
+    def handle(self, *args, **options):
+        from sentiment.verdict_store import verdict_store
+
+        input_path = os.path.abspath(options['input'])
+        output_path = os.path.abspath(options['output'])
+        checkpoint_path = output_path + CHECKPOINT_SUFFIX
+        if not os.path.exists(input_path):
+            raise CommandError(f'Input file not found: {input_path}')
+
+        input_size = os.path.getsize(input_path)
+        identity = {
+            'input': input_path,
+            'input_size': input_size,
+            'model': options['model'],
+            'model_version': verdict_store.version,
+        }
+        checkpoint = self._load_checkpoint(checkpoint_path, identity, options['restart'])
+        checkpoint.update(identity)
+
+        if checkpoint['input_offset']:
+            self.stdout.write(
+                f"↩️ Resuming after {checkpoint['messages']:,} messages "
+                f"({checkpoint['input_offset'] / max(input_size, 1):.1%} of the input)"
+            )
+
+        workers = max(options['workers'], 1)
+        # Bounded look-ahead keeps memory flat whatever the input size
+        max_pending = workers * 2
+        started = last_report = last_checkpoint = time.monotonic()
+        start_offset, start_messages = checkpoint['input_offset'], checkpoint['messages']
+
+        pool = multiprocessing.Pool(workers, initializer=_init_worker, initargs=(options['model'],))
+        try:
+            with open(input_path, 'rb') as source, open(output_path, 'ab') as output:
+                # Anything written after the last checkpoint is redone
+                output.truncate(checkpoint['output_offset'])
+                output.seek(checkpoint['output_offset'])
+                source.seek(checkpoint['input_offset'])
+
+                pending = deque()
+                chunks = _read_chunks(source, options['chunk_size'])
+                exhausted = False
+                while pending or not exhausted:
+                    while not exhausted and len(pending) < max_pending:
+                        chunk = next(chunks, None)
+                        if chunk is None:
+                            exhausted = True
+                            break
+                        lines, end_offset = chunk
+                        pending.append((pool.apply_async(_score_chunk, (lines,)), len(lines), end_offset))
+                    if not pending:
+                        break
+
+                    result, count, end_offset = pending.popleft()
+                    output.write(result.get())
+                    checkpoint['input_offset'] = end_offset
+                    checkpoint['output_offset'] = output.tell()
+                    checkpoint['messages'] += count
+
+                    now = time.monotonic()
+                    if now - last_checkpoint >= options['checkpoint_interval']:
+                        self._save_checkpoint(checkpoint_path, checkpoint, output)
+                        last_checkpoint = now
+                    if now - last_report >= options['report_interval']:
+                        self._report(checkpoint, start_offset, start_messages, input_size, now - started)
+                        last_report = now
+
+                self._save_checkpoint(checkpoint_path, checkpoint, output)
+        finally:
+            pool.terminate()
+            pool.join()
+
+        self._report(checkpoint, start_offset, start_messages, input_size, time.monotonic() - started)
+        self.stdout.write(self.style.SUCCESS(f"✅ Re-scored {checkpoint['messages']:,} messages into {output_path}"))
+
+    def _report(self, checkpoint, start_offset, start_messages, input_size, elapsed):
+        processed = checkpoint['input_offset'] - start_offset
+        rate = processed / elapsed if elapsed else 0.0
+        message_rate = (checkpoint['messages'] - start_messages) / elapsed if elapsed else 0.0
+        remaining = input_size - checkpoint['input_offset']
+        eta = _format_duration(remaining / rate) if rate else '?'
+        self.stdout.write(
+            f"📊 {checkpoint['messages']:,} messages, "
+            f"{checkpoint['input_offset'] / max(input_size, 1):.1%} of input, "
+            f"{message_rate:,.0f} msg/s, ETA {eta}"
+        )
@@ -0,0 +1,39 @@
+import asyncio
+
+from django.core.management.base import BaseCommand
+
+from sentiment.readiness import start_warmup
+from sentiment.transport import SOCKET_MODE, InferenceServer
+
+
+class Command(BaseCommand):
+    help = 'Serve the analysis endpoints over a persistent, pipelined Unix socket (or TCP) connection'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--socket', default='/tmp/sentiment-inference.sock',
+                            help='Unix socket path to listen on')
+        parser.add_argument('--socket-mode', type=lambda value: int(value, 8), default=SOCKET_MODE,
+                            help='Permissions of the Unix socket, in octal (default: 660)')
+        parser.add_argument('--port', type=int, default=None,
+                            help='Listen on 127.0.0.1:PORT over TCP instead of a Unix socket')
+        parser.add_argument('--workers', type=int, default=4,
+                            help='Threads analyzing requests concurrently')
+        parser.add_argument('--max-in-flight', type=int, default=256,
+                            help='Unanswered requests allowed per connection before reading pauses')
+
+    def handle(self, *args, **options):
+        start_warmup()
+        server = InferenceServer(workers=options['workers'], max_in_flight=options['max_in_flight'])
+
+        if options['port']:
+            address = f"127.0.0.1:{options['port']}"
+            coroutine = server.serve(port=options['port'])
+        else:
+            address = options['socket']
+            coroutine = server.serve(socket_path=options['socket'], socket_mode=options['socket_mode'])
+
+        self.stdout.write(f"🚀 Inference transport listening on {address} ({options['workers']} workers)")
+        try:
+            asyncio.run(coroutine)
+        except KeyboardInterrupt:
+            pass
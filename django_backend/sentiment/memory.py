@@ -0,0 +1,240 @@
+"""
+Memory accounting for the sentiment worker.
+
+GET /api/sentiment/memory/ reports the process RSS and the deep size of
+every large structure the app keeps: loaded models (the SVC vectorizer
+vocabulary separately from the classifier), the analyzer lexicons, the
+verdict and near-duplicate caches, rollups, sketches, the drift monitor,
+the group matcher pool and shadow candidates. Sizes are measured by walking
+each structure's references. Shared objects are counted once within a
+structure, but can show up in more than one.
+
+POST drives tracemalloc, for finding what allocates and what leaks:
+
+    {"action": "start", "frames": 1}   start tracing (slows allocation down)
+    {"action": "snapshot"}             take a snapshot; returns its id and top allocations
+    {"action": "diff", "from": 1, "to": 2}   growth between two snapshots
+    {"action": "stop"}                 stop tracing and drop the snapshots
+
+Both methods are internal: they need ``X-Profile-Request`` set to
+SENTIMENT_PROFILE_TOKEN, like request profiling. The newest
+SENTIMENT_MEMORY_MAX_SNAPSHOTS snapshots are kept.
+"""
+
+import gc
+import json
+import sys
+import threading
+import tracemalloc
+import types
+from collections import OrderedDict
+
+from django.conf import settings
+from django.http import JsonResponse
+from django.utils.decorators import method_decorator
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+
+from sentiment import model_store
+from sentiment.profiling import PROFILE_HEADER, request_profiler
+
+# Objects shared by the whole process, never counted as part of a structure
+_SHARED_TYPES = (type, types.ModuleType, types.FunctionType, types.BuiltinFunctionType, types.CodeType,
+                 types.FrameType)
+# Objects visited per structure at most; larger structures are reported as a lower bound
+MAX_OBJECTS = 5_000_000
+
+
+def deep_size(obj, max_objects=MAX_OBJECTS):
+    """``(bytes, complete)``: size of ``obj`` and everything it references"""
+    seen = set()
+    pending = [obj]
+    size = 0
+    while pending:
+        if len(seen) >= max_objects:
+            return size, False
+        current = pending.pop()
+        if id(current) in seen or isinstance(current, _SHARED_TYPES):
+            continue
+        seen.add(id(current))
+        # An ndarray's size includes its buffer only when it owns it; views
+        # (e.g. arrays unpickled from one buffer) are counted through their base
+        size += sys.getsizeof(current)
+        pending.extend(gc.get_referents(current))
+        base = getattr(current, 'base', None) if type(current).__module__ == 'numpy' else None
+        if base is not None:
+            pending.append(base)
+    return size, True
+
+
+def process_memory():
+    """Current and peak resident set size of this process, in MB"""
+    report = {}
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                key, _, value = line.partition(':')
+                if key in ('VmRSS', 'VmHWM'):
+                    report['rss_mb' if key == 'VmRSS' else 'peak_rss_mb'] = round(int(value.split()[0]) / 1024, 2)
+    except OSError:
+        import resource
+
+        # ru_maxrss is in KB on Linux and bytes on macOS
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        report['peak_rss_mb'] = round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 2)
+    return report
+
+
+def tracked_structures():
+    """Name -> object for every large structure of the app"""
+    from sentiment.drift import drift_monitor
+    from sentiment.moderation_lists import matcher_pool
+    from sentiment.near_duplicates import near_duplicate_index
+    from sentiment.rollups import rollup_store
+    from sentiment.shadow import shadow_evaluator
+    from sentiment.trending import trending_terms
+    from sentiment.verdict_store import verdict_store
+    from sentiment.views import enhanced_analyzer
+
+    structures = {}
+    for name in model_store.loaded_models():
+        model = model_store.get_model(name)
+        if name == 'svc':
+            structures['model.svc.vectorizer'], structures['model.svc.classifier'] = model
+        else:
+            structures[f'model.{name}'] = model
+    structures.update({
+        'lexicon.analyzer': enhanced_analyzer,
+        'cache.near_duplicates': near_duplicate_index,
+        'cache.verdict_store': verdict_store,
+        'cache.group_matchers': matcher_pool,
+        'aggregate.rollups': rollup_store,
+        'aggregate.trending_terms': trending_terms,
+        'aggregate.drift': drift_monitor,
+        'shadow.candidates': shadow_evaluator,
+    })
+    return structures
+
+
+def memory_report():
+    components = {}
+    for name, obj in tracked_structures().items():
+        size, complete = deep_size(obj)
+        components[name] = {'mb': round(size / (1024 * 1024), 3), 'bytes': size}
+        if not complete:
+            components[name]['lower_bound'] = True
+    return {
+        'process': process_memory(),
+        'components': dict(sorted(components.items(), key=lambda item: -item[1]['bytes'])),
+        'tracemalloc': tracer.status(),
+    }
+
+
+def format_stat(stat):
+    frame = stat.traceback[0]
+    entry = {
+        'location': f'{frame.filename}:{frame.lineno}',
+        'kb': round(stat.size / 1024, 1),
+        'count': stat.count,
+    }
+    if hasattr(stat, 'size_diff'):
+        entry['kb_diff'] = round(stat.size_diff / 1024, 1)
+        entry['count_diff'] = stat.count_diff
+    return entry
+
+
+class AllocationTracer:
+    """tracemalloc control and the last few snapshots"""
+
+    def __init__(self, max_snapshots=4):
+        self.max_snapshots = max_snapshots
+        self._snapshots = OrderedDict()
+        self._next_id = 1
+        self._lock = threading.Lock()
+
+    def status(self):
+        return {
+            'tracing': tracemalloc.is_tracing(),
+            'traced_mb': round(tracemalloc.get_traced_memory()[0] / (1024 * 1024), 3)
+            if tracemalloc.is_tracing() else None,
+            'snapshots': list(self._snapshots),
+        }
+
+    def start(self, frames=1):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(frames)
+        return self.status()
+
+    def stop(self):
+        with self._lock:
+            self._snapshots.clear()
+        tracemalloc.stop()
+        return self.status()
+
+    def snapshot(self, top=20):
+        if not tracemalloc.is_tracing():
+            raise ValueError('tracemalloc is not tracing; start it first')
+        snapshot = tracemalloc.take_snapshot().filter_traces([
+            tracemalloc.Filter(False, tracemalloc.__file__),
+        ])
+        with self._lock:
+            snapshot_id = self._next_id
+            self._next_id += 1
+            self._snapshots[snapshot_id] = snapshot
+            while len(self._snapshots) > self.max_snapshots:
+                self._snapshots.popitem(last=False)
+        return {
+            'id': snapshot_id,
+            'top': [format_stat(stat) for stat in snapshot.statistics('lineno')[:top]],
+        }
+
+    def diff(self, first, second, top=20):
+        with self._lock:
+            older, newer = self._snapshots.get(first), self._snapshots.get(second)
+        if older is None or newer is None:
+            raise ValueError(f'Unknown snapshot; kept snapshots are {list(self._snapshots)}')
+        stats = newer.compare_to(older, 'lineno')
+        return {
+            'from': first,
+            'to': second,
+            'growth_kb': round(sum(stat.size_diff for stat in stats) / 1024, 1),
+            'top': [format_stat(stat) for stat in stats[:top]],
+        }
+
+
+tracer = AllocationTracer(max_snapshots=getattr(settings, 'SENTIMENT_MEMORY_MAX_SNAPSHOTS', 4))
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+class MemoryAPIView(View):
+    """Deep sizes of the app's structures, and tracemalloc snapshots and diffs"""
+
+    def dispatch(self, request, *args, **kwargs):
+        if not request_profiler.authorized(request.headers.get(PROFILE_HEADER)):
+            return JsonResponse({
+                'success': False,
+                'error': f'Memory accounting needs a valid {PROFILE_HEADER} header'
+            }, status=403)
+        return super().dispatch(request, *args, **kwargs)
+
+    def get(self, request):
+        return JsonResponse({'success': True, 'data': memory_report()})
+
+    def post(self, request):
+        try:
+            body = json.loads(request.body or b'{}')
+            action = body.get('action')
+            top = int(body.get('top', 20))
+            if action == 'start':
+                data = tracer.start(int(body.get('frames', 1)))
+            elif action == 'snapshot':
+                data = tracer.snapshot(top)
+            elif action == 'diff':
+                data = tracer.diff(int(body['from']), int(body['to']), top)
+            elif action == 'stop':
+                data = tracer.stop()
+            else:
+                raise ValueError('Unknown action. Choose one of: start, snapshot, diff, stop')
+        except (ValueError, KeyError, TypeError, AttributeError) as e:
+            return JsonResponse({'success': False, 'error': str(e)}, status=400)
+        return JsonResponse({'success': True, 'data': data})
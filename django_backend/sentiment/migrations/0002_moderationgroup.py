@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-19 10:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sentiment', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ModerationGroup',
+            fields=[
+                ('group_id', models.CharField(max_length=128, primary_key=True, serialize=False)),
+                ('blocked', models.JSONField(default=dict)),
+                ('allowed', models.JSONField(default=list)),
+                ('version', models.PositiveIntegerField(default=1)),
+                ('updated_at', models.FloatField()),
+            ],
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Verdicts are identified by (key, model_version) instead of key alone. The
+# table only holds cached verdicts, and every key changes (it now includes the
+# version), so it is recreated rather than migrated.
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sentiment', '0002_moderationgroup'),
+    ]
+
+    operations = [
+        migrations.DeleteModel(
+            name='StoredVerdict',
+        ),
+        migrations.CreateModel(
+            name='StoredVerdict',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=64)),
+                ('model_version', models.CharField(db_index=True, max_length=16)),
+                ('verdict', models.JSONField()),
+                ('created_at', models.FloatField()),
+                ('last_used_at', models.FloatField(db_index=True)),
+                ('hits', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'constraints': [
+                    models.UniqueConstraint(fields=('key', 'model_version'), name='stored_verdict_identity'),
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,170 @@
+"""
+Process-wide model store for the sentiment service.
+
+Models are unpickled once per worker (on first use or during warm-up) instead
+of on every request. The heavy libraries behind each pickle are imported only
+when that model is actually requested, and every import and model load is
+timed so cold-start cost can be inspected through the readiness endpoint.
+"""
+
+import hashlib
+import importlib
+import os
+import pickle
+import sys
+import threading
+import time
+
+# Base directory setup
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Paths to your saved models
+NB_MODEL_PATH = os.path.join(BASE_DIR, 'Beyonder', 'nb_classifier.pkl')
+SVC_MODEL_PATH = os.path.join(BASE_DIR, 'Beyonder', 'svm_classifier.pkl')
+# Word scores derived from the NB model by Beyonder/build_lexicon.py
+EXTENDED_LEXICON_PATH = os.path.join(BASE_DIR, 'Beyonder', 'extended_lexicon.json')
+
+# Modules each pickle needs; imported (and timed) only when that model loads
+MODEL_SPECS = {
+    'nb': {
+        'path': NB_MODEL_PATH,
+        'imports': ['numpy'],
+    },
+    'svc': {
+        'path': SVC_MODEL_PATH,
+        'imports': [
+            'numpy',
+            'scipy.sparse',
+            'sklearn.feature_extraction.text',
+            'sklearn.svm',
+        ],
+    },
+}
+
+_models = {}
+_lock = threading.Lock()
+_file_hashes = {}
+
+# Cold-start measurements: seconds spent per import and per model load
+startup_timings = {
+    'imports': {},
+    'models': {},
+}
+
+
+def timed_import(module_name):
+    """Import a module, recording how long the first import took"""
+    if module_name in sys.modules:
+        return sys.modules[module_name]
+
+    started = time.perf_counter()
+    module = importlib.import_module(module_name)
+    startup_timings['imports'][module_name] = round(time.perf_counter() - started, 4)
+    return module
+
+
+def get_model(name):
+    """
+    Return the loaded model for ``name`` ('nb' or 'svc'), loading it on first use.
+
+    For 'svc' the value is the ``(tfidf_vectorizer, svm_classifier)`` pair.
+    """
+    model = _models.get(name)
+    if model is not None:
+        return model
+
+    if name not in MODEL_SPECS:
+        raise KeyError(f'Unknown model: {name}')
+
+    with _lock:
+        # Another thread may have finished loading while we waited
+        model = _models.get(name)
+        if model is not None:
+            return model
+
+        spec = MODEL_SPECS[name]
+        for module_name in spec['imports']:
+            timed_import(module_name)
+
+        started = time.perf_counter()
+        with open(spec['path'], 'rb') as f:
+            model = pickle.load(f)
+        startup_timings['models'][name] = round(time.perf_counter() - started, 4)
+
+        _models[name] = model
+        print(f"✅ {name.upper()} model loaded in {startup_timings['models'][name]}s")
+        return model
+
+
+def predict(name, text):
+    """Predict the sentiment label of a single text with the named model"""
+    return predict_with(name, get_model(name), text)
+
+
+def predict_with(name, model, text):
+    """Predict with ``model``, a loaded pickle in the format of the named model"""
+    if name == 'nb':
+        # The custom classifier expects a list of strings
+        prediction = model.predict([text])
+    else:
+        tfidf_vectorizer, svm_classifier = model
+        X_input = tfidf_vectorizer.transform([text])
+        prediction = svm_classifier.predict(X_input)
+
+    return prediction[0] if len(prediction) > 0 else None
+
+
+def is_loaded(name):
+    return name in _models
+
+
+def loaded_models():
+    """Names of the models currently held in memory"""
+    return sorted(_models)
+
+
+def file_hash(path):
+    """Short content hash of a file, computed once per worker"""
+    digest = _file_hashes.get(path)
+    if digest is None:
+        sha = hashlib.sha1()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                sha.update(block)
+        digest = _file_hashes[path] = sha.hexdigest()[:12]
+    return digest
+
+
+# Shadow candidates, loaded in the shadow evaluation processes only
+_candidates = {}
+
+
+class CandidateLoadError(Exception):
+    """A shadow candidate pickle could not be loaded"""
+
+
+def start_candidate_process():
+    """Initializer of a shadow process: yield the CPU to the serving workers"""
+    if hasattr(os, 'nice'):
+        os.nice(10)
+
+
+def predict_candidate(name, path, text):
+    """
+    ``(label, seconds, cpu_seconds)`` of one prediction by the candidate at
+    ``path``, in the format of the named model; loaded on first use
+    """
+    model = _candidates.get(name)
+    if model is None:
+        try:
+            for module_name in MODEL_SPECS[name]['imports']:
+                timed_import(module_name)
+            with open(path, 'rb') as f:
+                model = _candidates[name] = pickle.load(f)
+        except Exception as e:
+            raise CandidateLoadError(f'{type(e).__name__}: {e}') from None
+
+    cpu_started = time.thread_time()
+    started = time.perf_counter()
+    label = predict_with(name, model, text)
+    return label, time.perf_counter() - started, time.thread_time() - cpu_started
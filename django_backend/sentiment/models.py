@@ -1,3 +1,45 @@
 from django.db import models
 
-# Create your models here.
+
+class StoredVerdict(models.Model):
+    """
+    Analysis verdict persisted across workers and restarts.
+
+    Identified by (``key``, ``model_version``); the key hashes the version
+    with the endpoint namespace and normalized text. Workers on different
+    versions (during a rolling deploy) each keep their own rows and never
+    overwrite or delete each other's. Rows of retired versions stop being
+    used and expire through the TTL and the row cap.
+    """
+    key = models.CharField(max_length=64)
+    model_version = models.CharField(max_length=16, db_index=True)
+    verdict = models.JSONField()
+    created_at = models.FloatField()
+    last_used_at = models.FloatField(db_index=True)
+    hits = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['key', 'model_version'], name='stored_verdict_identity'),
+        ]
+
+    def __str__(self):
+        return f'{self.key[:12]}… ({self.model_version})'
+
+
+class ModerationGroup(models.Model):
+    """
+    A group's own moderation lists, applied on top of the global keywords.
+
+    ``blocked`` maps a toxicity category to extra words flagged in it;
+    ``allowed`` lists words never flagged in this group. ``version`` goes up
+    on every change so workers recompile their cached matcher.
+    """
+    group_id = models.CharField(max_length=128, primary_key=True)
+    blocked = models.JSONField(default=dict)
+    allowed = models.JSONField(default=list)
+    version = models.PositiveIntegerField(default=1)
+    updated_at = models.FloatField()
+
+    def __str__(self):
+        return f'{self.group_id} (v{self.version})'
@@ -0,0 +1,287 @@
+"""
+Per-group moderation lists and the pool of compiled keyword matchers.
+
+A group (community, tenant) can block extra words in any toxicity category
+and allow words the global lists would flag. The toxicity endpoint takes the
+group's ``group_id`` and matches against that group's combined matcher: one
+dict from word to categories, with the global keywords, plus the group's
+blocked words, minus its allowed words. Matching is one dict lookup per word,
+so a group costs exactly what the global lists cost, however many groups
+there are.
+
+Matchers are compiled once per group and kept in an LRU pool capped at
+``max_bytes``. Groups without lists share the global matcher. A worker
+rechecks a cached group's list version at most every ``recheck_seconds``.
+An update through this worker's API takes effect immediately. Updates made
+through other workers take effect within that interval.
+
+Lists are managed at /api/sentiment/groups/<group_id>/lists/:
+
+    PUT {"blocked": {"insult": ["noob"]}, "allowed": ["hell"]}
+
+Anyone can read a group's lists. Writes change moderation for the whole
+group, so PUT and DELETE need ``X-Moderation-Token`` set to
+SENTIMENT_GROUP_LISTS_TOKEN. Give the token only to the service that checks
+group-admin rights and forwards their changes. Without the setting, lists
+are read-only.
+"""
+
+import hmac
+import json
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db import DatabaseError, IntegrityError, transaction
+from django.db.models import F
+from django.http import JsonResponse
+from django.utils.decorators import method_decorator
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+
+from sentiment.enhanced_sentiment import WORD_TOKEN
+from sentiment.models import ModerationGroup
+
+CATEGORIES = ('profanity', 'threat', 'insult', 'identity_attack')
+WRITE_TOKEN_HEADER = 'X-Moderation-Token'
+
+
+def build_matcher(lists, base=None, allowed=()):
+    """
+    Word -> categories it counts towards, for a single-pass keyword scan
+
+    ``lists`` maps categories to words, added on top of ``base``; words in
+    ``allowed`` are dropped.
+    """
+    matcher = dict(base or {})
+    for category, words in lists.items():
+        for word in words:
+            categories = matcher.get(word, ())
+            if category not in categories:
+                matcher[word] = categories + (category,)
+    for word in allowed:
+        matcher.pop(word, None)
+    return matcher
+
+
+def matcher_size(matcher):
+    """Approximate memory held by a matcher, in bytes"""
+    # The category tuples and names are shared with the global matcher
+    return sys.getsizeof(matcher) + sum(sys.getsizeof(word) for word in matcher)
+
+
+def validate_lists(data):
+    """Normalized (blocked, allowed) lists from a request body, or raise ValueError"""
+    blocked = data.get('blocked', {})
+    allowed = data.get('allowed', [])
+    if not isinstance(blocked, dict) or not isinstance(allowed, list):
+        raise ValueError('"blocked" must map categories to word lists and "allowed" must be a word list')
+
+    unknown = set(blocked) - set(CATEGORIES)
+    if unknown:
+        raise ValueError(f'Unknown categories: {", ".join(sorted(unknown))}. Choose from: {", ".join(CATEGORIES)}')
+
+    def normalize_words(words):
+        if not isinstance(words, list):
+            raise ValueError('Word lists must be lists of strings')
+        normalized = []
+        for word in words:
+            # Keywords are matched against single lowercased words
+            word = str(word).strip().lower()
+            if not WORD_TOKEN.fullmatch(word):
+                raise ValueError(f'Not a single word: {word!r}')
+            if word not in normalized:
+                normalized.append(word)
+        return normalized
+
+    return (
+        {category: normalize_words(words) for category, words in blocked.items() if words},
+        normalize_words(allowed),
+    )
+
+
+class _PoolEntry:
+    __slots__ = ('matcher', 'version', 'size', 'checked_at')
+
+    def __init__(self, matcher, version, size, checked_at):
+        self.matcher = matcher
+        self.version = version
+        self.size = size
+        self.checked_at = checked_at
+
+
+class MatcherPool:
+    """LRU pool of compiled per-group matchers with a memory budget"""
+
+    def __init__(self, max_bytes=32 * 1024 * 1024, recheck_seconds=5.0):
+        self.max_bytes = max_bytes
+        self.recheck_seconds = recheck_seconds
+        self.enabled = True
+
+        self._entries = OrderedDict()  # group_id -> _PoolEntry, least recently used first
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.compiles = 0
+        self.evictions = 0
+
+    def _disable(self, error):
+        # A missing table (migrations not applied) or a broken database must
+        # never fail analysis requests; everyone gets the global lists
+        print(f"❌ Group moderation lists disabled: {error}")
+        self.enabled = False
+
+    def get(self, group_id, base):
+        """
+        ``(matcher, version)`` for ``group_id``; ``(base, None)`` when the
+        group has no lists of its own
+        """
+        if not group_id or not self.enabled:
+            return base, None
+
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(group_id)
+            if entry is not None and now - entry.checked_at < self.recheck_seconds:
+                self._entries.move_to_end(group_id)
+                self.hits += 1
+                return entry.matcher, entry.version
+
+        try:
+            version = ModerationGroup.objects.filter(pk=group_id).values_list('version', flat=True).first()
+            if entry is not None and entry.version == version:
+                entry.checked_at = now
+                self.hits += 1
+                return entry.matcher, entry.version
+
+            matcher = base
+            if version is not None:
+                group = ModerationGroup.objects.get(pk=group_id)
+                if group.blocked or group.allowed:
+                    matcher = build_matcher(group.blocked, base=base, allowed=group.allowed)
+                version = group.version
+        except (DatabaseError, ModerationGroup.DoesNotExist) as e:
+            if isinstance(e, DatabaseError):
+                self._disable(e)
+            return base, None
+
+        # Groups without lists only cost their pool slot
+        size = matcher_size(matcher) if matcher is not base else sys.getsizeof(group_id)
+        with self._lock:
+            self._discard(group_id)
+            self._entries[group_id] = _PoolEntry(matcher, version, size, now)
+            self._bytes += size
+            self.compiles += 1
+            while self._bytes > self.max_bytes and len(self._entries) > 1:
+                oldest = next(iter(self._entries))
+                self._discard(oldest)
+                self.evictions += 1
+        return matcher, version
+
+    def _discard(self, group_id):
+        entry = self._entries.pop(group_id, None)
+        if entry is not None:
+            self._bytes -= entry.size
+
+    def invalidate(self, group_id):
+        with self._lock:
+            self._discard(group_id)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'enabled': self.enabled,
+                'groups': len(self._entries),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'compiles': self.compiles,
+                'evictions': self.evictions,
+            }
+
+
+matcher_pool = MatcherPool(
+    max_bytes=getattr(settings, 'SENTIMENT_GROUP_MATCHER_POOL_BYTES', 32 * 1024 * 1024),
+    recheck_seconds=getattr(settings, 'SENTIMENT_GROUP_LIST_RECHECK_SECONDS', 5.0),
+)
+
+
+def replace_lists(group_id, blocked, allowed, create=False):
+    """
+    Store a group's lists under the next version and return the group
+
+    The version is incremented in the database, so concurrent writers each
+    get their own and never save different lists under the same one. A
+    missing group is created when ``create`` is set, and None otherwise.
+    """
+    with transaction.atomic():
+        changes = {'blocked': blocked, 'allowed': allowed, 'updated_at': time.time()}
+        updated = ModerationGroup.objects.filter(pk=group_id).update(version=F('version') + 1, **changes)
+        if not updated:
+            if not create:
+                return None
+            try:
+                with transaction.atomic():
+                    return ModerationGroup.objects.create(pk=group_id, **changes)
+            except IntegrityError:
+                # Created meanwhile by another writer
+                ModerationGroup.objects.filter(pk=group_id).update(version=F('version') + 1, **changes)
+        return ModerationGroup.objects.get(pk=group_id)
+
+
+def group_lists_response(group):
+    return {
+        'group_id': group.group_id,
+        'blocked': group.blocked,
+        'allowed': group.allowed,
+        'version': group.version,
+        'updated_at': group.updated_at,
+    }
+
+
+def write_authorized(token):
+    """Whether ``token`` (may be None) may change moderation lists"""
+    expected = getattr(settings, 'SENTIMENT_GROUP_LISTS_TOKEN', None)
+    return bool(token and expected and hmac.compare_digest(str(token), expected))
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+class GroupModerationListsAPIView(View):
+    """Read, replace or delete one group's moderation lists"""
+
+    def dispatch(self, request, *args, **kwargs):
+        if request.method in ('PUT', 'DELETE') and not write_authorized(request.headers.get(WRITE_TOKEN_HEADER)):
+            return JsonResponse({
+                'success': False,
+                'error': f'Changing moderation lists needs a valid {WRITE_TOKEN_HEADER} header'
+            }, status=403)
+        return super().dispatch(request, *args, **kwargs)
+
+    def get(self, request, group_id):
+        group = ModerationGroup.objects.filter(pk=group_id).first()
+        if group is None:
+            return JsonResponse({'success': False, 'error': 'This group has no custom lists'}, status=404)
+        return JsonResponse({'success': True, 'data': group_lists_response(group)})
+
+    def put(self, request, group_id):
+        try:
+            blocked, allowed = validate_lists(json.loads(request.body or b'{}'))
+        except (ValueError, AttributeError) as e:
+            return JsonResponse({'success': False, 'error': str(e)}, status=400)
+
+        group = replace_lists(group_id, blocked, allowed, create=True)
+        matcher_pool.invalidate(group_id)
+        print(f"🛡️ Moderation lists for group {group_id} updated (v{group.version})")
+        return JsonResponse({'success': True, 'data': group_lists_response(group)})
+
+    def delete(self, request, group_id):
+        # The row is kept with empty lists rather than removed, so versions
+        # never repeat and no verdict cached under the old lists is reused
+        group = replace_lists(group_id, {}, [])
+        if group is None:
+            return JsonResponse({'success': False, 'error': 'This group has no custom lists'}, status=404)
+        matcher_pool.invalidate(group_id)
+        return JsonResponse({'success': True, 'data': group_lists_response(group)})
@@ -0,0 +1,263 @@
+"""
+Near-duplicate index for spam and raid floods.
+
+Floods arrive as thousands of copies of one message with small case, emoji or
+punctuation changes. Messages that normalize to the same text share a verdict
+exactly; longer messages are also fingerprinted with a MinHash over the
+character 4-grams of their normalized text, and later messages whose estimated
+Jaccard similarity clears ``min_similarity`` reuse the stored verdict instead
+of running the full pipeline. Texts longer than ``max_length`` are not
+fingerprinted, as hashing every shingle would cost more than the analysis it
+saves; they still match exactly. Lookups touch only a handful of LSH buckets,
+memory is capped by ``max_entries`` and entries expire after ``ttl_seconds``.
+
+Fingerprints use Python's per-process string hash, so they are only
+meaningful inside one worker (which is all this in-memory index needs).
+"""
+
+import math
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+
+SHINGLE_SIZE = 4
+NUM_PERMUTATIONS = 64
+_MASK = (1 << 64) - 1
+
+# Same character class the analyzers strip, so texts that normalize equally
+# always produce the same verdict
+_PUNCTUATION = re.compile(r"[^\w\s']")
+
+_permutations = None
+
+
+def normalize(text):
+    """Lowercase, drop punctuation and emoji, and collapse whitespace"""
+    return ' '.join(_PUNCTUATION.sub(' ', text.lower()).split())
+
+
+def _get_permutations():
+    # numpy is only needed once the first long message is fingerprinted
+    global _permutations
+    if _permutations is None:
+        import numpy as np
+        rng = np.random.default_rng(20240101)
+        a = rng.integers(1, 2 ** 63, NUM_PERMUTATIONS, dtype=np.uint64) | np.uint64(1)
+        b = rng.integers(0, 2 ** 63, NUM_PERMUTATIONS, dtype=np.uint64)
+        _permutations = (np, a[:, None], b[:, None])
+    return _permutations
+
+
+def minhash(normalized):
+    """MinHash signature (tuple of ints) over the character 4-grams of a normalized text"""
+    np, a, b = _get_permutations()
+    shingles = {normalized[i:i + SHINGLE_SIZE] for i in range(max(len(normalized) - SHINGLE_SIZE + 1, 1))}
+    hashes = np.fromiter((hash(shingle) & _MASK for shingle in shingles), dtype=np.uint64, count=len(shingles))
+    # Multiply-shift hashing: uint64 arithmetic wraps, the top 32 bits are kept
+    with np.errstate(over='ignore'):
+        permuted = (a * hashes + b) >> np.uint64(32)
+    return tuple(permuted.min(axis=1).tolist())
+
+
+class _Entry:
+    __slots__ = ('entry_id', 'namespace', 'normalized', 'signature', 'fingerprint',
+                 'verdict', 'created_at', 'flood_count', 'flood_updated', 'hits')
+
+    def __init__(self, entry_id, namespace, normalized, signature, fingerprint, verdict, now):
+        self.entry_id = entry_id
+        self.namespace = namespace
+        self.normalized = normalized
+        self.signature = signature
+        self.fingerprint = fingerprint
+        self.verdict = verdict
+        self.created_at = now
+        self.flood_count = 1.0
+        self.flood_updated = now
+        self.hits = 0
+
+
+class NearDuplicateMatch:
+    """A stored verdict reused for a near-duplicate message"""
+
+    __slots__ = ('entry_id', 'verdict', 'similarity', 'flood_score', 'hits')
+
+    def __init__(self, entry_id, verdict, similarity, flood_score, hits):
+        self.entry_id = entry_id
+        self.verdict = verdict
+        self.similarity = similarity
+        self.flood_score = flood_score
+        self.hits = hits
+
+    def reference(self):
+        """Fields added to a response served from the index"""
+        return {
+            'near_duplicate_of': self.entry_id,
+            'flood_score': self.flood_score,
+        }
+
+
+class NearDuplicateIndex:
+    """
+    Bounded MinHash-LSH index of recent verdicts.
+
+    Fingerprints are split into ``bands`` bands; two messages become
+    candidates when any band matches exactly, and a candidate is accepted once
+    the fraction of equal MinHash values (the Jaccard estimate) reaches
+    ``min_similarity``. A lookup therefore only checks the entries in a few
+    buckets, whatever the size of the index.
+
+    Fuzzy matches must also carry the same ``signature`` - the caller's list
+    of verdict-relevant tokens - so a near-identical text that adds a "not" or
+    a slur never inherits the verdict of the text without it.
+
+    Each stored entry is the head of a cluster. Every reuse adds to the
+    cluster's exponentially decayed hit count, and ``flood_score`` (0-1) is
+    that count relative to ``flood_threshold``.
+    """
+
+    def __init__(self, max_entries=50000, ttl_seconds=600, min_similarity=0.8,
+                 min_length=24, max_length=4096, bands=16, flood_half_life=60, flood_threshold=50):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.min_similarity = min_similarity
+        self.min_length = min_length
+        self.max_length = max_length
+        self.bands = bands
+        self.rows = NUM_PERMUTATIONS // bands
+        self.flood_half_life = flood_half_life
+        self.flood_threshold = flood_threshold
+
+        self._entries = OrderedDict()  # entry_id -> _Entry, oldest first
+        self._exact = {}               # (namespace, normalized) -> entry_id
+        self._buckets = {}             # (namespace, band, rows) -> set of entry_ids
+        self._next_id = 1
+        self._lock = threading.Lock()
+
+        self.lookups = 0
+        self.exact_hits = 0
+        self.near_hits = 0
+
+    def _band_keys(self, namespace, fingerprint):
+        rows = self.rows
+        return [
+            (namespace, band, fingerprint[band * rows:(band + 1) * rows])
+            for band in range(self.bands)
+        ]
+
+    def _fingerprint(self, normalized):
+        # Short messages only match exactly: a one-word change is too large a
+        # share of them to ignore
+        if len(normalized) < self.min_length or len(normalized) > self.max_length:
+            return None
+        return minhash(normalized)
+
+    def _expire(self, now):
+        while self._entries:
+            entry = next(iter(self._entries.values()))
+            if len(self._entries) <= self.max_entries and now - entry.created_at <= self.ttl_seconds:
+                break
+            self._remove(entry)
+
+    def _remove(self, entry):
+        del self._entries[entry.entry_id]
+        if self._exact.get((entry.namespace, entry.normalized)) == entry.entry_id:
+            del self._exact[(entry.namespace, entry.normalized)]
+        if entry.fingerprint is not None:
+            for key in self._band_keys(entry.namespace, entry.fingerprint):
+                bucket = self._buckets.get(key)
+                if bucket is not None:
+                    bucket.discard(entry.entry_id)
+                    if not bucket:
+                        del self._buckets[key]
+
+    def _hit(self, entry, similarity, now):
+        decay = math.exp(-(now - entry.flood_updated) * math.log(2) / self.flood_half_life)
+        entry.flood_count = entry.flood_count * decay + 1.0
+        entry.flood_updated = now
+        entry.hits += 1
+        flood_score = round(min(entry.flood_count / self.flood_threshold, 1.0), 4)
+        return NearDuplicateMatch(entry.entry_id, entry.verdict, similarity, flood_score, entry.hits)
+
+    def lookup(self, namespace, text, signature=(), now=None):
+        """Return a NearDuplicateMatch for ``text`` or None"""
+        now = time.time() if now is None else now
+        normalized = normalize(text)
+
+        with self._lock:
+            self.lookups += 1
+            self._expire(now)
+
+            entry_id = self._exact.get((namespace, normalized))
+            if entry_id is not None:
+                self.exact_hits += 1
+                return self._hit(self._entries[entry_id], 1.0, now)
+
+        fingerprint = self._fingerprint(normalized)
+        if fingerprint is None:
+            return None
+
+        with self._lock:
+            best_similarity, best_entry = 0.0, None
+            seen = set()
+            for key in self._band_keys(namespace, fingerprint):
+                for candidate_id in self._buckets.get(key, ()):
+                    if candidate_id in seen:
+                        continue
+                    seen.add(candidate_id)
+                    candidate = self._entries[candidate_id]
+                    if candidate.signature != signature:
+                        continue
+                    similarity = sum(x == y for x, y in zip(candidate.fingerprint, fingerprint)) / NUM_PERMUTATIONS
+                    if similarity > best_similarity:
+                        best_similarity, best_entry = similarity, candidate
+
+            if best_entry is None or best_similarity < self.min_similarity:
+                return None
+            self.near_hits += 1
+            return self._hit(best_entry, round(best_similarity, 4), now)
+
+    def add(self, namespace, text, verdict, signature=(), now=None):
+        """Store the verdict computed for ``text``; returns its entry ID"""
+        now = time.time() if now is None else now
+        normalized = normalize(text)
+        fingerprint = self._fingerprint(normalized)
+
+        with self._lock:
+            existing = self._exact.get((namespace, normalized))
+            if existing is not None:
+                return existing
+
+            entry = _Entry(self._next_id, namespace, normalized, tuple(signature), fingerprint, verdict, now)
+            self._next_id += 1
+            self._entries[entry.entry_id] = entry
+            self._exact[(namespace, normalized)] = entry.entry_id
+            if fingerprint is not None:
+                for key in self._band_keys(namespace, fingerprint):
+                    self._buckets.setdefault(key, set()).add(entry.entry_id)
+            self._expire(now)
+            return entry.entry_id
+
+    def stats(self):
+        return {
+            'entries': len(self._entries),
+            'lookups': self.lookups,
+            'exact_hits': self.exact_hits,
+            'near_hits': self.near_hits,
+        }
+
+    def __len__(self):
+        return len(self._entries)
+
+
+near_duplicate_index = NearDuplicateIndex(
+    max_entries=getattr(settings, 'SENTIMENT_NEAR_DUP_MAX_ENTRIES', 50000),
+    ttl_seconds=getattr(settings, 'SENTIMENT_NEAR_DUP_TTL_SECONDS', 600),
+    min_similarity=getattr(settings, 'SENTIMENT_NEAR_DUP_MIN_SIMILARITY', 0.8),
+    min_length=getattr(settings, 'SENTIMENT_NEAR_DUP_MIN_LENGTH', 24),
+    max_length=getattr(settings, 'SENTIMENT_NEAR_DUP_MAX_LENGTH', 4096),
+    flood_half_life=getattr(settings, 'SENTIMENT_NEAR_DUP_FLOOD_HALF_LIFE', 60),
+    flood_threshold=getattr(settings, 'SENTIMENT_NEAR_DUP_FLOOD_THRESHOLD', 50),
+)
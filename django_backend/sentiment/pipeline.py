@@ -0,0 +1,78 @@
+"""
+Demand-driven analysis pipeline.
+
+An analysis is a small graph of named stages. Each stage computes one output
+from the text and from the outputs of other stages. A caller asks for the
+fields it needs, and an AnalysisRun computes a stage only when a requested
+field depends on it, at most once per text:
+
+    run = pipeline.run(text, ['toxicity'], deadline=deadline, use_ml=True)
+    run.outputs()   # {'toxicity': {...}}
+    run.executed    # ['keywords', 'toxicity']; no sentiment work for clean text
+
+Dependencies every evaluation needs are declared with ``requires``. A stage
+that only sometimes needs another (the toxicity boost needs sentiment only
+when keywords were found) calls ``run.get()`` itself, so the other stage runs
+only on that path.
+"""
+
+from sentiment.deadlines import Deadline
+
+
+class Stage:
+    def __init__(self, name, compute, requires=()):
+        self.name = name
+        self.compute = compute
+        self.requires = tuple(requires)
+
+
+class Pipeline:
+    """Stages by name; ``fields`` are the stage outputs callers may request"""
+
+    def __init__(self, stages, fields):
+        self.stages = {stage.name: stage for stage in stages}
+        self.fields = tuple(fields)
+        unknown = set(self.fields).union(*(stage.requires for stage in stages)) - set(self.stages)
+        if unknown:
+            raise ValueError(f'No stage produces: {", ".join(sorted(unknown))}')
+
+    def run(self, text, fields, deadline=None, **options):
+        return AnalysisRun(self, text, fields, deadline, options)
+
+
+class AnalysisRun:
+    """
+    One text's evaluation; stages run on first use and their outputs are kept
+
+    ``degraded`` is set by stages that fell back because a model shed the
+    request; stages skipped for time are on ``deadline.skipped``.
+    """
+
+    def __init__(self, pipeline, text, fields, deadline=None, options=None):
+        unknown = set(fields) - set(pipeline.fields)
+        if unknown:
+            raise ValueError(f'Unknown fields: {", ".join(sorted(unknown))}')
+        self.pipeline = pipeline
+        self.text = text
+        # Requested fields, in the pipeline's order
+        self.fields = tuple(field for field in pipeline.fields if field in fields)
+        self.deadline = deadline or Deadline()
+        self.options = options or {}
+        self.degraded = False
+        self.executed = []
+        self._outputs = {}
+
+    def wants(self, field):
+        return field in self.fields
+
+    def get(self, name):
+        if name not in self._outputs:
+            stage = self.pipeline.stages[name]
+            for dependency in stage.requires:
+                self.get(dependency)
+            self._outputs[name] = stage.compute(self)
+            self.executed.append(name)
+        return self._outputs[name]
+
+    def outputs(self):
+        return {field: self.get(field) for field in self.fields}
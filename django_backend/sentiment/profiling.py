@@ -0,0 +1,194 @@
+"""
+On-demand sampling profiler for individual analysis requests.
+
+A request to /api/sentiment/ is profiled in either of two cases:
+- it carries ``X-Profile-Request`` equal to SENTIMENT_PROFILE_TOKEN;
+- it is drawn at SENTIMENT_PROFILE_SAMPLE_RATE.
+
+A socket transport frame is profiled in the same cases, with the token
+sent as a ``profile`` field. While a profiled request is handled, a sampler
+thread reads the handling thread's stack every SENTIMENT_PROFILE_INTERVAL
+seconds. The request itself runs unmodified, and so does the process: the
+GIL switch interval is left alone, as it applies to every thread. A
+CPU-bound request therefore keeps the sampler waiting for up to
+``sys.getswitchinterval()`` (5ms by default) per sample; stacks are still
+sampled in proportion to time spent, only fewer of them, and the achieved
+interval is logged. The samples are written in collapsed-stack format, one
+``root;...;leaf count`` line per distinct stack:
+
+    flamegraph.pl profiles/<file>.folded > request.svg    (or speedscope)
+
+Files go to SENTIMENT_PROFILE_DIR. Only the newest
+SENTIMENT_PROFILE_MAX_FILES are kept. A profiled HTTP response names its
+file in ``X-Profile-File``.
+
+With no token and a zero rate, the middleware removes itself at startup
+(MiddlewareNotUsed) and frames skip a single flag check, so profiling costs
+nothing unless it is switched on.
+"""
+
+import hmac
+import logging
+import os
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager, nullcontext
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+
+logger = logging.getLogger(__name__)
+
+PROFILE_HEADER = 'X-Profile-Request'
+PROFILE_FILE_HEADER = 'X-Profile-File'
+# Only the analysis API is profiled
+PROFILED_PATH_PREFIX = '/api/sentiment/'
+# Sampling stops after this long, however long the request takes
+MAX_PROFILE_SECONDS = 30.0
+_UNSAFE = re.compile(r'[^\w.-]+')
+
+
+def frame_label(frame):
+    code = frame.f_code
+    return f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})'
+
+
+class StackSampler:
+    """Samples one thread's stack on a background thread until stopped"""
+
+    def __init__(self, thread_id, interval):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='request-profiler', daemon=True)
+
+    def start(self):
+        self.started = time.perf_counter()
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self.elapsed = time.perf_counter() - self.started
+
+    def _run(self):
+        deadline = time.perf_counter() + MAX_PROFILE_SECONDS
+        while not self._stop.wait(self.interval) and time.perf_counter() < deadline:
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                break
+            labels = []
+            while frame is not None:
+                labels.append(frame_label(frame))
+                frame = frame.f_back
+            self.stacks[';'.join(reversed(labels))] += 1
+            self.samples += 1
+
+
+class RequestProfiler:
+    def __init__(self, token=None, sample_rate=0.0, interval=0.002, directory=None, max_files=100):
+        self.token = token
+        self.sample_rate = sample_rate
+        self.interval = interval
+        self.directory = directory
+        self.max_files = max_files
+        self.enabled = bool(directory) and (bool(token) or sample_rate > 0)
+        self._lock = threading.Lock()
+
+    def authorized(self, token):
+        """Whether ``token`` (may be None) is the configured profiling token"""
+        return bool(token and self.token and hmac.compare_digest(str(token), self.token))
+
+    def selected(self, token=None):
+        """Whether to profile a request presenting ``token`` (may be None)"""
+        if self.authorized(token):
+            return True
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    @contextmanager
+    def profile(self, label):
+        """
+        Sample the current thread while the block runs; yields a dict whose
+        ``file`` is set to the profile's file name afterwards
+        """
+        sampler = StackSampler(threading.get_ident(), self.interval)
+        result = {'file': None}
+        sampler.start()
+        try:
+            yield result
+        finally:
+            sampler.stop()
+            try:
+                result['file'] = self.write(label, sampler)
+            except OSError as e:
+                logger.warning('Request profile not written: %s', e)
+
+    def maybe_profile(self, label, token=None):
+        """``profile(label)`` for selected requests, a no-op context otherwise"""
+        if self.enabled and self.selected(token):
+            return self.profile(label)
+        return nullcontext({'file': None})
+
+    def write(self, label, sampler):
+        os.makedirs(self.directory, exist_ok=True)
+        name = '{}-{}-{:.0f}ms-{}.folded'.format(
+            time.strftime('%Y%m%dT%H%M%S'), _UNSAFE.sub('_', label).strip('_')[:80],
+            sampler.elapsed * 1000, threading.get_ident()
+        )
+        path = os.path.join(self.directory, name)
+        with open(path, 'w', encoding='utf-8') as f:
+            for stack, count in sampler.stacks.most_common():
+                f.write(f'{stack} {count}\n')
+        achieved = sampler.elapsed / sampler.samples * 1000 if sampler.samples else None
+        logger.debug('Profiled %s: %d samples in %.1fms (every %sms) -> %s', label, sampler.samples,
+                     sampler.elapsed * 1000, f'{achieved:.1f}' if achieved else '-', path)
+        self._rotate()
+        return name
+
+    def _rotate(self):
+        with self._lock:
+            files = sorted(
+                (entry for entry in os.scandir(self.directory) if entry.name.endswith('.folded')),
+                key=lambda entry: entry.stat().st_mtime,
+            )
+            for entry in files[:max(len(files) - self.max_files, 0)]:
+                try:
+                    os.unlink(entry.path)
+                except FileNotFoundError:
+                    pass
+
+
+request_profiler = RequestProfiler(
+    token=getattr(settings, 'SENTIMENT_PROFILE_TOKEN', None),
+    sample_rate=getattr(settings, 'SENTIMENT_PROFILE_SAMPLE_RATE', 0.0),
+    interval=getattr(settings, 'SENTIMENT_PROFILE_INTERVAL', 0.002),
+    directory=getattr(settings, 'SENTIMENT_PROFILE_DIR', None),
+    max_files=getattr(settings, 'SENTIMENT_PROFILE_MAX_FILES', 100),
+)
+
+
+class RequestProfilingMiddleware:
+    """Profiles selected /api/sentiment/ requests from the first middleware on"""
+
+    def __init__(self, get_response):
+        if not request_profiler.enabled:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not request.path.startswith(PROFILED_PATH_PREFIX) or not request_profiler.selected(
+            request.headers.get(PROFILE_HEADER)
+        ):
+            return self.get_response(request)
+
+        with request_profiler.profile(f'{request.method} {request.path}') as profile:
+            response = self.get_response(request)
+        if profile['file']:
+            response[PROFILE_FILE_HEADER] = profile['file']
+        return response
@@ -0,0 +1,121 @@
+"""
+Warm-up and readiness probe for the sentiment service.
+
+A worker only reports ready once the configured models are loaded and every
+analysis path has run at least once, so rolling deploys never route traffic
+to a cold worker.
+"""
+
+import threading
+import time
+import traceback
+
+from django.conf import settings
+from django.http import JsonResponse
+from django.views import View
+
+from sentiment import model_store, near_duplicates
+
+WARMUP_TEXTS = [
+    "you are not good",
+    "this is really great",
+]
+
+_ready = threading.Event()
+_started = threading.Event()
+_state = {
+    'status': 'cold',
+    'started_at': None,
+    'duration': None,
+    'errors': [],
+}
+
+
+def warm_up(models=None):
+    """
+    Load the configured models and run each analysis path once.
+
+    Failures are recorded but do not block readiness: a model that cannot be
+    loaded fails the same way on first use, with or without warm-up.
+    """
+    from sentiment.views import ToxicityAPIView, enhanced_analyzer
+    from sentiment.verdict_store import verdict_store
+
+    if models is None:
+        models = getattr(settings, 'SENTIMENT_WARMUP_MODELS', list(model_store.MODEL_SPECS))
+
+    _state['status'] = 'warming'
+    _state['started_at'] = time.time()
+    started = time.perf_counter()
+
+    for name in models:
+        try:
+            for text in WARMUP_TEXTS:
+                model_store.predict(name, text)
+        except Exception as e:
+            print(f"❌ Warm-up failed for {name} model: {e}")
+            traceback.print_exc()
+            _state['errors'].append({'model': name, 'error': str(e)})
+
+    try:
+        # Hash the model files for the verdict store once, off the request path
+        verdict_store.version
+        toxicity_view = ToxicityAPIView()
+        for text in WARMUP_TEXTS:
+            enhanced_analyzer.analyze_sentiment(text)
+            # Kept out of the drift baseline, which should only see real traffic
+            toxicity_view.analyze_toxicity_with_ml(text, observe=False)
+            near_duplicates.minhash(near_duplicates.normalize(text))
+    except Exception as e:
+        print(f"❌ Warm-up failed for enhanced analyzer: {e}")
+        traceback.print_exc()
+        _state['errors'].append({'model': 'enhanced', 'error': str(e)})
+
+    _state['duration'] = round(time.perf_counter() - started, 4)
+    _state['status'] = 'ready'
+    _ready.set()
+    print(f"🔥 Sentiment service warmed up in {_state['duration']}s")
+
+
+def start_warmup():
+    """
+    Start warm-up according to ``settings.SENTIMENT_WARMUP``.
+
+    'background' warms in a daemon thread, 'blocking' warms before returning
+    and 'off' marks the worker ready immediately and loads models lazily.
+    """
+    if _started.is_set():
+        return
+    _started.set()
+
+    mode = getattr(settings, 'SENTIMENT_WARMUP', 'background')
+    if mode == 'off':
+        _state['status'] = 'ready'
+        _ready.set()
+    elif mode == 'blocking':
+        warm_up()
+    else:
+        threading.Thread(target=warm_up, name='sentiment-warmup', daemon=True).start()
+
+
+def is_ready():
+    return _ready.is_set()
+
+
+def readiness_report():
+    return {
+        'ready': is_ready(),
+        'status': _state['status'],
+        'warmup_seconds': _state['duration'],
+        'errors': _state['errors'],
+        'loaded_models': model_store.loaded_models(),
+        'startup_timings': model_store.startup_timings,
+    }
+
+
+class ReadinessAPIView(View):
+    """Readiness probe: 200 once warm-up has finished, 503 until then"""
+
+    def get(self, request):
+        report = readiness_report()
+        return JsonResponse(report, status=200 if report['ready'] else 503)
@@ -0,0 +1,226 @@
+"""
+Incremental per-conversation sentiment and toxicity rollups.
+
+Every analyzed message updates a small fixed-size aggregate keyed by its
+``conversation_id``, so "mood of this group" queries never re-scan message
+history. Updates and queries are O(1); idle conversations are evicted to keep
+memory bounded.
+
+A rollup describes private conversations, so reading one needs
+``X-Rollup-Token`` set to SENTIMENT_ROLLUP_TOKEN. Give the token only to the
+service that checks the caller may see the conversation. Without the
+setting, rollups are not served.
+"""
+
+import hmac
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.http import JsonResponse
+from django.views import View
+
+SENTIMENT_CLASSES = ('positive', 'negative', 'neutral')
+READ_TOKEN_HEADER = 'X-Rollup-Token'
+
+
+class ConversationRollup:
+    """Running aggregates for one conversation"""
+
+    __slots__ = (
+        'bucket_seconds', 'alpha', 'counts', 'toxicity_checks', 'toxic_count',
+        'ewma_score', 'ewma_toxicity', 'buckets', 'last_seen',
+    )
+
+    def __init__(self, bucket_seconds, bucket_count, alpha):
+        self.bucket_seconds = bucket_seconds
+        self.alpha = alpha
+        self.counts = dict.fromkeys(SENTIMENT_CLASSES, 0)
+        self.toxicity_checks = 0
+        self.toxic_count = 0
+        self.ewma_score = None
+        self.ewma_toxicity = None
+        # Ring of [bucket_start, messages, score_sum, toxicity_checks, toxic]
+        self.buckets = [[None, 0, 0.0, 0, 0] for _ in range(bucket_count)]
+        self.last_seen = 0.0
+
+    def _bucket(self, now):
+        start = int(now // self.bucket_seconds) * self.bucket_seconds
+        bucket = self.buckets[(start // self.bucket_seconds) % len(self.buckets)]
+        if bucket[0] != start:
+            # Slot last used a full ring ago: reset it for the current bucket
+            bucket[:] = [start, 0, 0.0, 0, 0]
+        return bucket
+
+    def _ewma(self, previous, value):
+        if previous is None:
+            return value
+        return self.alpha * value + (1 - self.alpha) * previous
+
+    def observe_sentiment(self, sentiment, score, now):
+        if sentiment in self.counts:
+            self.counts[sentiment] += 1
+        self.ewma_score = self._ewma(self.ewma_score, score)
+        bucket = self._bucket(now)
+        bucket[1] += 1
+        bucket[2] += score
+        self.last_seen = now
+
+    def observe_toxicity(self, is_toxic, toxicity_score, now):
+        self.toxicity_checks += 1
+        if is_toxic:
+            self.toxic_count += 1
+        self.ewma_toxicity = self._ewma(self.ewma_toxicity, toxicity_score)
+        bucket = self._bucket(now)
+        bucket[3] += 1
+        if is_toxic:
+            bucket[4] += 1
+        self.last_seen = now
+
+    def snapshot(self, now):
+        oldest = now - self.bucket_seconds * len(self.buckets)
+        timeline = []
+        for start, messages, score_sum, checks, toxic in sorted(
+            (b for b in self.buckets if b[0] is not None and b[0] > oldest),
+            key=lambda b: b[0],
+        ):
+            timeline.append({
+                'bucket_start': start,
+                'messages': messages,
+                'average_score': round(score_sum / messages, 4) if messages else None,
+                'toxicity_checks': checks,
+                'toxicity_rate': round(toxic / checks, 4) if checks else None,
+            })
+
+        total = sum(self.counts.values())
+        if total:
+            mood = max(self.counts, key=self.counts.get)
+        else:
+            mood = 'neutral'
+
+        return {
+            'messages': total,
+            'sentiment_counts': dict(self.counts),
+            'mood': mood,
+            'ewma_score': round(self.ewma_score, 4) if self.ewma_score is not None else None,
+            'toxicity_checks': self.toxicity_checks,
+            'toxic_messages': self.toxic_count,
+            'toxicity_rate': round(self.toxic_count / self.toxicity_checks, 4) if self.toxicity_checks else 0.0,
+            'ewma_toxicity': round(self.ewma_toxicity, 4) if self.ewma_toxicity is not None else None,
+            'timeline': timeline,
+            'last_seen': self.last_seen,
+        }
+
+
+class RollupStore:
+    """
+    Bounded map of conversation ID -> ConversationRollup.
+
+    Keys are kept in least-recently-updated order, so idle conversations sit
+    at the front and are evicted in O(1) when they exceed ``idle_seconds`` or
+    when the store grows past ``max_keys``.
+    """
+
+    def __init__(self, max_keys=10000, idle_seconds=86400, bucket_seconds=3600,
+                 bucket_count=24, alpha=0.1):
+        self.max_keys = max_keys
+        self.idle_seconds = idle_seconds
+        self.bucket_seconds = bucket_seconds
+        self.bucket_count = bucket_count
+        self.alpha = alpha
+        self._rollups = OrderedDict()
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def _touch(self, key, now):
+        rollup = self._rollups.get(key)
+        if rollup is None:
+            rollup = ConversationRollup(self.bucket_seconds, self.bucket_count, self.alpha)
+            self._rollups[key] = rollup
+        else:
+            self._rollups.move_to_end(key)
+        rollup.last_seen = now
+        self._evict(now)
+        return rollup
+
+    def _evict(self, now):
+        while self._rollups:
+            oldest_key, oldest = next(iter(self._rollups.items()))
+            if len(self._rollups) > self.max_keys or now - oldest.last_seen > self.idle_seconds:
+                del self._rollups[oldest_key]
+                self.evictions += 1
+            else:
+                break
+
+    def observe_sentiment(self, key, sentiment, score, now=None):
+        now = time.time() if now is None else now
+        with self._lock:
+            self._touch(key, now).observe_sentiment(sentiment, score, now)
+
+    def observe_toxicity(self, key, is_toxic, toxicity_score, now=None):
+        now = time.time() if now is None else now
+        with self._lock:
+            self._touch(key, now).observe_toxicity(is_toxic, toxicity_score, now)
+
+    def snapshot(self, key, now=None):
+        now = time.time() if now is None else now
+        with self._lock:
+            rollup = self._rollups.get(key)
+            if rollup is None or now - rollup.last_seen > self.idle_seconds:
+                return None
+            return rollup.snapshot(now)
+
+    def __len__(self):
+        return len(self._rollups)
+
+
+rollup_store = RollupStore(
+    max_keys=getattr(settings, 'SENTIMENT_ROLLUP_MAX_KEYS', 10000),
+    idle_seconds=getattr(settings, 'SENTIMENT_ROLLUP_IDLE_SECONDS', 86400),
+    bucket_seconds=getattr(settings, 'SENTIMENT_ROLLUP_BUCKET_SECONDS', 3600),
+    bucket_count=getattr(settings, 'SENTIMENT_ROLLUP_BUCKETS', 24),
+    alpha=getattr(settings, 'SENTIMENT_ROLLUP_EWMA_ALPHA', 0.1),
+)
+
+
+def conversation_key(data):
+    """
+    Conversation ID sent with an analysis request, if any. ``group_id`` only
+    selects moderation lists: a group holds many conversations, and mixing
+    them into one rollup would misreport each conversation's mood.
+    """
+    key = data.get('conversation_id')
+    return str(key) if key else None
+
+
+def read_authorized(token):
+    """Whether ``token`` (may be None) may read conversation rollups"""
+    expected = getattr(settings, 'SENTIMENT_ROLLUP_TOKEN', None)
+    return bool(token and expected and hmac.compare_digest(str(token), expected))
+
+
+class ConversationRollupAPIView(View):
+    """Current mood and toxicity aggregates of one conversation"""
+
+    def dispatch(self, request, *args, **kwargs):
+        if not read_authorized(request.headers.get(READ_TOKEN_HEADER)):
+            return JsonResponse({
+                'success': False,
+                'error': f'Conversation rollups need a valid {READ_TOKEN_HEADER} header'
+            }, status=403)
+        return super().dispatch(request, *args, **kwargs)
+
+    def get(self, request, conversation_id):
+        snapshot = rollup_store.snapshot(conversation_id)
+        if snapshot is None:
+            return JsonResponse({
+                'success': False,
+                'error': 'No recent activity for this conversation'
+            }, status=404)
+
+        return JsonResponse({
+            'success': True,
+            'conversation_id': conversation_id,
+            'data': snapshot
+        })
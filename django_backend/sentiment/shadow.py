@@ -0,0 +1,232 @@
+"""
+Shadow evaluation of candidate models on live traffic.
+
+A candidate pickle (same format as the serving model's) is configured per
+serving model in SENTIMENT_SHADOW_CANDIDATES. For a SAMPLE_RATE share of
+that model's live predictions, the input and the serving label are kept
+aside. They are handed to a background worker only once the response has
+been sent: on Django's request_finished signal, or after the frame is
+written on the socket transport. The worker scores the same input with the
+candidate and records whether the two agree, the confusion between their
+labels and both latencies. Users only ever see the serving model.
+
+The request path only draws a random number and appends to a list. Queued
+jobs beyond MAX_QUEUE are dropped, never waited for. Candidates are loaded
+and run in WORKERS separate processes, started at a lower scheduling
+priority, so their predictions never hold the serving process's GIL; the
+serving process keeps one thread per worker that hands jobs over and
+waits. Their CPU use is capped by a duty cycle, not a hard limit: after
+each job, the worker idles long enough that the CPU time the candidate
+used stays within CPU_SHARE of one core, split across WORKERS. A shadow
+backlog therefore slows the trial, never the service.
+
+Results are served at /api/sentiment/shadow/.
+"""
+
+import logging
+import multiprocessing
+import queue
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.core.signals import request_finished
+from django.http import JsonResponse
+from django.views import View
+
+from sentiment import model_store
+
+logger = logging.getLogger(__name__)
+
+# Serving and candidate latencies kept per model for the percentiles
+LATENCY_WINDOW = 1000
+# Shadow jobs one request may queue
+MAX_JOBS_PER_REQUEST = 8
+
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+class ShadowStats:
+    """Agreement and latency of one candidate against its serving model"""
+
+    def __init__(self, path):
+        self.path = str(path)
+        self.compared = 0
+        self.agreed = 0
+        self.errors = 0
+        self.load_error = None
+        self.confusion = {}  # 'serving->candidate' -> count, disagreements only
+        self.serving_ms = deque(maxlen=LATENCY_WINDOW)
+        self.candidate_ms = deque(maxlen=LATENCY_WINDOW)
+
+    def record(self, serving_label, candidate_label, serving_seconds, candidate_seconds):
+        self.compared += 1
+        if candidate_label == serving_label:
+            self.agreed += 1
+        else:
+            pair = f'{serving_label}->{candidate_label}'
+            self.confusion[pair] = self.confusion.get(pair, 0) + 1
+        self.serving_ms.append(serving_seconds * 1000)
+        self.candidate_ms.append(candidate_seconds * 1000)
+
+    def report(self):
+        def latency(values):
+            return {
+                'p50_ms': round(percentile(values, 0.5), 4) if values else None,
+                'p99_ms': round(percentile(values, 0.99), 4) if values else None,
+            }
+
+        return {
+            'candidate': self.path,
+            'compared': self.compared,
+            'agreement_rate': round(self.agreed / self.compared, 4) if self.compared else None,
+            'disagreements': dict(sorted(self.confusion.items(), key=lambda item: -item[1])),
+            'errors': self.errors,
+            'load_error': self.load_error,
+            'serving_latency': latency(list(self.serving_ms)),
+            'candidate_latency': latency(list(self.candidate_ms)),
+        }
+
+
+class ShadowEvaluator:
+    def __init__(self, candidates=None, sample_rate=0.05, max_queue=256, workers=1, cpu_share=0.1):
+        self.candidates = {name: path for name, path in (candidates or {}).items() if path}
+        self.sample_rate = sample_rate
+        self.workers = workers
+        # Share of one core each worker may use
+        self.worker_share = cpu_share / max(workers, 1)
+
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._pending = threading.local()
+        self._lock = threading.Lock()
+        self._threads = []
+        self._pool = None
+
+        self.stats = {name: ShadowStats(path) for name, path in self.candidates.items()}
+        self.sampled = 0
+        self.dropped = 0
+        self.cpu_seconds = 0.0
+        self.throttled_seconds = 0.0
+
+    @property
+    def enabled(self):
+        return bool(self.candidates) and self.sample_rate > 0
+
+    def record(self, name, text, label, serving_seconds):
+        """Keep a serving prediction aside for shadowing; called on the request path"""
+        if name not in self.candidates or random.random() >= self.sample_rate:
+            return
+        jobs = getattr(self._pending, 'jobs', None)
+        if jobs is None:
+            jobs = self._pending.jobs = []
+        if len(jobs) < MAX_JOBS_PER_REQUEST:
+            jobs.append((name, text, label, serving_seconds))
+
+    def take_pending(self):
+        """Jobs recorded by this thread's current request"""
+        jobs = getattr(self._pending, 'jobs', None)
+        self._pending.jobs = None
+        return jobs or []
+
+    def submit(self, jobs):
+        """Queue jobs for the workers once their response is out; never blocks"""
+        if not jobs:
+            return
+        self._ensure_workers()
+        for job in jobs:
+            try:
+                self._queue.put_nowait(job)
+                self.sampled += 1
+            except queue.Full:
+                self.dropped += 1
+
+    def release(self, **kwargs):
+        """request_finished receiver: the response has been sent"""
+        self.submit(self.take_pending())
+
+    def _ensure_workers(self):
+        with self._lock:
+            if self._pool is None:
+                # Spawned, not forked: the serving process has threads and open connections
+                self._pool = ProcessPoolExecutor(
+                    self.workers, mp_context=multiprocessing.get_context('spawn'),
+                    initializer=model_store.start_candidate_process,
+                )
+            while len(self._threads) < self.workers:
+                thread = threading.Thread(
+                    target=self._run, name=f'shadow-{len(self._threads)}', daemon=True
+                )
+                thread.start()
+                self._threads.append(thread)
+
+    def _run(self):
+        while True:
+            name, text, serving_label, serving_seconds = self._queue.get()
+            used = 0.0
+            path = self.candidates.get(name)
+            if path is None:
+                continue  # Failed to load meanwhile
+            try:
+                # Loaded by the shadow process on first use, so neither the
+                # request path nor the serving process's memory pays for it
+                candidate_label, candidate_seconds, used = self._pool.submit(
+                    model_store.predict_candidate, name, str(path), text
+                ).result()
+                with self._lock:
+                    self.stats[name].record(serving_label, candidate_label, serving_seconds, candidate_seconds)
+            except model_store.CandidateLoadError as e:
+                # Stop sampling for a candidate that cannot be loaded
+                logger.error('Shadow candidate for %s not loaded, shadowing stopped: %s', name.upper(), e)
+                self.candidates.pop(name, None)
+                with self._lock:
+                    self.stats[name].load_error = str(e)
+            except Exception as e:
+                logger.warning('Shadow %s candidate failed: %s', name.upper(), e)
+                with self._lock:
+                    self.stats[name].errors += 1
+
+            # Idle for as long as the CPU the candidate just used allows under the cap
+            pause = used * (1 - self.worker_share) / self.worker_share
+            with self._lock:
+                self.cpu_seconds += used
+                self.throttled_seconds += pause
+            time.sleep(pause)
+
+    def report(self):
+        with self._lock:
+            return {
+                'enabled': self.enabled,
+                'sample_rate': self.sample_rate,
+                'cpu_share': round(self.worker_share * self.workers, 4),
+                'queued': self._queue.qsize(),
+                'sampled': self.sampled,
+                'dropped': self.dropped,
+                'cpu_seconds': round(self.cpu_seconds, 4),
+                'throttled_seconds': round(self.throttled_seconds, 4),
+                'models': {name: stats.report() for name, stats in self.stats.items()},
+            }
+
+
+shadow_evaluator = ShadowEvaluator(
+    candidates=getattr(settings, 'SENTIMENT_SHADOW_CANDIDATES', {}),
+    sample_rate=getattr(settings, 'SENTIMENT_SHADOW_SAMPLE_RATE', 0.05),
+    max_queue=getattr(settings, 'SENTIMENT_SHADOW_MAX_QUEUE', 256),
+    workers=getattr(settings, 'SENTIMENT_SHADOW_WORKERS', 1),
+    cpu_share=getattr(settings, 'SENTIMENT_SHADOW_CPU_SHARE', 0.1),
+)
+request_finished.connect(shadow_evaluator.release, dispatch_uid='sentiment-shadow-release')
+
+
+class ShadowEvaluationAPIView(View):
+    """Agreement and latency of each candidate model against the serving one"""
+
+    def get(self, request):
+        return JsonResponse({'success': True, 'data': shadow_evaluator.report()})
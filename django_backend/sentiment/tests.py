@@ -1,3 +1,1540 @@
-from django.test import TestCase
+"""
+Tests of the sentiment app.
 
-# Create your tests here.
\ No newline at end of file
+Adversarial-input performance tests come first, then focused tests of the
+API-visible behavior of each feature: caches, response contracts, load
+shedding, deadlines, moderation lists, aggregates and internal-only gates.
+
+Chat text is untrusted, so every analyzer, the training-time ``clean_text``
+and every analysis endpoint must take time linear in the size of its input.
+Each test runs a set of pathological inputs (bracket and tag runs, unclosed
+tags, digit/letter interleavings, huge whitespace, multi-megabyte payloads) at
+two sizes FACTOR apart and fails when the larger one costs more than linear
+growth allows. A regex that backtracks quadratically, as r'\\[.*?\\]' does on
+'[[[[...', grows by FACTOR ** 2 and fails by a wide margin.
+"""
+
+import argparse
+import asyncio
+import contextlib
+import http.server
+import importlib
+import io
+import json
+import os
+import re
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+from django.core.management import CommandError, call_command
+from django.db.backends.signals import connection_created
+from unittest import mock
+
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from Beyonder.feature_store import FeatureStore, function_fingerprint
+from Beyonder.sweep_models import config_id, pareto_frontier, refit_on_full_train, summarize
+from Beyonder.train_hashed_svc import read_chunks, shuffled_batches, train
+from sentiment.enhanced_sentiment import EnhancedSentimentAnalyzer, WORD_TOKEN, iter_tokens, load_extended_lexicon
+from sentiment import admission, model_store, readiness, transport
+from sentiment.analytics import ModelAnalyticsAPIView
+from sentiment.deadlines import DEADLINE_HEADER, Deadline, StageCosts, stage_costs
+from sentiment.drift import drift_monitor
+from sentiment.management.commands.load_test import saturated, summarize as summarize_step
+from sentiment.management.commands.rescore_export import CHECKPOINT_SUFFIX, decrypt_caesar, message_text
+from sentiment.memory import AllocationTracer, deep_size
+from sentiment.moderation_lists import WRITE_TOKEN_HEADER, matcher_pool, replace_lists
+from sentiment.near_duplicates import NearDuplicateIndex, normalize
+from sentiment.profiling import PROFILE_HEADER, request_profiler
+from sentiment.renderers import CompactJSONRenderer
+from sentiment.rollups import READ_TOKEN_HEADER
+from sentiment.shadow import ShadowEvaluator
+from sentiment.transport import MAX_FRAME_BYTES, InferenceClient, InferenceServer, dispatch
+from sentiment.trending import TrendingTerms, parse_window
+from sentiment.models import StoredVerdict
+from sentiment.verdict_store import VerdictStore, configure_connection, verdict_store
+from sentiment.views import MAX_MODEL_CHARS, ToxicityAPIView, enhanced_analyzer
+
+# Input sizes, in characters, for the direct calls and for the endpoints
+SMALL = 20_000
+ENDPOINT_SMALL = 64_000
+FACTOR = 8
+# Allowed growth from the small to the large input: linear, times a margin
+# for timer noise and cache effects (quadratic growth would be FACTOR ** 2)
+MAX_GROWTH = FACTOR * 3
+# Below this, timings are mostly noise and are not compared
+MIN_SECONDS = 0.001
+# Hard limit for the small input, so a quadratic regression fails in seconds
+# instead of grinding through the large one (linear code needs a few ms)
+SMALL_BUDGET = 0.25
+ENDPOINT_SMALL_BUDGET = 1.0
+
+# Multi-megabyte payload (within DATA_UPLOAD_MAX_MEMORY_SIZE) and the time
+# any endpoint may spend on it
+LARGE_PAYLOAD = 2_000_000
+LARGE_PAYLOAD_BUDGET = 10.0
+# Bodies above DATA_UPLOAD_MAX_MEMORY_SIZE must be turned away at least this fast
+OVERSIZED_BUDGET = 1.0
+
+PATHOLOGICAL_INPUTS = {
+    'open_brackets': lambda n: '[' * n,
+    'unclosed_bracket': lambda n: '[' + 'a ' * (n // 2),
+    'nested_brackets': lambda n: '[a ' * (n // 4) + ']',
+    'open_tags': lambda n: '<' * n,
+    'unclosed_tag': lambda n: '<b ' * (n // 3),
+    'closing_runs': lambda n: '<a' + '>' * n,
+    'letters': lambda n: 'a' * n,
+    'letters_then_digit': lambda n: 'a' * (n - 1) + '1',
+    'digit_letter_interleaving': lambda n: 'a1' * (n // 2),
+    'long_words': lambda n: ('x' * 997 + '9 ') * (n // 999),
+    'whitespace': lambda n: ' ' * (n - 4) + 'good',
+    'mixed_whitespace': lambda n: ' \t\r\n' * (n // 4) + 'bad',
+    'punctuation': lambda n: "!?.,'" * (n // 5),
+    'apostrophes': lambda n: "'" * n,
+    'url_prefixes': lambda n: 'http://' * (n // 7),
+    'negations': lambda n: 'not very ' * (n // 9),
+    'sentiment_words': lambda n: 'good bad hate kill ' * (n // 19),
+    'emoji': lambda n: '\U0001F600' * n,
+}
+
+
+def load_clean_text():
+    beyonder_dir = os.path.join(settings.BASE_DIR, 'Beyonder')
+    if beyonder_dir not in sys.path:
+        sys.path.append(beyonder_dir)
+    return importlib.import_module('evaluate_models').clean_text
+
+
+def best_time(fn, arg, repeat=3, limit=float('inf')):
+    """Fastest of ``repeat`` runs; stops early once a run exceeds ``limit``"""
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn(arg)
+        timings.append(time.perf_counter() - started)
+        if timings[-1] > limit:
+            break
+    return min(timings)
+
+
+class LinearTimeMixin:
+    def assertLinear(self, fn, small=SMALL, repeat=3, budget=SMALL_BUDGET, inputs=PATHOLOGICAL_INPUTS):
+        """Time ``fn`` on every pathological input at two sizes and check the growth"""
+        for name, make in inputs.items():
+            with self.subTest(input=name):
+                small_seconds = best_time(fn, make(small), repeat, limit=budget)
+                self.assertLessEqual(
+                    small_seconds, budget, f'{name}: {small_seconds * 1000:.1f}ms at only {small} chars'
+                )
+                small_seconds = max(small_seconds, MIN_SECONDS)
+                large_seconds = best_time(fn, make(small * FACTOR), repeat, limit=small_seconds * MAX_GROWTH)
+                self.assertLessEqual(
+                    large_seconds, small_seconds * MAX_GROWTH,
+                    f'{name}: {small_seconds * 1000:.1f}ms at {small} chars but '
+                    f'{large_seconds * 1000:.1f}ms at {small * FACTOR}, worse than linear'
+                )
+
+
+class CleanTextWorstCaseTests(LinearTimeMixin, SimpleTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.clean_text = staticmethod(load_clean_text())
+
+    def test_clean_text_is_linear(self):
+        self.assertLinear(self.clean_text)
+
+    def test_clean_text_removes_what_training_removed(self):
+        cases = {
+            'see [note] here': 'see  here',
+            '[a [b] c]': ' c',
+            'unclosed [bracket': 'unclosed bracket',
+            'bold <b>text</b>>': 'bold text',
+            'open < tag': 'open  tag',
+            'go to www.example.com now': 'go to  now',
+            'covid19 and b2b deals 2024': ' and  deals ',
+            'dont stop': "don't stop",
+        }
+        for text, expected in cases.items():
+            with self.subTest(text=text):
+                self.assertEqual(self.clean_text(text), expected)
+
+
+class AnalyzerWorstCaseTests(LinearTimeMixin, SimpleTestCase):
+    def setUp(self):
+        self.analyzer = EnhancedSentimentAnalyzer()
+        self.toxicity = ToxicityAPIView()
+
+    def test_tokenizers_are_linear(self):
+        self.assertLinear(lambda text: sum(1 for _ in iter_tokens(text)))
+        self.assertLinear(lambda text: sum(1 for _ in iter_tokens(text, WORD_TOKEN)))
+        self.assertLinear(self.analyzer.preprocess_text)
+        self.assertLinear(normalize)
+
+    def test_analyze_sentiment_is_linear(self):
+        self.assertLinear(self.analyzer.analyze_sentiment)
+        self.assertLinear(self.analyzer.salient_tokens)
+
+    def test_batch_analyze_is_linear(self):
+        self.assertLinear(lambda text: self.analyzer.batch_analyze([text]))
+
+    def test_batch_analyze_matches_analyze_sentiment(self):
+        texts = [
+            '', '   ', 'you are not good', 'this is not very good', "I don't love this",
+            'a bit good', 'not a bit bad', 'very a bit good', 'really terrible, never good. super happy!',
+        ] + [make(SMALL) for make in PATHOLOGICAL_INPUTS.values()]
+        analyzer = EnhancedSentimentAnalyzer(max_words=500, max_explained=10)
+        self.assertEqual(analyzer.batch_analyze(texts), [analyzer.analyze_sentiment(text) for text in texts])
+        self.assertEqual(
+            analyzer.batch_analyze(texts, explain=False),
+            [analyzer.analyze_sentiment(text, explain=False) for text in texts]
+        )
+
+    def test_batch_analyze_matches_on_negation_and_intensifiers(self):
+        texts = [
+            'not good', 'never happy', "didn't like it", 'not very good', 'very good', 'extremely bad',
+            'a bit sad', 'not a bit happy', 'I do not hate it', 'not, good', 'really not great',
+            'incredibly awesome but not amazing', 'not not good', 'hardly good', 'NOT Good!!',
+        ]
+        analyzer = EnhancedSentimentAnalyzer(batch_workers=2, parallel_batch_size=4)
+        expected = [analyzer.analyze_sentiment(text) for text in texts]
+        # Serial and split across processes
+        for batch in (EnhancedSentimentAnalyzer().batch_analyze(texts), analyzer.batch_analyze(texts)):
+            for text, result, single in zip(texts, batch, expected):
+                with self.subTest(text=text):
+                    self.assertEqual(result['sentiment'], single['sentiment'])
+                    self.assertEqual(result['score'], single['score'])
+                    self.assertEqual(
+                        [(word['word'], word['is_negated'], word['intensity_multiplier']) for word in result['word_analysis']],
+                        [(word['word'], word['is_negated'], word['intensity_multiplier']) for word in single['word_analysis']]
+                    )
+        self.assertTrue(any(word['is_negated'] for single in expected for word in single['word_analysis']))
+        self.assertTrue(any(word['intensity_multiplier'] != 1.0 for single in expected for word in single['word_analysis']))
+
+    def test_keyword_toxicity_is_linear(self):
+        self.assertLinear(self.toxicity.analyze_keywords)
+        self.assertLinear(self.toxicity.toxicity_signature)
+
+    def test_near_duplicate_index_is_linear(self):
+        index = NearDuplicateIndex()
+        self.assertLinear(lambda text: index.add('test', text, {}) and index.lookup('test', text))
+
+
+class ExtendedLexiconTests(SimpleTestCase):
+    def setUp(self):
+        self.words, self.version = load_extended_lexicon(model_store.EXTENDED_LEXICON_PATH)
+        self.analyzer = EnhancedSentimentAnalyzer(extended_lexicon=self.words, lexicon_version=self.version)
+
+    def test_derived_words_are_merged_under_the_hand_picked_ones(self):
+        builtin = EnhancedSentimentAnalyzer().word_sentiments
+        for word, score in (('lovely', 1.0), ('headache', -1.0), ('congrats', 1.0), ('tired', -1.0)):
+            with self.subTest(word=word):
+                self.assertNotIn(word, builtin)
+                self.assertEqual(self.analyzer.word_sentiments[word], score)
+        for word, score in builtin.items():
+            self.assertEqual(self.analyzer.word_sentiments[word], score)
+        self.assertEqual(self.analyzer.analyze_sentiment('what a lovely gift')['sentiment'], 'positive')
+        self.assertEqual(self.analyzer.analyze_sentiment('not lovely at all')['sentiment'], 'negative')
+
+    def test_only_surface_words_without_topical_noise(self):
+        # Lemmas and mangled contractions of the NB vocabulary never match a chat token
+        for word in ('amaze', 'annoy', 'weve', 'toe', 'tongue', 'track', 'tweeter', 'advice'):
+            with self.subTest(word=word):
+                self.assertNotIn(word, self.words)
+        self.assertTrue(all(-1.0 <= score <= 1.0 and abs(score) >= 0.5 for score in self.words.values()))
+
+    def test_serving_analyzer_uses_this_lexicon(self):
+        self.assertEqual(enhanced_analyzer.lexicon_version, self.version)
+
+
+class EndpointWorstCaseTests(LinearTimeMixin, SimpleTestCase):
+    ENDPOINTS = {
+        'analyze': ('/api/sentiment/analyze/', {'model': 'svc'}),
+        'analyze_nb': ('/api/sentiment/analyze/', {'model': 'nb', 'use_enhanced': False}),
+        'enhanced': ('/api/sentiment/enhanced/', {'model': 'nb'}),
+        'toxicity': ('/api/sentiment/toxicity/', {}),
+    }
+
+    def post(self, endpoint, text, expected_status=200):
+        url, body = self.ENDPOINTS[endpoint]
+        # Debug responses skip the verdict caches, so every call does the full work
+        with contextlib.redirect_stdout(io.StringIO()):
+            response = self.client.post(
+                f'{url}?detail=debug',
+                json.dumps({**body, 'text': text}, ensure_ascii=False),
+                content_type='application/json'
+            )
+        self.assertEqual(response.status_code, expected_status, response.content[:200])
+        return response
+
+    def setUp(self):
+        # Load the models before anything is timed
+        for endpoint in self.ENDPOINTS:
+            self.post(endpoint, 'warm up')
+
+    def test_endpoints_are_linear(self):
+        for endpoint in self.ENDPOINTS:
+            with self.subTest(endpoint=endpoint):
+                self.assertLinear(
+                    lambda text: self.post(endpoint, text),
+                    small=ENDPOINT_SMALL, repeat=2, budget=ENDPOINT_SMALL_BUDGET
+                )
+
+    def test_multi_megabyte_payloads(self):
+        payloads = {
+            'open_brackets': '[' * LARGE_PAYLOAD,
+            'digit_letter_interleaving': 'a1' * (LARGE_PAYLOAD // 2),
+            'sentiment_words': 'not good but i hate it ' * (LARGE_PAYLOAD // 23),
+        }
+        for endpoint in self.ENDPOINTS:
+            for name, text in payloads.items():
+                with self.subTest(endpoint=endpoint, input=name):
+                    started = time.perf_counter()
+                    self.post(endpoint, text)
+                    elapsed = time.perf_counter() - started
+                    self.assertLess(elapsed, LARGE_PAYLOAD_BUDGET, f'{elapsed:.2f}s for {len(text)} chars')
+
+    def test_oversized_payloads_are_rejected(self):
+        text = 'a1[' * (settings.DATA_UPLOAD_MAX_MEMORY_SIZE // 3 + 1)
+        for endpoint in self.ENDPOINTS:
+            with self.subTest(endpoint=endpoint):
+                started = time.perf_counter()
+                self.post(endpoint, text, expected_status=400)
+                self.assertLess(time.perf_counter() - started, OVERSIZED_BUDGET)
+
+
+class DriftSampleAccessTests(SimpleTestCase):
+    URL = '/api/sentiment/analytics/?drift_samples=true'
+
+    def setUp(self):
+        drift_monitor.observe_lexicon('a private chat message', {'sentiment': 'neutral', 'score': 0.0})
+        patcher = mock.patch.object(request_profiler, 'token', 'internal-token')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_samples_need_the_internal_token(self):
+        for headers in ({}, {PROFILE_HEADER: 'wrong'}):
+            with self.subTest(headers=headers):
+                response = self.client.get(self.URL, headers=headers)
+                self.assertEqual(response.status_code, 403)
+                self.assertNotIn(b'a private chat message', response.content)
+
+    def test_authorized_callers_get_samples(self):
+        response = self.client.get(self.URL, headers={PROFILE_HEADER: 'internal-token'})
+        self.assertEqual(response.status_code, 200)
+        samples = response.json()['data']['drift']['paths']['lexicon']['samples']
+        self.assertIn('a private chat message', [sample['text'] for sample in samples])
+
+    def test_analytics_without_samples_stay_public(self):
+        response = self.client.get('/api/sentiment/analytics/')
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('samples', response.json()['data']['drift']['paths']['lexicon'])
+
+
+def post_json(client, url, body, **kwargs):
+    with contextlib.redirect_stdout(io.StringIO()):
+        return client.post(url, json.dumps(body), content_type='application/json', **kwargs)
+
+
+@override_settings(SENTIMENT_GROUP_LISTS_TOKEN='lists-token')
+class GroupModerationListTests(TestCase):
+    URL = '/api/sentiment/groups/team-a/lists/'
+    LISTS = {'blocked': {'insult': ['noob']}, 'allowed': ['stupid']}
+
+    def setUp(self):
+        matcher_pool.invalidate('team-a')
+        # The store writes from a background thread, outside the test's transaction
+        patcher = mock.patch.object(verdict_store, 'enabled', False)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def put(self, body, token='lists-token'):
+        headers = {WRITE_TOKEN_HEADER: token} if token else {}
+        with contextlib.redirect_stdout(io.StringIO()):
+            return self.client.put(self.URL, json.dumps(body), content_type='application/json', headers=headers)
+
+    def keywords(self, text, group_id='team-a'):
+        response = post_json(self.client, '/api/sentiment/toxicity/', {
+            'text': text, 'use_ml': False, 'group_id': group_id,
+        })
+        self.assertEqual(response.status_code, 200)
+        return response.json()['toxicity']['detectedKeywords']
+
+    def test_writes_need_the_token(self):
+        for token in (None, 'wrong'):
+            with self.subTest(token=token):
+                self.assertEqual(self.put(self.LISTS, token=token).status_code, 403)
+                response = self.client.delete(self.URL, headers={WRITE_TOKEN_HEADER: token} if token else {})
+                self.assertEqual(response.status_code, 403)
+        self.assertEqual(self.client.get(self.URL).status_code, 404)
+
+    @override_settings(SENTIMENT_GROUP_LISTS_TOKEN=None)
+    def test_lists_are_read_only_without_a_configured_token(self):
+        self.assertEqual(self.put(self.LISTS, token='anything').status_code, 403)
+
+    def test_group_lists_take_precedence_over_global_keywords(self):
+        self.assertEqual(self.put(self.LISTS).status_code, 200)
+        self.assertEqual(self.client.get(self.URL).json()['data']['version'], 1)
+        self.assertIn('noob', self.keywords('what a noob'))
+        self.assertNotIn('stupid', self.keywords('that was stupid'))
+        # Other groups keep the global lists
+        self.assertNotIn('noob', self.keywords('what a noob', group_id='team-b'))
+        self.assertIn('stupid', self.keywords('that was stupid', group_id='team-b'))
+
+    def test_delete_restores_global_lists_under_a_new_version(self):
+        self.put(self.LISTS)
+        response = self.client.delete(self.URL, headers={WRITE_TOKEN_HEADER: 'lists-token'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['data']['version'], 2)
+        self.assertIn('stupid', self.keywords('that was stupid'))
+
+    def test_invalid_lists_are_rejected(self):
+        self.assertEqual(self.put({'blocked': {'spam': ['x']}}).status_code, 400)
+        self.assertEqual(self.put({'allowed': ['two words']}).status_code, 400)
+
+    def test_every_write_gets_the_next_version(self):
+        self.assertIsNone(replace_lists('team-a', {}, []))  # Deleting a missing group
+        self.assertEqual(replace_lists('team-a', {'insult': ['noob']}, [], create=True).version, 1)
+        self.assertEqual(replace_lists('team-a', {'insult': ['scrub']}, [], create=True).version, 2)
+        group = replace_lists('team-a', {}, [])
+        self.assertEqual((group.version, group.blocked), (3, {}))
+        self.assertEqual(self.put(self.LISTS).json()['data']['version'], 4)
+
+    def test_group_blocked_words_stay_out_of_global_trending(self):
+        self.put(self.LISTS)
+        trending = TrendingTerms()
+        with mock.patch('sentiment.views.trending_terms', trending):
+            self.keywords('what a noob, you idiot')
+        terms = [entry['term'] for entry in trending.top(60)['categories']['insult']['terms']]
+        self.assertEqual(terms, ['idiot'])
+
+
+class VerdictStoreTests(TestCase):
+    def store(self, version, **kwargs):
+        # Flushed by the test, never by the background writer
+        store = VerdictStore(flush_interval=3600, **kwargs)
+        store._version = version
+        # Nothing is left for the exit-time flush, which runs after the test database is gone
+        self.addCleanup(lambda: (store._touches.clear(), store._pending.clear()))
+        return store
+
+    def test_versions_keep_separate_rows(self):
+        old, new = self.store('old-version'), self.store('new-version')
+        old.put('sentiment', 'Good  day', {'label': 'old'})
+        new.put('sentiment', 'good day', {'label': 'new'})
+        old.flush()
+        new.flush()
+        self.assertEqual(StoredVerdict.objects.count(), 2)
+        # Normalized text and the version select the row
+        self.assertEqual(old.get('sentiment', 'good day!'), {'label': 'old'})
+        self.assertEqual(new.get('sentiment', 'GOOD DAY'), {'label': 'new'})
+        self.assertIsNone(new.get('toxicity', 'good day'))
+
+        # A rewrite by one version leaves the other's row alone
+        new.put('sentiment', 'good day', {'label': 'newer'})
+        new.flush()
+        self.assertEqual(old.get('sentiment', 'good day'), {'label': 'old'})
+        self.assertEqual(new.get('sentiment', 'good day'), {'label': 'newer'})
+
+    def test_compaction_keeps_other_versions_and_drops_expired_and_excess_rows(self):
+        old, new = self.store('old-version'), self.store('new-version', max_rows=3, ttl_seconds=3600)
+        old.put('sentiment', 'kept from the old version', {'label': 'old'})
+        old.flush()
+        for i in range(4):
+            new.put('sentiment', f'message {i}', {'label': i})
+            new.flush()
+        StoredVerdict.objects.filter(verdict={'label': 0}).update(last_used_at=time.time() - 7200)
+        StoredVerdict.objects.filter(verdict={'label': 1}).update(last_used_at=time.time() - 60)
+
+        new.compact()
+        self.assertEqual(old.get('sentiment', 'kept from the old version'), {'label': 'old'})
+        self.assertIsNone(new.get('sentiment', 'message 0'))  # expired
+        self.assertIsNone(new.get('sentiment', 'message 1'))  # least recently used beyond max_rows
+        self.assertEqual(new.get('sentiment', 'message 3'), {'label': 3})
+        self.assertEqual(StoredVerdict.objects.count(), 3)
+
+    def test_version_covers_the_analysis_limits(self):
+        version = VerdictStore().version
+        with override_settings(SENTIMENT_MAX_WORDS=10):
+            self.assertNotEqual(VerdictStore().version, version)
+        self.assertEqual(VerdictStore().version, version)
+
+    def test_connections_are_tuned_only_once_the_store_is_used(self):
+        self.assertNotIn('init_command', settings.DATABASES['default']['OPTIONS'])
+        store = self.store('some-version')
+        with mock.patch.object(connection_created, 'connect') as connect:
+            store.put('sentiment', 'a message to store', {'label': 'positive'})
+            connect.assert_not_called()
+            self.assertEqual(store.get('sentiment', 'a message to store'), {'label': 'positive'})
+            connect.assert_not_called()  # Answered from the queued writes
+            store.flush()
+            self.assertEqual(store.get('sentiment', 'a message to store'), {'label': 'positive'})
+            connect.assert_called_once_with(configure_connection, dispatch_uid=mock.ANY)
+
+
+def echo_frame(message):
+    # Stands in for the views: slow enough that frames are still in flight
+    time.sleep(0.05)
+    return {'id': message['id'], 'status': 200, 'data': message['data']}, []
+
+
+@mock.patch('sentiment.transport.dispatch_deferred', echo_frame)
+class TransportTests(SimpleTestCase):
+    def run_with_server(self, client_main):
+        async def main():
+            inference = InferenceServer(workers=2)
+            server = await asyncio.start_server(
+                inference.handle_connection, '127.0.0.1', 0, limit=MAX_FRAME_BYTES
+            )
+            async with server:
+                client = InferenceClient(port=server.sockets[0].getsockname()[1])
+                await client.connect()
+                try:
+                    return await asyncio.wait_for(client_main(client), 5)
+                finally:
+                    await client.close()
+                    # Let the server see the client go before the loop closes
+                    while inference.connections:
+                        await asyncio.sleep(0.01)
+        return asyncio.run(main())
+
+    def test_pipelined_requests_are_matched_by_id(self):
+        async def main(client):
+            return await asyncio.gather(*(client.request('toxicity', {'n': n}) for n in range(8)))
+
+        frames = self.run_with_server(main)
+        self.assertEqual([frame['data']['n'] for frame in frames], list(range(8)))
+
+    def test_oversized_frame_answers_in_flight_requests_then_fails_the_rest(self):
+        async def main(client):
+            answered = asyncio.ensure_future(client.request('toxicity', {'n': 1}))
+            await asyncio.sleep(0)
+            oversized = asyncio.ensure_future(client.request('toxicity', {'text': 'x' * MAX_FRAME_BYTES}))
+            return await asyncio.gather(answered, oversized, return_exceptions=True)
+
+        answered, oversized = self.run_with_server(main)
+        self.assertEqual(answered['data'], {'n': 1})
+        self.assertIsInstance(oversized, ConnectionError)
+        self.assertIn('413', str(oversized))
+
+
+class TransportServerTests(SimpleTestCase):
+    def test_database_connections_are_recycled_around_every_frame(self):
+        with mock.patch('sentiment.transport.close_old_connections') as close_old_connections, \
+                mock.patch('sentiment.transport.dispatch', side_effect=RuntimeError('view failed')):
+            with self.assertRaises(RuntimeError):
+                transport.dispatch_deferred({'id': '1', 'endpoint': 'toxicity', 'data': {}})
+        self.assertEqual(close_old_connections.call_count, 2)
+
+    def test_unix_socket_is_not_world_accessible(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, 'inference.sock')
+
+        async def main():
+            serving = asyncio.ensure_future(InferenceServer(workers=1).serve(socket_path=path))
+            while not os.path.exists(path):
+                await asyncio.sleep(0.01)
+            await asyncio.sleep(0.01)
+            mode = os.stat(path).st_mode & 0o777
+            serving.cancel()
+            await asyncio.gather(serving, return_exceptions=True)
+            return mode
+
+        self.assertEqual(asyncio.run(main()), 0o660)
+
+
+@override_settings(SENTIMENT_ROLLUP_TOKEN='rollup-token')
+class ConversationRollupTests(TestCase):
+    def setUp(self):
+        patcher = mock.patch.object(verdict_store, 'enabled', False)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def rollup(self, conversation_id, token='rollup-token'):
+        headers = {READ_TOKEN_HEADER: token} if token else {}
+        return self.client.get(f'/api/sentiment/rollups/{conversation_id}/', headers=headers)
+
+    def test_messages_roll_up_by_conversation_id_only(self):
+        for body in (
+            {'text': 'you are an idiot', 'use_ml': False, 'conversation_id': 'rollup-chat'},
+            {'text': 'have a nice day', 'use_ml': False, 'conversation_id': 'rollup-chat'},
+            {'text': 'you are an idiot', 'use_ml': False, 'group_id': 'rollup-group'},
+        ):
+            self.assertEqual(post_json(self.client, '/api/sentiment/toxicity/', body).status_code, 200)
+
+        response = self.rollup('rollup-chat')
+        self.assertEqual(response.status_code, 200)
+        rollup = response.json()['data']
+        self.assertEqual((rollup['toxicity_checks'], rollup['toxic_messages']), (2, 1))
+        # group_id picks moderation lists; it never opens a rollup of its own
+        self.assertEqual(self.rollup('rollup-group').status_code, 404)
+
+    def test_every_sentiment_path_rolls_up(self):
+        for body in (
+            {'text': 'this is really great', 'model': 'svc'},
+            {'text': 'what a lovely surprise', 'model': 'svc', 'use_enhanced': False},
+            {'text': 'the worst service ever', 'model': 'nb', 'use_enhanced': False},
+        ):
+            response = post_json(self.client, '/api/sentiment/analyze/', {**body, 'conversation_id': 'model-chat'})
+            self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.rollup('model-chat').json()['data']['messages'], 3)
+
+    def test_reading_a_rollup_needs_the_token(self):
+        post_json(self.client, '/api/sentiment/toxicity/', {'text': 'hello there', 'conversation_id': 'dm-chat'})
+        for token in (None, 'wrong'):
+            with self.subTest(token=token):
+                self.assertEqual(self.rollup('dm-chat', token=token).status_code, 403)
+        with override_settings(SENTIMENT_ROLLUP_TOKEN=None):
+            self.assertEqual(self.rollup('dm-chat', token='anything').status_code, 403)
+
+
+class ShadowEvaluationTests(SimpleTestCase):
+    def evaluator(self, path):
+        evaluator = ShadowEvaluator(candidates={'nb': path}, sample_rate=1.0, cpu_share=1.0)
+        self.addCleanup(lambda: evaluator._pool and evaluator._pool.shutdown())
+        return evaluator
+
+    def shadow(self, evaluator, text, label):
+        evaluator.record('nb', text, label, 0.001)
+        with contextlib.redirect_stdout(io.StringIO()):
+            evaluator.submit(evaluator.take_pending())
+            deadline = time.monotonic() + 60
+            while time.monotonic() < deadline:
+                report = evaluator.report()['models']['nb']
+                if report['compared'] or report['load_error'] or report['errors']:
+                    return report
+                time.sleep(0.05)
+        self.fail('Shadow job not processed')
+
+    def test_candidate_is_scored_in_another_process(self):
+        text = 'what a lovely day with friends'
+        with contextlib.redirect_stdout(io.StringIO()):
+            label = model_store.predict('nb', text)
+        report = self.shadow(self.evaluator(model_store.NB_MODEL_PATH), text, label)
+        self.assertEqual((report['compared'], report['agreement_rate']), (1, 1.0))
+        # The serving process never loads the candidate
+        self.assertNotIn('nb', model_store._candidates)
+
+    def test_unloadable_candidate_stops_shadowing(self):
+        evaluator = self.evaluator('/nonexistent/candidate.pkl')
+        with self.assertLogs('sentiment.shadow', 'ERROR') as logs:
+            report = self.shadow(evaluator, 'hello there', 'neutral')
+        self.assertIn('FileNotFoundError', report['load_error'])
+        self.assertIn('shadowing stopped', logs.output[0])
+        self.assertFalse(evaluator.enabled)
+
+
+class RequestProfilingTests(SimpleTestCase):
+    FRAME = {'id': '1', 'endpoint': 'toxicity', 'data': {'text': 'you are an idiot', 'use_ml': False}}
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        for name, value in (('enabled', True), ('token', 'internal-token'), ('directory', directory),
+                            ('sample_rate', 0.0)):
+            patcher = mock.patch.object(request_profiler, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        patcher = mock.patch.object(verdict_store, 'enabled', False)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.directory = directory
+
+    def run_frame(self, **extra):
+        with contextlib.redirect_stdout(io.StringIO()):
+            return dispatch({**self.FRAME, **extra})
+
+    def test_only_frames_with_the_token_are_profiled(self):
+        for token in (None, 'wrong'):
+            with self.subTest(token=token):
+                self.assertNotIn('profile_file', self.run_frame(profile=token))
+        self.assertEqual(os.listdir(self.directory), [])
+
+        frame = self.run_frame(profile='internal-token')
+        self.assertEqual(frame['status'], 200)
+        self.assertEqual(os.listdir(self.directory), [frame['profile_file']])
+
+    def test_profiling_leaves_the_switch_interval_alone(self):
+        before = sys.getswitchinterval()
+        # Reported through logging, at debug level, rather than a stdout line per request
+        with self.assertLogs('sentiment.profiling', 'DEBUG') as logs, \
+                contextlib.redirect_stdout(io.StringIO()) as stdout:
+            with request_profiler.profile('busy loop'):
+                self.assertEqual(sys.getswitchinterval(), before)
+                deadline = time.perf_counter() + 0.05
+                while time.perf_counter() < deadline:
+                    pass
+        self.assertEqual(sys.getswitchinterval(), before)
+        self.assertEqual(stdout.getvalue(), '')
+        self.assertIn('Profiled busy loop', logs.output[0])
+        with open(os.path.join(self.directory, os.listdir(self.directory)[0]), encoding='utf-8') as f:
+            self.assertIn('test_profiling_leaves_the_switch_interval_alone', f.read())
+
+
+class ReadinessTests(SimpleTestCase):
+    def setUp(self):
+        # A fresh, cold worker
+        for name, value in (('_ready', threading.Event()), ('_started', threading.Event()),
+                            ('_state', {'status': 'cold', 'started_at': None, 'duration': None, 'errors': []})):
+            patcher = mock.patch.object(readiness, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def probe(self):
+        response = self.client.get('/ready/')
+        return response.status_code, response.json()['status']
+
+    def test_cold_worker_is_not_ready(self):
+        self.assertEqual(self.probe(), (503, 'cold'))
+
+    @override_settings(SENTIMENT_WARMUP='off')
+    def test_warmup_off_is_ready_at_once(self):
+        readiness.start_warmup()
+        self.assertEqual(self.probe(), (200, 'ready'))
+
+    @override_settings(SENTIMENT_WARMUP='blocking', SENTIMENT_WARMUP_MODELS=['nb'])
+    def test_ready_only_after_warmup_finishes(self):
+        during = []
+        predict = model_store.predict
+
+        def probed_predict(name, text):
+            during.append(self.probe())
+            return predict(name, text)
+
+        with mock.patch.object(model_store, 'predict', probed_predict), \
+                contextlib.redirect_stdout(io.StringIO()):
+            readiness.start_warmup()
+        self.assertEqual(set(during), {(503, 'warming')})
+        self.assertEqual(self.probe(), (200, 'ready'))
+        report = self.client.get('/ready/').json()
+        self.assertIn('nb', report['loaded_models'])
+        self.assertIsNotNone(report['warmup_seconds'])
+
+    @override_settings(SENTIMENT_WARMUP='blocking', SENTIMENT_WARMUP_MODELS=[])
+    def test_warmup_texts_stay_out_of_drift_monitoring(self):
+        with mock.patch.object(drift_monitor, 'observe_lexicon') as observe_lexicon, \
+                mock.patch.object(drift_monitor, 'observe_toxicity') as observe_toxicity, \
+                contextlib.redirect_stdout(io.StringIO()):
+            readiness.start_warmup()
+        self.assertEqual(self.probe(), (200, 'ready'))
+        observe_lexicon.assert_not_called()
+        observe_toxicity.assert_not_called()
+
+    @override_settings(SENTIMENT_WARMUP='blocking', SENTIMENT_WARMUP_MODELS=['nb'])
+    def test_failed_model_is_reported_without_blocking_readiness(self):
+        with mock.patch.object(model_store, 'predict', side_effect=OSError('model file missing')), \
+                contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+            readiness.start_warmup()
+        self.assertEqual(self.probe(), (200, 'ready'))
+        self.assertEqual(self.client.get('/ready/').json()['errors'],
+                         [{'model': 'nb', 'error': 'model file missing'}])
+
+
+class ResponseProfileTests(SimpleTestCase):
+    URL = '/api/sentiment/enhanced/'
+
+    def setUp(self):
+        patcher = mock.patch.object(verdict_store, 'enabled', False)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def analyze(self, text, detail=None, url=URL):
+        body = {'text': text} if detail is None else {'text': text, 'detail': detail}
+        response = post_json(self.client, url, body)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_detail_levels(self):
+        minimal = self.analyze('I am not happy with the minimal profile', 'minimal').json()
+        self.assertEqual(minimal['sentiment'], 'negative')
+        for key in ('text', 'word_analysis', 'timestamp', 'debug'):
+            self.assertNotIn(key, minimal)
+
+        standard = self.analyze('I am not happy with the standard profile').json()
+        self.assertEqual(standard['text'], 'I am not happy with the standard profile')
+        self.assertEqual([word['word'] for word in standard['word_analysis']], ['happy'])
+        self.assertNotIn('debug', standard)
+
+        debug = self.analyze('I am not happy with the debug profile', 'debug').json()
+        self.assertIn('word_analysis', debug)
+        self.assertIn('elapsed_ms', debug['debug'])
+
+    def test_unknown_detail_level_is_rejected(self):
+        response = post_json(self.client, self.URL, {'text': 'hello', 'detail': 'verbose'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_compact_format(self):
+        response = self.analyze('I am not happy with the compact format', 'minimal', url=self.URL + '?format=compact')
+        self.assertEqual(response['Content-Type'], 'application/json')
+        self.assertNotIn(b': ', response.content)
+        self.assertEqual(json.loads(response.content)['sentiment'], 'negative')
+
+    def test_compact_renderer_encodes_numpy_scalars(self):
+        import numpy as np
+
+        rendered = CompactJSONRenderer().render({'label': np.str_('positive'), 'score': np.float64(0.5), 'text': 'é'})
+        self.assertEqual(json.loads(rendered), {'label': 'positive', 'score': 0.5, 'text': 'é'})
+        self.assertNotIn(b' ', rendered)
+
+
+class NearDuplicateTests(SimpleTestCase):
+    SPAM = 'FREE robux giveaway!!! click the link in my bio to claim yours today'
+
+    def test_normalized_copies_match_exactly(self):
+        index = NearDuplicateIndex()
+        entry_id = index.add('toxicity', self.SPAM, {'isToxic': False})
+        match = index.lookup('toxicity', '  free ROBUX giveaway click the link in my bio to claim yours today 🎁')
+        self.assertEqual((match.entry_id, match.similarity, match.verdict), (entry_id, 1.0, {'isToxic': False}))
+        self.assertIsNone(index.lookup('sentiment', self.SPAM))
+
+    def test_near_copies_reuse_the_verdict_and_raise_the_flood_score(self):
+        index = NearDuplicateIndex(min_similarity=0.7, flood_threshold=4)
+        index.add('toxicity', self.SPAM, {'isToxic': False})
+        scores = []
+        for variant in ('FREE robux giveaway!!! click the link in my bio to claim yours today!!1',
+                        'FREE robux giveaway!!! click the link in my bio to claim yours today xD',
+                        'FREE robux giveaway!!! click the link in my bio to claim yours today ok'):
+            match = index.lookup('toxicity', variant)
+            self.assertIsNotNone(match, variant)
+            self.assertGreaterEqual(match.similarity, index.min_similarity)
+            scores.append(match.flood_score)
+        self.assertEqual(scores, sorted(scores))
+        self.assertEqual(scores[-1], 1.0)
+        self.assertEqual(index.stats()['near_hits'], 3)
+
+    def test_different_signatures_never_share_a_verdict(self):
+        index = NearDuplicateIndex()
+        index.add('sentiment', 'I really love this new update from the team', {'sentiment': 'positive'},
+                  signature=('love',))
+        self.assertIsNone(index.lookup('sentiment', 'I really do not love this new update from the team',
+                                       signature=('not', 'love')))
+
+    def test_short_messages_only_match_exactly(self):
+        index = NearDuplicateIndex(min_length=24)
+        index.add('toxicity', 'you are great', {'isToxic': False})
+        self.assertIsNone(index.lookup('toxicity', 'you are great!!1 yes'))
+        self.assertIsNotNone(index.lookup('toxicity', 'You are great!'))
+
+    def test_entries_expire_and_are_bounded(self):
+        index = NearDuplicateIndex(max_entries=2, ttl_seconds=60)
+        for i, text in enumerate(('first message', 'second message', 'third message')):
+            index.add('toxicity', text, {'n': i}, now=1000.0 + i)
+        self.assertEqual(len(index), 2)
+        self.assertIsNone(index.lookup('toxicity', 'first message', now=1003.0))
+        self.assertIsNone(index.lookup('toxicity', 'third message', now=1100.0))
+        self.assertEqual(len(index), 0)
+
+    @mock.patch.object(verdict_store, 'enabled', False)
+    def test_negated_flood_message_gets_its_own_verdict(self):
+        first = post_json(self.client, '/api/sentiment/enhanced/', {
+            'text': 'I really love the new update from the dev team', 'detail': 'minimal',
+        }).json()
+        copy = post_json(self.client, '/api/sentiment/enhanced/', {
+            'text': 'I REALLY love the new update from the dev team!!!', 'detail': 'minimal',
+        }).json()
+        negated = post_json(self.client, '/api/sentiment/enhanced/', {
+            'text': 'I really do not love the new update from the dev team', 'detail': 'minimal',
+        }).json()
+        self.assertEqual(first['sentiment'], 'positive')
+        self.assertIn('near_duplicate_of', copy)
+        self.assertEqual(copy['sentiment'], 'positive')
+        self.assertNotIn('near_duplicate_of', negated)
+        self.assertEqual(negated['sentiment'], 'negative')
+
+
+class RescoreExportTests(SimpleTestCase):
+    MESSAGES = [
+        # Caesar-shifted by 4 like the chat backend stores them: "I love this team"
+        {'_id': 'm1', 'text': 'M pszi xlmw xieq'},
+        {'_id': 'm2', 'text': 'you are an idiot', 'isEncrypted': False},
+        {'_id': 'm3', 'text': 'gone', 'isDeleted': True},
+        {'_id': 'm4', 'text': 'have a nice day', 'isEncrypted': False},
+    ]
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.input = os.path.join(directory, 'messages.jsonl')
+        self.output = os.path.join(directory, 'rescored.jsonl')
+        with open(self.input, 'w', encoding='utf-8') as f:
+            f.writelines(json.dumps(message) + '\n' for message in self.MESSAGES)
+
+    def rescore(self, **options):
+        out = io.StringIO()
+        call_command('rescore_export', self.input, self.output, model='nb', workers=1, chunk_size=1,
+                     stdout=out, **options)
+        with open(self.output, encoding='utf-8') as f:
+            return [json.loads(line) for line in f], out.getvalue()
+
+    def test_message_text(self):
+        self.assertEqual(decrypt_caesar('Lipps, A9!'), 'Hello, W5!')
+        self.assertEqual(message_text(self.MESSAGES[0]), 'I love this team')
+        self.assertEqual(message_text(self.MESSAGES[1]), 'you are an idiot')
+        self.assertIsNone(message_text(self.MESSAGES[2]))
+
+    def test_results_follow_input_order(self):
+        records, _ = self.rescore()
+        self.assertEqual([record['_id'] for record in records], ['m1', 'm2', 'm3', 'm4'])
+        self.assertEqual(records[0]['sentiment'], 'positive')
+        self.assertTrue(records[1]['toxicity']['isToxic'])
+        self.assertEqual(records[1]['sentimentAnalysis']['source'], 'toxicity_override')
+        self.assertEqual(records[2], {'_id': 'm3', 'skipped': 'no_text'})
+
+    def test_rerun_resumes_after_the_last_checkpoint(self):
+        complete, _ = self.rescore()
+        # As if the run had been killed after one checkpointed message and a half-written line
+        with open(self.input, 'rb') as f:
+            input_offset = len(f.readline())
+        with open(self.output, 'rb') as f:
+            output_offset = len(f.readline())
+        with open(self.output, 'ab') as f:
+            f.write(b'{"_id": "m2", "sentim')
+        with open(self.output + CHECKPOINT_SUFFIX, encoding='utf-8') as f:
+            checkpoint = json.load(f)
+        checkpoint.update(input_offset=input_offset, output_offset=output_offset, messages=1)
+        with open(self.output + CHECKPOINT_SUFFIX, 'w', encoding='utf-8') as f:
+            json.dump(checkpoint, f)
+
+        resumed, out = self.rescore()
+        self.assertIn('Resuming after 1 messages', out)
+        self.assertEqual(resumed, complete)
+
+    def test_checkpoint_of_another_model_is_refused(self):
+        self.rescore()
+        with self.assertRaisesMessage(CommandError, 'different model'):
+            call_command('rescore_export', self.input, self.output, model='svc', workers=1, stdout=io.StringIO())
+
+
+class FeatureStoreTests(SimpleTestCase):
+    ROWS = [('  I love this team', 'positive'), ('you are an idiot  ', 'negative'), ('see you at five', 'neutral')]
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.csv = os.path.join(directory, 'train.csv')
+        self.write_csv(self.ROWS)
+        self.store = FeatureStore(cache_dir=os.path.join(directory, 'cache'), verbose=False)
+
+    def write_csv(self, rows):
+        with open(self.csv, 'w', encoding='utf-8') as f:
+            f.write('text,sentiment\n')
+            f.writelines(f'{text},{label}\n' for text, label in rows)
+
+    @staticmethod
+    def clean(text):
+        return text.strip().lower()
+
+    def entries(self):
+        return sorted(name for name in os.listdir(self.store.cache_dir) if not name.startswith('.'))
+
+    def test_cleaned_texts_are_memory_mapped_and_reused(self):
+        texts, labels = self.store.cleaned_texts(self.csv, self.clean)
+        self.assertEqual(texts.tolist(), ['i love this team', 'you are an idiot', 'see you at five'])
+        self.assertEqual((len(texts), texts[-1], texts[1:]), (3, 'see you at five', texts.tolist()[1:]))
+        self.assertEqual(list(labels), ['positive', 'negative', 'neutral'])
+        with self.assertRaises(IndexError):
+            texts[3]
+
+        self.store.verbose = True
+        with contextlib.redirect_stdout(io.StringIO()) as out:
+            cached, _ = self.store.cleaned_texts(self.csv, self.clean)
+        self.assertIn('Using cached cleaned text', out.getvalue())
+        self.assertEqual(cached.tolist(), texts.tolist())
+        self.assertEqual(len(self.entries()), 1)
+
+    def test_new_data_or_cleaning_gets_a_new_entry(self):
+        self.store.cleaned_texts(self.csv, self.clean)
+        self.store.cleaned_texts(self.csv, lambda text: text.strip())
+        self.write_csv(self.ROWS + [('what a game', 'positive')])
+        texts, _ = self.store.cleaned_texts(self.csv, self.clean)
+        self.assertEqual(len(texts), 4)
+        self.assertEqual(len(self.entries()), 3)
+
+    def test_fingerprint_follows_the_patterns_a_function_uses(self):
+        source = 'def clean(text):\n    return PATTERN.sub(" ", text)\n'
+
+        def compiled(pattern):
+            namespace = {'PATTERN': re.compile(pattern)}
+            exec(source, namespace)
+            return namespace['clean']
+
+        self.assertEqual(function_fingerprint(compiled(r'\d+')), function_fingerprint(compiled(r'\d+')))
+        self.assertNotEqual(function_fingerprint(compiled(r'\d+')), function_fingerprint(compiled(r'\W+')))
+
+    def test_features_match_the_vectorizer(self):
+        from sklearn.feature_extraction.text import CountVectorizer
+
+        texts, _ = self.store.cleaned_texts(self.csv, self.clean)
+        vectorizer = CountVectorizer().fit(texts.tolist())
+        matrix, labels = self.store.features(self.csv, self.clean, vectorizer)
+        self.assertEqual(matrix.toarray().tolist(), vectorizer.transform(texts.tolist()).toarray().tolist())
+        self.assertEqual(list(labels), ['positive', 'negative', 'neutral'])
+
+        vectorizer.fit(['a different vocabulary entirely'])
+        self.store.features(self.csv, self.clean, vectorizer)
+        self.assertEqual(len([name for name in self.entries() if name.startswith('features-')]), 2)
+
+
+class ModelSweepTests(SimpleTestCase):
+    def fold(self, config, fold, accuracy, p50_ms):
+        return {'config': config, 'fold': fold, 'accuracy': accuracy, 'fit_seconds': 0.5, 'model_size_bytes': 1000,
+                'p50_ms': p50_ms, 'p99_ms': p50_ms * 3, 'throughput_per_s': 100.0}
+
+    def screened(self, config, cv_accuracy, screen_p50_ms):
+        return {'config': config, 'cv_accuracy': cv_accuracy, 'screen_p50_ms': screen_p50_ms}
+
+    def test_folds_are_averaged_per_configuration(self):
+        fast, slow = config_id({'min_df': 2}, {'alpha': 1.0}), config_id({'min_df': 1}, {'alpha': 0.1})
+        summary = summarize([
+            self.fold(fast, 0, 0.60, 1.0), self.fold(slow, 0, 0.70, 4.0),
+            self.fold(fast, 1, 0.64, 3.0), self.fold(slow, 1, 0.72, 2.0),
+        ])
+        self.assertEqual([entry['config'] for entry in summary], [slow, fast])  # Most accurate first
+        self.assertEqual((summary[0]['cv_accuracy'], summary[0]['cv_accuracy_std']), (71.0, 1.0))
+        self.assertEqual((summary[1]['screen_p50_ms'], summary[1]['screen_p99_ms']), (2.0, 6.0))
+        self.assertEqual(summary[0]['params'], {'vectorizer': {'min_df': 1}, 'classifier': {'alpha': 0.1}})
+
+    def test_frontier_keeps_only_undominated_configurations(self):
+        configs = [
+            self.screened('accurate', 72.0, 5.0),
+            self.screened('fast', 65.0, 1.0),
+            self.screened('balanced', 70.0, 2.0),
+            self.screened('slower_and_worse', 69.0, 3.0),
+            self.screened('tied_but_slower', 70.0, 2.5),
+            self.screened('balanced_twin', 70.0, 2.0),
+        ]
+        self.assertEqual(pareto_frontier(configs), ['accurate', 'fast', 'balanced', 'balanced_twin'])
+
+    def test_refit_restores_tuple_parameters_from_the_config(self):
+        config = config_id({'ngram_range': (1, 2), 'min_df': 1}, {'alpha': 1.0})
+        train = (['love this team', 'great game', 'you idiot', 'awful play'],
+                 ['positive', 'positive', 'negative', 'negative'])
+        test = (['love this game', 'awful idiot'], ['positive', 'negative'])
+        accuracy, runtime = refit_on_full_train('nb', config, train, test)
+        self.assertEqual(accuracy, 1.0)
+        self.assertEqual(set(runtime), {'model_size_bytes', 'p50_ms', 'p99_ms', 'throughput_per_s'})
+
+
+class HashedTrainingTests(SimpleTestCase):
+    ROWS = [
+        ('I LOVE this team!', 'positive'), ('what a great game', 'positive'), ('love it, great play', 'positive'),
+        ('you are an idiot', 'negative'), ('awful, hate this', 'negative'), ('hate that idiot ref', 'negative'),
+    ]
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def path(self, name, lines):
+        path = os.path.join(self.directory, name)
+        with open(path, 'w', encoding='utf-8') as f:
+            f.writelines(line + '\n' for line in lines)
+        return path
+
+    def csv(self, rows):
+        return self.path('train.csv', ['text,sentiment'] + [f'"{text}",{label}' for text, label in rows])
+
+    def args(self, **options):
+        defaults = dict(chunk_size=2, shuffle_buffer=4, text_column='text', label_column='sentiment',
+                        classes=['negative', 'neutral', 'positive'], hash_bits=10, max_ngram=1, alpha=1e-4,
+                        epochs=5, seed=42)
+        defaults.update(options)
+        return argparse.Namespace(**defaults)
+
+    def test_files_are_read_in_chunks_without_unusable_rows(self):
+        path = self.path('train.csv', ['text,sentiment', 'a,positive', ',negative', 'b,neutral', 'c,negative'])
+        self.assertEqual(list(read_chunks(path, 2, 'text', 'sentiment')),
+                         [(['a'], ['positive']), (['b', 'c'], ['neutral', 'negative'])])
+
+        path = self.path('train.jsonl', [
+            json.dumps({'text': 'a', 'sentiment': 'positive'}), '',
+            json.dumps({'text': None, 'sentiment': 'negative'}),
+            json.dumps({'text': 'b'}),
+            json.dumps({'text': 'c', 'sentiment': 1}),
+        ])
+        self.assertEqual(list(read_chunks(path, 2, 'text', 'sentiment')), [(['a', 'c'], ['positive', '1'])])
+
+    def test_every_row_is_cleaned_and_batched_once(self):
+        import numpy as np
+
+        clean_text = load_clean_text()
+        batches = list(shuffled_batches([self.csv(self.ROWS)], self.args(chunk_size=3), np.random.default_rng(0)))
+        self.assertTrue(all(len(texts) == len(labels) <= 3 for texts, labels in batches))
+        rows = [row for texts, labels in batches for row in zip(texts, labels)]
+        self.assertCountEqual(rows, [(clean_text(text), label) for text, label in self.ROWS])
+
+    def test_training_learns_the_known_labels_and_skips_the_rest(self):
+        path = self.csv(self.ROWS + [('no idea', 'mixed')])
+        with contextlib.redirect_stdout(io.StringIO()) as out:
+            vectorizer, classifier = train([path], self.args())
+        self.assertIn('6 rows', out.getvalue())
+        self.assertIn('1 with other labels skipped', out.getvalue())
+        self.assertEqual(list(classifier.classes_), ['negative', 'neutral', 'positive'])
+        self.assertEqual(vectorizer.n_features, 2 ** 10)
+        predictions = classifier.predict(vectorizer.transform(['great game love', 'hate idiot']))
+        self.assertEqual(list(predictions), ['positive', 'negative'])
+
+        with contextlib.redirect_stdout(io.StringIO()), self.assertRaises(SystemExit):
+            train([path], self.args(classes=['neutral']))
+
+
+class LoadTestTests(SimpleTestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.received = []
+        received = self.received
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_POST(self):
+                received.append((self.path, json.loads(self.rfile.read(int(self.headers['Content-Length'])))))
+                self.send_response(200)
+                self.send_header('Content-Length', '2')
+                self.end_headers()
+                self.wfile.write(b'{}')
+
+            def log_message(self, *args):
+                pass
+
+        server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        self.url = f'http://127.0.0.1:{server.server_address[1]}'
+
+    def test_steps_are_summarized_from_answered_requests(self):
+        step = summarize_step([0.01, 0.02, 0.03, 5.0], [200, 200, 200, None], offered=4, elapsed=1.0)
+        self.assertEqual((step['requests'], step['throughput_rps'], step['error_rate']), (4, 3.0, 0.25))
+        self.assertEqual((step['p50_ms'], step['p99_ms']), (20.0, 30.0))
+        self.assertEqual(step['statuses'], {'200': 3, 'failed': 1})
+
+        self.assertTrue(saturated(step, max_error_rate=0.01, slo_ms=1000))
+        self.assertFalse(saturated(dict(step, error_rate=0.0, offered_rps=3.2), max_error_rate=0.01, slo_ms=1000))
+        self.assertTrue(saturated(dict(step, error_rate=0.0, offered_rps=4.0), max_error_rate=0.01, slo_ms=1000))
+        self.assertTrue(saturated(dict(step, error_rate=0.0, offered_rps=3.0), max_error_rate=0.01, slo_ms=10))
+
+    def test_unique_ramp_never_repeats_a_text(self):
+        dataset = os.path.join(self.directory, 'texts.csv')
+        with open(dataset, 'w', encoding='utf-8') as f:
+            f.write('text,sentiment\nlove this team,positive\n  ,neutral\nyou idiot,negative\n')
+        output = os.path.join(self.directory, 'report.json')
+        call_command('load_test', url=self.url + '/', rates=[20, 40], duration=0.25, arrivals='uniform',
+                     endpoints=['analyze', 'toxicity'], unique=True, dataset=dataset, output=output,
+                     stdout=io.StringIO())
+
+        with open(output, encoding='utf-8') as f:
+            report = json.load(f)
+        configuration = report['configurations'][0]
+        self.assertEqual((report['texts'], configuration['server']), (2, 'external'))
+        self.assertEqual(len(configuration['steps']), 2)
+        self.assertFalse(configuration['steps'][-1]['saturated'])
+        self.assertEqual(sum(step['requests'] for step in configuration['steps']), len(self.received))
+
+        # Sequence numbers carry on across steps, past the end of the dataset
+        texts = [body['text'] for _, body in self.received]
+        self.assertGreater(len(texts), 10)
+        self.assertEqual(len(set(texts)), len(texts))
+        self.assertTrue(all(re.fullmatch(r'(love this team|you idiot) \[[0-9a-f]{8}-\d+\]', text) for text in texts))
+        paths = [path for path, _ in self.received]
+        self.assertIn(paths.count('/api/sentiment/analyze/') - paths.count('/api/sentiment/toxicity/'), (0, 1))
+        self.assertTrue(all(body['model'] == 'svc' for path, body in self.received if 'analyze' in path))
+
+
+class ModelAnalyticsTests(SimpleTestCase):
+    def performance(self, svc_runtime, nb_runtime, svc_accuracy=71.7, nb_accuracy=65.8):
+        return {
+            'svc': {'accuracy': svc_accuracy, 'runtime': svc_runtime},
+            'naive_bayes': {'accuracy': nb_accuracy, 'runtime': nb_runtime},
+        }
+
+    def runtime(self, p50_ms, throughput_per_s):
+        return {'load_seconds': 0.01, 'memory_mb': 5.0, 'p50_ms': p50_ms, 'p99_ms': p50_ms * 2,
+                'throughput_per_s': throughput_per_s}
+
+    def insight(self, performance, kind):
+        insights = ModelAnalyticsAPIView().generate_insights(performance)
+        return next(insight['message'] for insight in insights if insight['type'] == kind)
+
+    def test_endpoint_reports_measured_runtime(self):
+        response = self.client.get('/api/sentiment/analytics/?model=svc')
+        self.assertEqual(response.status_code, 200)
+        models = response.json()['data']['models']
+        for name in ('svc', 'naive_bayes'):
+            self.assertEqual(set(models[name]['runtime']),
+                             {'load_seconds', 'memory_mb', 'p50_ms', 'p99_ms', 'throughput_per_s'})
+        self.assertTrue(models['svc']['selected'])
+
+    def test_insights_come_from_the_measurements(self):
+        performance = self.performance(self.runtime(3.0, 750), self.runtime(1.5, 560))
+        self.assertIn('Naive Bayes answers a single message in 1.50ms (p50) vs 3.00ms for SVC, 2.0x faster',
+                      self.insight(performance, 'speed_accuracy'))
+        self.assertIn('In batches SVC sustains 750 messages/s', self.insight(performance, 'speed_accuracy'))
+        recommendation = self.insight(performance, 'recommendation')
+        self.assertIn('Use SVC where accuracy matters (+5.9%), or Naive Bayes for real-time chat', recommendation)
+        self.assertIn('For bulk re-scoring SVC is also the faster choice', recommendation)
+
+    def test_model_both_faster_and_more_accurate_is_recommended_outright(self):
+        performance = self.performance(self.runtime(1.0, 900), self.runtime(2.0, 500))
+        self.assertTrue(self.insight(performance, 'recommendation').startswith('Use SVC: it is both more accurate'))
+
+    def test_missing_runtime_asks_for_a_new_evaluation(self):
+        performance = self.performance(None, None)
+        self.assertIn('Re-run Beyonder/evaluate_models.py', self.insight(performance, 'speed_accuracy'))
+        self.assertEqual(self.insight(performance, 'recommendation'), 'Use SVC for the highest accuracy.')
+
+
+class AdmissionControlTests(SimpleTestCase):
+    def setUp(self):
+        patcher = mock.patch.object(verdict_store, 'enabled', False)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def full_gate(self, name):
+        """A gate for ``name`` whose only slot is taken and whose queue is closed"""
+        gate = admission.ModelGate(name, max_concurrency=1, max_queue=0)
+        self.assertTrue(gate.acquire())
+        patcher = mock.patch.dict(admission.gates, {name: gate})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        return gate
+
+    def test_gate_sheds_when_the_queue_is_full_or_the_wait_times_out(self):
+        gate = admission.ModelGate('svc', max_concurrency=1, max_queue=1, queue_timeout=0.01)
+        self.assertTrue(gate.acquire())
+        self.assertFalse(gate.acquire())  # waits out the timeout
+        gate.waiting = 1  # another request is queued
+        self.assertFalse(gate.acquire())
+        gate.waiting = 0
+        gate.release()
+        self.assertTrue(gate.acquire())
+        stats = gate.stats()
+        self.assertEqual((stats['admitted'], stats['shed_timeout'], stats['shed_queue_full']), (2, 1, 1))
+        self.assertEqual(stats['shed_rate'], 0.5)
+
+    def test_shed_requests_get_a_degraded_lexicon_answer(self):
+        self.full_gate('svc')
+        with contextlib.redirect_stdout(io.StringIO()):
+            response = self.client.post('/api/sentiment/analyze/', json.dumps({
+                'text': 'this is really great', 'model': 'svc', 'use_enhanced': False,
+            }), content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {'sentiment': 'positive', 'method': 'lexicon_only', 'degraded': True})
+        self.assertEqual(self.client.get('/api/sentiment/admission/').json()['data']['svc']['shed'], 1)
+
+    def test_degraded_verdicts_are_not_reused(self):
+        gate = self.full_gate('svc')
+        body = {'text': 'the meeting moved to room four on tuesday', 'model': 'svc', 'detail': 'minimal'}
+        self.assertTrue(post_json(self.client, '/api/sentiment/enhanced/', body).json().get('degraded'))
+        gate.release()
+        self.assertNotIn('degraded', post_json(self.client, '/api/sentiment/enhanced/', body).json())
+
+
+class DeadlineTests(SimpleTestCase):
+    NEUTRAL = 'the meeting moved to room four on thursday'
+
+    def setUp(self):
+        # A fresh index, so no other test's verdict is a near duplicate
+        for patcher in (mock.patch.object(verdict_store, 'enabled', False),
+                        mock.patch('sentiment.views.near_duplicate_index', NearDuplicateIndex())):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def post(self, url, body, seconds_left=None):
+        headers = {}
+        if seconds_left is not None:
+            headers[DEADLINE_HEADER] = str(int((time.time() + seconds_left) * 1000))
+        with contextlib.redirect_stdout(io.StringIO()):
+            return self.client.post(url, json.dumps(body), content_type='application/json', headers=headers)
+
+    def test_stage_costs_are_an_ewma_with_headroom(self):
+        costs = StageCosts({'ml_fallback': 0.01}, alpha=0.5, headroom=2.0)
+        self.assertAlmostEqual(costs.estimate('ml_fallback'), 0.02)
+        costs.observe('ml_fallback', 0.03)
+        self.assertAlmostEqual(costs.estimate('ml_fallback'), 0.04)
+        self.assertEqual(costs.estimate('unknown'), 0.0)
+
+    def test_missing_or_invalid_header_is_an_unlimited_budget(self):
+        for headers in ({}, {DEADLINE_HEADER: 'soon'}, {DEADLINE_HEADER: 'nan'}, {DEADLINE_HEADER: 'inf'},
+                        {DEADLINE_HEADER: '-5'}, {DEADLINE_HEADER: '0'}):
+            with self.subTest(headers=headers):
+                deadline = Deadline.from_request(mock.Mock(headers=headers))
+                self.assertEqual(deadline.remaining(), float('inf'))
+                self.assertTrue(deadline.allows('ml_fallback'))
+
+    def test_expired_requests_are_abandoned_with_504(self):
+        for url, body in (
+            ('/api/sentiment/analyze/', {'text': self.NEUTRAL, 'model': 'svc'}),
+            ('/api/sentiment/enhanced/', {'text': self.NEUTRAL}),
+            ('/api/sentiment/toxicity/', {'text': self.NEUTRAL}),
+        ):
+            with self.subTest(url=url):
+                response = self.post(url, body, seconds_left=-1)
+                self.assertEqual(response.status_code, 504)
+                self.assertEqual(response.json()['error'], 'Deadline exceeded')
+
+    def test_expired_frames_are_abandoned_with_504(self):
+        frame = dispatch({'id': '7', 'endpoint': 'enhanced', 'data': {'text': self.NEUTRAL},
+                          'deadline': int((time.time() - 1) * 1000)})
+        self.assertEqual((frame['id'], frame['status']), ('7', 504))
+
+    def test_stages_that_do_not_fit_are_skipped_and_not_cached(self):
+        body = {'text': self.NEUTRAL, 'model': 'svc', 'detail': 'minimal'}
+        with mock.patch.dict(stage_costs._ewma, {'ml_fallback': 60.0}):
+            response = self.post('/api/sentiment/enhanced/', body, seconds_left=5)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['skipped_stages'], ['ml_fallback'])
+        self.assertEqual(response.json()['method'], 'enhanced_context_aware')
+
+        # Without the deadline the ML stage runs, rather than the cut-down verdict being reused
+        response = self.post('/api/sentiment/enhanced/', body)
+        self.assertNotIn('skipped_stages', response.json())
+        self.assertNotIn('near_duplicate_of', response.json())
+
+    def test_analyze_answers_from_the_lexicon_when_the_model_does_not_fit(self):
+        body = {'text': 'the shuttle leaves the depot at noon', 'model': 'nb', 'use_enhanced': False}
+        with mock.patch.dict(stage_costs._ewma, {'ml_fallback': 60.0}), \
+                mock.patch.object(model_store, 'predict') as predict:
+            response = self.post('/api/sentiment/analyze/', body, seconds_left=5)
+        predict.assert_not_called()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['method'], 'lexicon_only')
+        self.assertEqual(response.json()['skipped_stages'], ['ml_fallback'])
+
+
+class LongMessageTests(SimpleTestCase):
+    def setUp(self):
+        patcher = mock.patch.object(verdict_store, 'enabled', False)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_scan_stops_after_max_words_and_caps_explanations(self):
+        analyzer = EnhancedSentimentAnalyzer(max_words=6, max_explained=2)
+        result = analyzer.analyze_sentiment('good great happy love awesome wonderful terrible awful')
+        self.assertTrue(result['truncated'])
+        self.assertEqual(result['word_count'], 6)
+        self.assertEqual(result['sentiment_words_found'], 6)
+        self.assertEqual(len(result['word_analysis']), 2)
+        self.assertEqual(result['explanations_omitted'], 4)
+        self.assertEqual(result['sentiment'], 'positive')
+
+        short = analyzer.analyze_sentiment('I am not happy')
+        self.assertFalse(short['truncated'])
+        self.assertEqual(short['explanations_omitted'], 0)
+        self.assertTrue(short['word_analysis'][0]['is_negated'])
+
+    def test_keyword_scan_stops_after_max_words(self):
+        toxicity = ToxicityAPIView()
+        with mock.patch('sentiment.views.MAX_WORDS', 3):
+            result = toxicity.analyze_keywords('hello there friend idiot')
+            self.assertEqual(result['detectedKeywords'], [])
+            self.assertTrue(result['truncated'])
+            self.assertNotIn('truncated', toxicity.analyze_keywords('you idiot'))
+
+    def test_models_only_score_the_first_max_model_chars(self):
+        text = 'the long update about the release schedule ' * 100
+        with mock.patch.object(model_store, 'predict', wraps=model_store.predict) as predict, \
+                contextlib.redirect_stdout(io.StringIO()):
+            response = self.client.post('/api/sentiment/analyze/', json.dumps({'text': text, 'model': 'svc', 'use_enhanced': False}),
+                                        content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        name, scored = predict.call_args.args
+        self.assertEqual(name, 'svc')
+        self.assertEqual(scored, text.strip()[:MAX_MODEL_CHARS])
+
+
+class ToxicityFieldsTests(SimpleTestCase):
+    TEXT = 'you idiot, this plan is not good at all'
+
+    def setUp(self):
+        patcher = mock.patch.object(verdict_store, 'enabled', False)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def post(self, fields=None, use_ml=False, expected_status=200):
+        body = {'text': self.TEXT, 'use_ml': use_ml, 'detail': 'debug'}
+        if fields is not None:
+            body['fields'] = fields
+        response = post_json(self.client, '/api/sentiment/toxicity/', body)
+        self.assertEqual(response.status_code, expected_status, response.content[:200])
+        return response.json()
+
+    def test_default_is_toxicity_only(self):
+        data = self.post()
+        self.assertTrue(data['toxicity']['isToxic'])
+        self.assertNotIn('sentimentAnalysis', data)
+        self.assertNotIn('wordAnalysis', data)
+        self.assertEqual(data['debug']['stages'], ['keywords', 'toxicity'])
+
+    def test_only_the_stages_the_fields_need_run(self):
+        cases = {
+            'sentiment': (['lexicon', 'sentiment'], {'sentimentAnalysis'}),
+            'sentiment,explanations': (['lexicon', 'sentiment', 'explanations'], {'sentimentAnalysis', 'wordAnalysis'}),
+            'toxicity,explanations': (['keywords', 'toxicity', 'lexicon', 'explanations'], {'toxicity', 'wordAnalysis'}),
+        }
+        outputs = {'toxicity', 'sentimentAnalysis', 'wordAnalysis'}
+        for fields, (stages, present) in cases.items():
+            with self.subTest(fields=fields):
+                data = self.post(fields)
+                self.assertEqual(data['debug']['stages'], stages)
+                self.assertEqual(outputs & set(data), present)
+
+    def test_list_and_comma_separated_fields_are_equivalent(self):
+        self.assertEqual(
+            self.post(['explanations', 'toxicity'])['wordAnalysis'],
+            self.post('toxicity, explanations')['wordAnalysis']
+        )
+
+    def test_unknown_or_blank_fields_are_rejected(self):
+        for fields in ('toxicity,score', ['sentiment', 'emotion'], ',', 42):
+            with self.subTest(fields=fields):
+                data = self.post(fields, expected_status=400)
+                self.assertTrue(data['error'].startswith('Invalid fields'))
+
+
+class TrendingTermsTests(SimpleTestCase):
+    NOW = 1_000_000 * 60
+
+    def test_counts_per_category_with_growth_over_the_previous_window(self):
+        trending = TrendingTerms(bucket_seconds=60, bucket_count=4)
+        trending.observe({('insult', 'idiot')}, now=self.NOW - 60)
+        for _ in range(3):
+            trending.observe({('insult', 'idiot'), ('insult', 'moron')}, now=self.NOW)
+        trending.observe({('threat', 'kill')}, now=self.NOW)
+
+        data = trending.top(60, k=5, now=self.NOW)
+        self.assertEqual(data['window_seconds'], 60)
+        insult = data['categories']['insult']
+        self.assertEqual(insult['total'], 6)
+        self.assertEqual(
+            insult['terms'],
+            [{'term': 'idiot', 'count': 3, 'previous': 1, 'growth': 3.0},
+             {'term': 'moron', 'count': 3, 'previous': 0, 'growth': None}]
+        )
+        self.assertEqual(data['categories']['threat']['terms'][0]['count'], 1)
+        self.assertEqual(data['categories']['profanity'], {'total': 0, 'terms': []})
+
+        # A window longer than half the ring has no previous window to compare with
+        wide = trending.top(180, k=1, now=self.NOW)['categories']['insult']['terms']
+        self.assertEqual(wide, [{'term': 'idiot', 'count': 4}])
+
+    def test_buckets_are_reset_when_the_ring_comes_round(self):
+        trending = TrendingTerms(bucket_seconds=60, bucket_count=2)
+        trending.observe({('insult', 'idiot')}, now=self.NOW)
+        trending.observe({('insult', 'moron')}, now=self.NOW + 120)
+        terms = trending.top(120, now=self.NOW + 120)['categories']['insult']['terms']
+        self.assertEqual(terms, [{'term': 'moron', 'count': 1}])
+
+    def test_parse_window(self):
+        cases = {'900': 900, '15m': 900, ' 1H ': 3600, '30s': 30, '0': None, '15d': None, 'soon': None}
+        for value, expected in cases.items():
+            with self.subTest(value=value):
+                self.assertEqual(parse_window(value), expected)
+
+    def test_toxic_verdicts_feed_the_trending_endpoint(self):
+        trending = TrendingTerms()
+        with mock.patch('sentiment.views.trending_terms', trending), \
+                mock.patch('sentiment.trending.trending_terms', trending), \
+                mock.patch.object(verdict_store, 'enabled', False):
+            # The second message reuses the first's verdict and still counts
+            for _ in range(2):
+                post_json(self.client, '/api/sentiment/toxicity/',
+                          {'text': 'what an idiot move that was', 'use_ml': False})
+            post_json(self.client, '/api/sentiment/toxicity/', {'text': 'lovely weather today', 'use_ml': False})
+            response = self.client.get('/api/sentiment/trending/?window=15m&k=3&category=insult')
+
+        self.assertEqual(response.status_code, 200)
+        data = response.json()['data']
+        self.assertEqual(list(data['categories']), ['insult'])
+        self.assertEqual(data['categories']['insult']['terms'][0]['term'], 'idiot')
+        self.assertEqual(data['categories']['insult']['terms'][0]['count'], 2)
+        self.assertEqual(data['sketch_bytes'], trending.memory_bytes())
+
+    def test_invalid_parameters_are_rejected(self):
+        for query in ('window=forever', 'k=0', 'k=1000', 'category=spam'):
+            with self.subTest(query=query):
+                response = self.client.get(f'/api/sentiment/trending/?{query}')
+                self.assertEqual(response.status_code, 400)
+                self.assertFalse(response.json()['success'])
+
+
+class MemoryAccountingTests(SimpleTestCase):
+    URL = '/api/sentiment/memory/'
+    TOKEN = {PROFILE_HEADER: 'internal-token'}
+
+    def setUp(self):
+        self.tracer = AllocationTracer(max_snapshots=2)
+        self.addCleanup(self.tracer.stop)
+        for patcher in (mock.patch.object(request_profiler, 'token', 'internal-token'),
+                        mock.patch('sentiment.memory.tracer', self.tracer)):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def act(self, action, **body):
+        response = self.client.post(self.URL, json.dumps({'action': action, **body}),
+                                    content_type='application/json', headers=self.TOKEN)
+        return response.status_code, response.json()
+
+    def test_both_methods_need_the_internal_token(self):
+        for headers in ({}, {PROFILE_HEADER: 'wrong'}):
+            with self.subTest(headers=headers):
+                self.assertEqual(self.client.get(self.URL, headers=headers).status_code, 403)
+                response = self.client.post(self.URL, json.dumps({'action': 'start'}),
+                                            content_type='application/json', headers=headers)
+                self.assertEqual(response.status_code, 403)
+                self.assertFalse(self.tracer.status()['tracing'])
+
+    def test_report_covers_the_process_and_every_structure(self):
+        response = self.client.get(self.URL, headers=self.TOKEN)
+        self.assertEqual(response.status_code, 200)
+        data = response.json()['data']
+        self.assertIn('peak_rss_mb', data['process'])
+        for name in ('lexicon.analyzer', 'cache.near_duplicates', 'aggregate.trending_terms', 'shadow.candidates'):
+            self.assertGreater(data['components'][name]['bytes'], 0)
+        sizes = [component['bytes'] for component in data['components'].values()]
+        self.assertEqual(sizes, sorted(sizes, reverse=True))
+        self.assertFalse(data['tracemalloc']['tracing'])
+
+    def test_deep_size_counts_shared_objects_once_and_flags_lower_bounds(self):
+        item = 'x' * 10_000
+        self.assertLess(deep_size([item, item])[0], deep_size([item, 'y' * 10_000])[0])
+        self.assertEqual(deep_size(list(range(100)), max_objects=10)[1], False)
+        self.assertEqual(deep_size(list(range(100)))[1], True)
+
+    def test_snapshots_diffs_and_stop(self):
+        self.assertEqual(self.act('snapshot')[0], 400)  # Not tracing yet
+
+        status, body = self.act('start')
+        self.assertEqual(status, 200)
+        self.assertTrue(body['data']['tracing'])
+        first = self.act('snapshot', top=5)[1]['data']
+        retained = [bytearray(1024) for _ in range(1000)]
+        second = self.act('snapshot', top=5)[1]['data']
+        self.assertEqual((first['id'], second['id']), (1, 2))
+        self.assertLessEqual(len(second['top']), 5)
+
+        status, body = self.act('diff', **{'from': 1, 'to': 2})
+        self.assertEqual(status, 200)
+        self.assertGreater(body['data']['growth_kb'], 900)
+        self.assertIn('kb_diff', body['data']['top'][0])
+        del retained
+
+        # Only the newest snapshots are kept
+        self.act('snapshot')
+        self.assertEqual(self.tracer.status()['snapshots'], [2, 3])
+        self.assertEqual(self.act('diff', **{'from': 1, 'to': 3})[0], 400)
+
+        status, body = self.act('stop')
+        self.assertEqual(status, 200)
+        self.assertEqual((body['data']['tracing'], body['data']['snapshots']), (False, []))
+
+    def test_unknown_actions_are_rejected(self):
+        for body in ({'action': 'explode'}, {'action': 'diff'}, {'action': 'start', 'frames': 'many'}):
+            with self.subTest(body=body):
+                status, data = self.act(**body)
+                self.assertEqual(status, 400)
+                self.assertFalse(data['success'])
@@ -0,0 +1,268 @@
+"""
+Persistent, pipelined transport for Node-to-Django inference.
+
+Instead of one HTTP request per chat message, a client keeps a single Unix
+domain socket (or TCP) connection open and writes newline-delimited JSON
+frames:
+
+    {"id": "42", "endpoint": "toxicity", "data": {"text": "...", "detail": "minimal"},
+     "deadline": 1735689600000}
+
+Requests on a connection are handled concurrently by a thread pool and
+answered as soon as each one completes, so responses may arrive out of order;
+the ``id`` correlates them. The optional ``deadline`` (epoch milliseconds)
+plays the role of the X-Request-Deadline header:
+
+    {"id": "42", "status": 200, "data": {...}}
+
+Errors about a frame whose id can't be read (invalid JSON, or a frame over
+MAX_FRAME_BYTES, which also ends the connection once the requests read
+before it are answered) have ``"id": null``. Clients can't tell which
+request they belong to, so they fail whatever is still pending.
+
+The frames are served by the same view code as the HTTP API (``data`` is
+exactly the HTTP request body), so caches, rollups and response profiles
+behave identically on both paths.
+"""
+
+import asyncio
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from django.db import close_old_connections
+
+from sentiment.deadlines import DEADLINE_HEADER
+from sentiment.profiling import request_profiler
+from sentiment.renderers import CompactJSONRenderer
+from sentiment.shadow import shadow_evaluator
+
+# Largest accepted frame; longer lines are answered with an error
+MAX_FRAME_BYTES = 1 << 20
+# Permissions of the Unix socket: the serving user and its group
+SOCKET_MODE = 0o660
+
+_renderer = CompactJSONRenderer()
+
+
+class InferenceRequest:
+    """
+    Minimal stand-in for a DRF Request.
+
+    The analysis views only read ``request.data``, ``request.query_params``
+    and the deadline header, so frames skip HTTP parsing and content
+    negotiation entirely.
+    """
+
+    def __init__(self, data, headers=None):
+        self.data = data
+        self.query_params = {}
+        self.headers = headers or {}
+
+
+def _endpoints():
+    from sentiment.views import EnhancedSentimentAPIView, SentimentAPIView, ToxicityAPIView
+    return {
+        'analyze': SentimentAPIView,
+        'enhanced': EnhancedSentimentAPIView,
+        'toxicity': ToxicityAPIView,
+    }
+
+
+def dispatch(message):
+    """Run one request frame through its view and return the response frame"""
+    request_id = message.get('id')
+    view_class = _endpoints().get(message.get('endpoint'))
+    if view_class is None:
+        return {'id': request_id, 'status': 404, 'data': {'error': 'Unknown endpoint'}}
+
+    data = message.get('data')
+    if not isinstance(data, dict):
+        return {'id': request_id, 'status': 400, 'data': {'error': 'Frame data must be an object'}}
+
+    try:
+        headers = {DEADLINE_HEADER: str(message['deadline'])} if message.get('deadline') else None
+        with request_profiler.maybe_profile(f"frame {message['endpoint']}", message.get('profile')) as profile:
+            response = view_class().post(InferenceRequest(data, headers))
+    except Exception as e:
+        return {'id': request_id, 'status': 500, 'data': {'error': str(e)}}
+    frame = {'id': request_id, 'status': response.status_code, 'data': response.data}
+    if profile['file']:
+        frame['profile_file'] = profile['file']
+    return frame
+
+
+def dispatch_deferred(message):
+    """
+    dispatch(), plus the shadow evaluations to start once the frame is sent
+
+    Runs in a long-lived pool thread, so stale database connections (the
+    verdict store, moderation lists) are closed around every frame, as
+    Django does around every HTTP request.
+    """
+    close_old_connections()
+    try:
+        frame = dispatch(message)
+    finally:
+        close_old_connections()
+    return frame, shadow_evaluator.take_pending()
+
+
+def encode_frame(frame):
+    return _renderer.render(frame) + b'\n'
+
+
+class InferenceServer:
+    """asyncio server answering pipelined frames from a shared thread pool"""
+
+    def __init__(self, workers=4, max_in_flight=256):
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='inference')
+        self.max_in_flight = max_in_flight
+        self.connections = 0
+        self.frames = 0
+
+    async def handle_connection(self, reader, writer):
+        loop = asyncio.get_running_loop()
+        # Stop reading new frames while too many are still being analyzed
+        in_flight = asyncio.Semaphore(self.max_in_flight)
+        write_lock = asyncio.Lock()
+        tasks = set()
+        self.connections += 1
+
+        async def respond(frame):
+            async with write_lock:
+                writer.write(encode_frame(frame))
+                await writer.drain()
+
+        async def process(message):
+            try:
+                frame, shadow_jobs = await loop.run_in_executor(self.executor, dispatch_deferred, message)
+                await respond(frame)
+                shadow_evaluator.submit(shadow_jobs)
+            finally:
+                in_flight.release()
+
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except (asyncio.LimitOverrunError, ValueError):
+                    # The rest of the stream can't be split into frames: answer
+                    # everything read so far, then report the error and close.
+                    # The error has no id, so clients fail what is still pending
+                    if tasks:
+                        await asyncio.gather(*tasks, return_exceptions=True)
+                    await respond({'id': None, 'status': 413, 'data': {'error': 'Frame too large'}})
+                    break
+                if not line:
+                    break
+                if not line.strip():
+                    continue
+
+                try:
+                    message = json.loads(line)
+                    if not isinstance(message, dict):
+                        raise ValueError('frame must be an object')
+                except ValueError as e:
+                    await respond({'id': None, 'status': 400, 'data': {'error': f'Invalid frame: {e}'}})
+                    continue
+
+                self.frames += 1
+                await in_flight.acquire()
+                task = asyncio.ensure_future(process(message))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+
+            if tasks:
+                await asyncio.gather(*tasks, return_exceptions=True)
+        except ConnectionError:
+            pass
+        finally:
+            # Nobody is left to answer when the client went away
+            for task in tasks:
+                task.cancel()
+            self.connections -= 1
+            writer.close()
+
+    async def serve(self, socket_path=None, host='127.0.0.1', port=None, socket_mode=SOCKET_MODE):
+        if socket_path:
+            if os.path.exists(socket_path):
+                os.unlink(socket_path)
+            server = await asyncio.start_unix_server(
+                self.handle_connection, path=socket_path, limit=MAX_FRAME_BYTES
+            )
+            # Not the umask's default: only the owner and its group may connect
+            os.chmod(socket_path, socket_mode)
+        else:
+            server = await asyncio.start_server(
+                self.handle_connection, host=host, port=port, limit=MAX_FRAME_BYTES
+            )
+        async with server:
+            await server.serve_forever()
+
+
+class InferenceClient:
+    """
+    Pipelining asyncio client, used by the transport benchmark.
+
+    ``request`` may be awaited from many tasks at once; all of them share one
+    connection and are matched to their responses by ID.
+    """
+
+    def __init__(self, socket_path=None, host='127.0.0.1', port=None):
+        self.socket_path = socket_path
+        self.host = host
+        self.port = port
+        self._reader = None
+        self._writer = None
+        self._pending = {}
+        self._next_id = 0
+        self._reader_task = None
+
+    async def connect(self):
+        if self.socket_path:
+            self._reader, self._writer = await asyncio.open_unix_connection(
+                self.socket_path, limit=MAX_FRAME_BYTES
+            )
+        else:
+            self._reader, self._writer = await asyncio.open_connection(
+                self.host, self.port, limit=MAX_FRAME_BYTES
+            )
+        self._reader_task = asyncio.ensure_future(self._read_responses())
+
+    async def _read_responses(self):
+        while True:
+            line = await self._reader.readline()
+            if not line:
+                break
+            frame = json.loads(line)
+            if frame.get('id') is None:
+                # A connection-level error (e.g. 413): no request will be answered
+                self._fail_pending(ConnectionError(f"Inference error {frame.get('status')}: {frame.get('data')}"))
+                continue
+            future = self._pending.pop(frame['id'], None)
+            if future is not None and not future.done():
+                future.set_result(frame)
+
+        self._fail_pending(ConnectionError('Inference connection closed'))
+
+    def _fail_pending(self, error):
+        for future in self._pending.values():
+            if not future.done():
+                future.set_exception(error)
+        self._pending.clear()
+
+    async def request(self, endpoint, data):
+        self._next_id += 1
+        request_id = str(self._next_id)
+        future = asyncio.get_running_loop().create_future()
+        self._pending[request_id] = future
+        self._writer.write(encode_frame({'id': request_id, 'endpoint': endpoint, 'data': data}))
+        await self._writer.drain()
+        return await future
+
+    async def close(self):
+        if self._writer is not None:
+            self._writer.close()
+        if self._reader_task is not None:
+            self._reader_task.cancel()
@@ -0,0 +1,247 @@
+"""
+Trending toxic terms for the moderation dashboard, in constant memory.
+
+Every toxic verdict feeds its detected keywords, per category, into a ring of
+time buckets (like the conversation rollups). Only keywords of the global
+lists are counted, so a group's own blocked words are never published. Each
+bucket holds, per category:
+
+- a Count-Min sketch (``depth`` rows of ``width`` counters) that estimates
+  any term's count, never under, and over by at most ~e/width of the
+  bucket's total with high probability;
+- a Space-Saving summary of at most ``capacity`` terms, the candidates for
+  the heaviest hitters.
+
+A query for the last N seconds takes the candidates of the buckets in that
+window and ranks them by their summed sketch estimates. Each term's count in
+the window before it gives the growth, so "spiking right now" is visible
+next to "always frequent". Memory is fixed by the settings, however much
+traffic there is; buckets are reset when the ring comes round to them.
+
+    GET /api/sentiment/trending/?window=15m&k=10&category=insult
+"""
+
+import re
+import threading
+import time
+from array import array
+
+from django.conf import settings
+from django.http import JsonResponse
+from django.views import View
+
+CATEGORIES = ('profanity', 'threat', 'insult', 'identity_attack')
+
+
+class CountMinSketch:
+    """Approximate counts of a stream of terms in ``depth`` x ``width`` counters"""
+
+    __slots__ = ('width', 'rows', 'total')
+
+    def __init__(self, width, depth):
+        self.width = width
+        self.rows = [None] * depth
+        self.clear()
+
+    def _slots(self, term):
+        # One independent hash per row (hash() is stable within a process)
+        return [hash((row, term)) % self.width for row in range(len(self.rows))]
+
+    def add(self, term, count=1):
+        for row, slot in zip(self.rows, self._slots(term)):
+            row[slot] += count
+        self.total += count
+
+    def estimate(self, term):
+        return min(row[slot] for row, slot in zip(self.rows, self._slots(term)))
+
+    def clear(self):
+        self.rows = [array('L', bytes(array('L').itemsize * self.width)) for _ in self.rows]
+        self.total = 0
+
+
+class SpaceSaving:
+    """The (at most) ``capacity`` heaviest terms of a stream"""
+
+    __slots__ = ('capacity', 'counts')
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.counts = {}
+
+    def add(self, term, count=1):
+        if term in self.counts or len(self.counts) < self.capacity:
+            self.counts[term] = self.counts.get(term, 0) + count
+            return
+        # Replace the lightest term; the newcomer inherits its count as error
+        lightest = min(self.counts, key=self.counts.get)
+        self.counts[term] = self.counts.pop(lightest) + count
+
+    def clear(self):
+        self.counts.clear()
+
+
+class _Bucket:
+    __slots__ = ('start', 'sketches', 'heavy')
+
+    def __init__(self, width, depth, capacity):
+        self.start = None
+        self.sketches = {category: CountMinSketch(width, depth) for category in CATEGORIES}
+        self.heavy = {category: SpaceSaving(capacity) for category in CATEGORIES}
+
+    def reset(self, start):
+        for category in CATEGORIES:
+            self.sketches[category].clear()
+            self.heavy[category].clear()
+        self.start = start
+
+
+class TrendingTerms:
+    """Ring of ``bucket_count`` time buckets of per-category term sketches"""
+
+    def __init__(self, bucket_seconds=300, bucket_count=24, width=1024, depth=4, capacity=64):
+        self.bucket_seconds = bucket_seconds
+        self.width = width
+        self.depth = depth
+        self.capacity = capacity
+        self._buckets = [_Bucket(width, depth, capacity) for _ in range(bucket_count)]
+        self._lock = threading.Lock()
+
+    def _bucket(self, now):
+        start = int(now // self.bucket_seconds) * self.bucket_seconds
+        bucket = self._buckets[(start // self.bucket_seconds) % len(self._buckets)]
+        if bucket.start != start:
+            # Slot last used a full ring ago: reset it for the current bucket
+            bucket.reset(start)
+        return bucket
+
+    def observe(self, hits, now=None):
+        """Count ``(category, term)`` pairs seen in one message"""
+        now = time.time() if now is None else now
+        with self._lock:
+            bucket = self._bucket(now)
+            for category, term in hits:
+                if category in bucket.sketches:
+                    bucket.sketches[category].add(term)
+                    bucket.heavy[category].add(term)
+
+    def _window(self, now, buckets, offset=0):
+        """Live buckets among the ``buckets`` ending ``offset`` buckets before the current one"""
+        current = int(now // self.bucket_seconds) * self.bucket_seconds
+        newest = current - offset * self.bucket_seconds
+        oldest = newest - (buckets - 1) * self.bucket_seconds
+        return [b for b in self._buckets if b.start is not None and oldest <= b.start <= newest]
+
+    def window_buckets(self, window_seconds):
+        """Buckets covering ``window_seconds``, at least one and at most the whole ring"""
+        return max(1, min(len(self._buckets), -(-int(window_seconds) // self.bucket_seconds)))
+
+    def top(self, window_seconds, k=10, categories=CATEGORIES, now=None):
+        """
+        The ``k`` heaviest terms per category over the last ``window_seconds``
+        (rounded up to whole buckets), with their counts in the preceding
+        window of the same length where the ring still holds it
+        """
+        now = time.time() if now is None else now
+        buckets = self.window_buckets(window_seconds)
+        has_previous = buckets * 2 <= len(self._buckets)
+
+        with self._lock:
+            window = self._window(now, buckets)
+            previous = self._window(now, buckets, offset=buckets) if has_previous else []
+            result = {}
+            for category in categories:
+                candidates = set()
+                for bucket in window:
+                    candidates.update(bucket.heavy[category].counts)
+                estimates = {
+                    term: sum(bucket.sketches[category].estimate(term) for bucket in window)
+                    for term in candidates
+                }
+                ranked = sorted(estimates.items(), key=lambda item: (-item[1], item[0]))[:k]
+                terms = []
+                for term, count in ranked:
+                    entry = {'term': term, 'count': count}
+                    if has_previous:
+                        before = sum(bucket.sketches[category].estimate(term) for bucket in previous)
+                        entry['previous'] = before
+                        entry['growth'] = round(count / before, 2) if before else None
+                    terms.append(entry)
+                result[category] = {
+                    'total': sum(bucket.sketches[category].total for bucket in window),
+                    'terms': terms,
+                }
+
+        return {
+            'window_seconds': buckets * self.bucket_seconds,
+            'categories': result,
+        }
+
+    def memory_bytes(self):
+        """Fixed size of the sketch counters (Space-Saving adds ``capacity`` terms per sketch)"""
+        return len(self._buckets) * len(CATEGORIES) * self.depth * self.width * array('L').itemsize
+
+
+trending_terms = TrendingTerms(
+    bucket_seconds=getattr(settings, 'SENTIMENT_TRENDING_BUCKET_SECONDS', 300),
+    bucket_count=getattr(settings, 'SENTIMENT_TRENDING_BUCKETS', 24),
+    width=getattr(settings, 'SENTIMENT_TRENDING_SKETCH_WIDTH', 1024),
+    depth=getattr(settings, 'SENTIMENT_TRENDING_SKETCH_DEPTH', 4),
+    capacity=getattr(settings, 'SENTIMENT_TRENDING_CAPACITY', 64),
+)
+
+
+def keyword_hits(toxicity, matcher):
+    """``(category, term)`` pairs behind a toxicity verdict's detected keywords"""
+    categories = set(toxicity.get('categories', ()))
+    return {
+        (category, word)
+        for word in toxicity.get('detectedKeywords', ())
+        for category in matcher.get(word, ())
+        if category in categories
+    }
+
+
+WINDOW = re.compile(r'(\d+)([smh]?)')
+WINDOW_UNITS = {'': 1, 's': 1, 'm': 60, 'h': 3600}
+
+
+def parse_window(value):
+    """Seconds in a window such as '900', '15m' or '1h'; None if malformed"""
+    match = WINDOW.fullmatch(value.strip().lower())
+    if not match or int(match.group(1)) == 0:
+        return None
+    return int(match.group(1)) * WINDOW_UNITS[match.group(2)]
+
+
+class TrendingTermsAPIView(View):
+    """Top toxic terms per category over a recent window"""
+
+    def get(self, request):
+        window = parse_window(request.GET.get('window', '1h'))
+        if window is None:
+            return JsonResponse({
+                'success': False,
+                'error': "Invalid window. Use seconds or a number with s, m or h, e.g. '15m'"
+            }, status=400)
+
+        try:
+            k = int(request.GET.get('k', 10))
+        except ValueError:
+            k = 0
+        if not 1 <= k <= trending_terms.capacity:
+            return JsonResponse({
+                'success': False,
+                'error': f'k must be between 1 and {trending_terms.capacity}'
+            }, status=400)
+
+        category = request.GET.get('category')
+        if category is not None and category not in CATEGORIES:
+            return JsonResponse({
+                'success': False,
+                'error': f'Invalid category. Choose from: {", ".join(CATEGORIES)}'
+            }, status=400)
+
+        data = trending_terms.top(window, k, categories=(category,) if category else CATEGORIES)
+        data['sketch_bytes'] = trending_terms.memory_bytes()
+        return JsonResponse({'success': True, 'data': data})
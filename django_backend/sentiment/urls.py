@@ -2,10 +2,22 @@
 from django.urls import path
 from .views import SentimentAPIView, ToxicityAPIView, EnhancedSentimentAPIView
 from .analytics import ModelAnalyticsAPIView
+from .rollups import ConversationRollupAPIView
+from .admission import AdmissionStatsAPIView
+from .moderation_lists import GroupModerationListsAPIView
+from .trending import TrendingTermsAPIView
+from .shadow import ShadowEvaluationAPIView
+from .memory import MemoryAPIView
 
 urlpatterns = [
     path('analyze/', SentimentAPIView.as_view(), name='analyze-sentiment'),
     path('enhanced/', EnhancedSentimentAPIView.as_view(), name='enhanced-sentiment'),
     path('toxicity/', ToxicityAPIView.as_view(), name='analyze-toxicity'),
     path('analytics/', ModelAnalyticsAPIView.as_view(), name='model-analytics'),
+    path('rollups/<str:conversation_id>/', ConversationRollupAPIView.as_view(), name='conversation-rollup'),
+    path('admission/', AdmissionStatsAPIView.as_view(), name='admission-stats'),
+    path('trending/', TrendingTermsAPIView.as_view(), name='trending-terms'),
+    path('shadow/', ShadowEvaluationAPIView.as_view(), name='shadow-evaluation'),
+    path('memory/', MemoryAPIView.as_view(), name='memory-accounting'),
+    path('groups/<str:group_id>/lists/', GroupModerationListsAPIView.as_view(), name='group-moderation-lists'),
 ]
@@ -0,0 +1,250 @@
+"""
+Persistent verdict store shared by every worker on the host.
+
+Verdicts are kept in the project database (``DATABASES['default']``),
+identified by a version derived from the model files and analysis code and a
+key hashing that version with the endpoint namespace and normalized text.
+Lookups are a single indexed query; writes and hit counters are queued and
+flushed by a background thread, so the request path never waits on a write.
+
+Workers of different versions can share the database during a rolling
+deploy. Each reads and writes only its own version's rows, so they never
+overwrite or delete each other's verdicts. Compaction drops rows unused for
+``ttl_seconds`` and the least recently used rows beyond ``max_rows``. Rows of
+a retired version are no longer used, so they leave through those two limits.
+
+Only the store switches the database to WAL, on the connections opened once
+it is first used, so management commands and tests leave the file as it is.
+"""
+
+import atexit
+import hashlib
+import os
+import threading
+import time
+import traceback
+
+from django.conf import settings
+from django.db import DatabaseError, close_old_connections, connection
+from django.db.backends.signals import connection_created
+from django.db.models import F
+
+from sentiment import model_store
+from sentiment.models import StoredVerdict
+from sentiment.near_duplicates import normalize
+
+_SENTIMENT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Everything a stored verdict depends on; changing any of these files or
+# settings invalidates the whole store
+VERSION_FILES = [
+    model_store.NB_MODEL_PATH,
+    model_store.SVC_MODEL_PATH,
+    *(os.path.join(_SENTIMENT_DIR, name) for name in (
+        'enhanced_sentiment.py', 'moderation_lists.py', 'naive_bayes.py', 'pipeline.py', 'views.py',
+    )),
+]
+_EXTENDED_LEXICON = getattr(settings, 'SENTIMENT_EXTENDED_LEXICON', model_store.EXTENDED_LEXICON_PATH)
+if _EXTENDED_LEXICON and os.path.exists(_EXTENDED_LEXICON):
+    VERSION_FILES.append(_EXTENDED_LEXICON)
+# Limits on how much of a message is scanned, explained and scored
+VERSION_SETTINGS = ('SENTIMENT_MAX_WORDS', 'SENTIMENT_MAX_EXPLAINED_WORDS', 'SENTIMENT_MAX_MODEL_CHARS')
+
+# Set on every connection once the store is in use; WAL lets every worker
+# read the store while one writes
+CONNECTION_PRAGMAS = ('PRAGMA journal_mode=WAL', 'PRAGMA synchronous=NORMAL')
+
+
+def configure_connection(sender=None, connection=None, **kwargs):
+    """connection_created receiver applying CONNECTION_PRAGMAS to SQLite connections"""
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        for pragma in CONNECTION_PRAGMAS:
+            cursor.execute(pragma)
+
+
+class VerdictStore:
+    def __init__(self, enabled=True, max_rows=200000, ttl_seconds=7 * 86400,
+                 flush_interval=1.0, compact_interval=300, max_pending=10000):
+        self.enabled = enabled
+        self.max_rows = max_rows
+        self.ttl_seconds = ttl_seconds
+        self.flush_interval = flush_interval
+        self.compact_interval = compact_interval
+        self.max_pending = max_pending
+
+        self._version = None
+        self._configured = False
+        self._pending = {}   # key -> (verdict, created_at), waiting to be written
+        self._touches = {}   # key -> hits since the last flush
+        self._lock = threading.Lock()
+        self._thread = None
+        self._last_compaction = 0.0
+
+        self.hits = 0
+        self.misses = 0
+        self.dropped_writes = 0
+
+    @property
+    def version(self):
+        if self._version is None:
+            sha = hashlib.sha1()
+            for path in VERSION_FILES:
+                sha.update(model_store.file_hash(path).encode())
+            for name in VERSION_SETTINGS:
+                sha.update(f'{name}={getattr(settings, name, None)}'.encode())
+            self._version = sha.hexdigest()[:16]
+        return self._version
+
+    def make_key(self, namespace, text):
+        return hashlib.sha256(f'{self.version}\0{namespace}\0{normalize(text)}'.encode('utf-8')).hexdigest()
+
+    def _disable(self, error):
+        # A missing table (migrations not applied) or a broken database must
+        # never fail analysis requests
+        print(f"❌ Verdict store disabled: {error}")
+        self.enabled = False
+
+    def get(self, namespace, text):
+        """Stored verdict for ``text`` or None"""
+        if not self.enabled:
+            return None
+
+        key = self.make_key(namespace, text)
+        with self._lock:
+            pending = self._pending.get(key)
+        if pending is not None:
+            verdict = pending[0]
+        else:
+            try:
+                self._configure_connections()
+                verdict = (
+                    StoredVerdict.objects
+                    .filter(key=key, model_version=self.version,
+                            last_used_at__gte=time.time() - self.ttl_seconds)
+                    .values_list('verdict', flat=True)
+                    .first()
+                )
+            except DatabaseError as e:
+                self._disable(e)
+                return None
+
+        if verdict is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        with self._lock:
+            self._touches[key] = self._touches.get(key, 0) + 1
+            self._ensure_writer()
+        return verdict
+
+    def put(self, namespace, text, verdict):
+        """Queue ``verdict`` for writing; never blocks on the database"""
+        if not self.enabled:
+            return
+
+        key = self.make_key(namespace, text)
+        with self._lock:
+            if len(self._pending) >= self.max_pending:
+                self.dropped_writes += 1
+                return
+            self._pending[key] = (verdict, time.time())
+            self._ensure_writer()
+
+    def _configure_connections(self):
+        """Apply CONNECTION_PRAGMAS to this thread's connection and every later one"""
+        if self._configured:
+            return
+        self._configured = True
+        connection_created.connect(configure_connection, dispatch_uid='sentiment-verdict-store-pragmas')
+        # PRAGMAs are ignored or fail inside a transaction; the next connection gets them
+        if connection.connection is not None and not connection.in_atomic_block:
+            configure_connection(connection=connection)
+
+    def _ensure_writer(self):
+        # Called with the lock held
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='verdict-store', daemon=True)
+            self._thread.start()
+            atexit.register(self._flush_at_exit)
+
+    def _run(self):
+        while self.enabled:
+            time.sleep(self.flush_interval)
+            close_old_connections()
+            try:
+                self._configure_connections()
+                self.flush()
+                if time.time() - self._last_compaction >= self.compact_interval:
+                    self.compact()
+            except DatabaseError as e:
+                self._disable(e)
+            except Exception:
+                traceback.print_exc()
+
+    def _flush_at_exit(self):
+        try:
+            self.flush()
+        except DatabaseError as e:
+            print(f"❌ Verdict store not flushed at exit: {e}")
+
+    def flush(self):
+        """Write queued verdicts and hit counters"""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            touches, self._touches = self._touches, {}
+        if not pending and not touches:
+            return
+
+        now = time.time()
+        if pending:
+            StoredVerdict.objects.bulk_create(
+                [
+                    StoredVerdict(key=key, model_version=self.version, verdict=verdict,
+                                  created_at=created_at, last_used_at=now)
+                    for key, (verdict, created_at) in pending.items()
+                ],
+                update_conflicts=True,
+                unique_fields=['key', 'model_version'],
+                update_fields=['verdict', 'created_at', 'last_used_at'],
+            )
+
+        # One UPDATE per distinct hit count instead of one per key
+        by_count = {}
+        for key, count in touches.items():
+            by_count.setdefault(count, []).append(key)
+        for count, keys in by_count.items():
+            StoredVerdict.objects.filter(key__in=keys, model_version=self.version).update(
+                last_used_at=now, hits=F('hits') + count
+            )
+
+    def compact(self):
+        """Drop expired and least recently used rows, whatever their version"""
+        now = time.time()
+        self._last_compaction = now
+        StoredVerdict.objects.filter(last_used_at__lt=now - self.ttl_seconds).delete()
+
+        excess = StoredVerdict.objects.count() - self.max_rows
+        if excess > 0:
+            oldest = StoredVerdict.objects.order_by('last_used_at').values_list('id', flat=True)[:excess]
+            StoredVerdict.objects.filter(id__in=list(oldest)).delete()
+
+    def stats(self):
+        return {
+            'enabled': self.enabled,
+            'version': self.version if self.enabled else None,
+            'hits': self.hits,
+            'misses': self.misses,
+            'pending_writes': len(self._pending),
+            'dropped_writes': self.dropped_writes,
+        }
+
+
+verdict_store = VerdictStore(
+    enabled=getattr(settings, 'SENTIMENT_VERDICT_STORE', True),
+    max_rows=getattr(settings, 'SENTIMENT_VERDICT_STORE_MAX_ROWS', 200000),
+    ttl_seconds=getattr(settings, 'SENTIMENT_VERDICT_STORE_TTL_SECONDS', 7 * 86400),
+    flush_interval=getattr(settings, 'SENTIMENT_VERDICT_STORE_FLUSH_INTERVAL', 1.0),
+)
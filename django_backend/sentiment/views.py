@@ -1,54 +1,208 @@
-import os
-import pickle
+import time
 import traceback
-import re
+from itertools import islice
+from django.conf import settings
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
+from rest_framework.settings import api_settings
 
-# Import your NaiveBayesClassifier class if needed
-from sentiment.naive_bayes import NaiveBayesClassifier
 # Import the enhanced sentiment analyzer
-from sentiment.enhanced_sentiment import EnhancedSentimentAnalyzer  
+from sentiment.enhanced_sentiment import EnhancedSentimentAnalyzer, WORD_TOKEN, iter_tokens, load_extended_lexicon
+# Models are loaded lazily, once per worker
+from sentiment import model_store
+from sentiment.admission import gated_predict
+from sentiment.deadlines import Deadline, DeadlineExceeded, deadline_exceeded_response
+from sentiment.drift import drift_monitor
+from sentiment.moderation_lists import build_matcher, matcher_pool
+from sentiment.pipeline import Pipeline, Stage
+from sentiment.rollups import conversation_key, rollup_store
+from sentiment.trending import keyword_hits, trending_terms
+from sentiment.near_duplicates import near_duplicate_index
+from sentiment.verdict_store import verdict_store
+from sentiment.renderers import CompactJSONRenderer
 
-# Base directory setup
-BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Work done per request is bounded however long the message is: the lexicon
+# and keyword scans stop after MAX_WORDS tokens, explanations stop after
+# MAX_EXPLAINED words and the ML models only see the first MAX_MODEL_CHARS
+MAX_WORDS = getattr(settings, 'SENTIMENT_MAX_WORDS', 20000)
+MAX_EXPLAINED = getattr(settings, 'SENTIMENT_MAX_EXPLAINED_WORDS', 100)
+MAX_MODEL_CHARS = getattr(settings, 'SENTIMENT_MAX_MODEL_CHARS', 2000)
+# batch_analyze splits batches of at least BATCH_PARALLEL_SIZE texts across
+# BATCH_WORKERS processes
+BATCH_WORKERS = getattr(settings, 'SENTIMENT_BATCH_WORKERS', 1)
+BATCH_PARALLEL_SIZE = getattr(settings, 'SENTIMENT_BATCH_PARALLEL_SIZE', 20000)
 
-# Paths to your saved models
-NB_MODEL_PATH = os.path.join(BASE_DIR, 'Beyonder', 'nb_classifier.pkl')
-SVC_MODEL_PATH = os.path.join(BASE_DIR, 'Beyonder', 'svm_classifier.pkl')
+# Derived word scores that let the lexicon decide more messages without the
+# ML fallback; hand-picked scores still take precedence
+EXTENDED_LEXICON = getattr(settings, 'SENTIMENT_EXTENDED_LEXICON', model_store.EXTENDED_LEXICON_PATH)
+
+
+def build_analyzer():
+    extended_lexicon, lexicon_version = None, None
+    if EXTENDED_LEXICON:
+        try:
+            extended_lexicon, lexicon_version = load_extended_lexicon(EXTENDED_LEXICON)
+            print(f"📚 Extended lexicon {lexicon_version} loaded ({len(extended_lexicon)} words)")
+        except (OSError, ValueError, KeyError) as e:
+            print(f"⚠️ Extended lexicon not loaded, using the built-in lexicon only: {e}")
+    return EnhancedSentimentAnalyzer(
+        max_words=MAX_WORDS,
+        max_explained=MAX_EXPLAINED,
+        extended_lexicon=extended_lexicon,
+        lexicon_version=lexicon_version,
+        batch_workers=BATCH_WORKERS,
+        parallel_batch_size=BATCH_PARALLEL_SIZE,
+    )
+
+
+# The analyzer's lexicons are read-only, so one instance serves every request
+enhanced_analyzer = build_analyzer()
+
+# Response profiles, selected with the `detail` parameter:
+#   minimal  - verdict only; per-word explanations are not even computed
+#   standard - the full response (default)
+#   debug    - standard plus timings and intermediate results
+DETAIL_LEVELS = ('minimal', 'standard', 'debug')
+
+# Toxicity outputs callers can ask for with the `fields` parameter; only the
+# stages the requested fields depend on are run
+TOXICITY_FIELDS = ('toxicity', 'sentiment', 'explanations')
+
+# Default renderers plus ?format=compact for server-to-server callers
+ANALYSIS_RENDERERS = [*api_settings.DEFAULT_RENDERER_CLASSES, CompactJSONRenderer]
+
+
+# Rollup score of a model's label; the models give no score of their own
+LABEL_SCORES = {'positive': 1.0, 'negative': -1.0, 'neutral': 0.0}
+
+
+def model_input(text):
+    """The part of a message the ML models score; NB's cost grows with every word"""
+    return text[:MAX_MODEL_CHARS]
+
+
+def get_detail_level(request):
+    """Response profile requested via ?detail= or the request body, or None if invalid"""
+    detail = request.query_params.get('detail') or request.data.get('detail') or 'standard'
+    return detail if detail in DETAIL_LEVELS else None
+
+
+def get_fields(request, available, default):
+    """Requested output fields (a list or comma-separated), or None if any is unknown"""
+    fields = request.query_params.get('fields') or request.data.get('fields') or default
+    if isinstance(fields, str):
+        fields = [field.strip() for field in fields.split(',') if field.strip()]
+    if not isinstance(fields, (list, tuple)) or not fields or not set(fields) <= set(available):
+        return None
+    return tuple(field for field in available if field in fields)
+
+
+def invalid_fields_response(available):
+    return Response(
+        {'error': f'Invalid fields. Choose any of: {", ".join(available)}.'},
+        status=status.HTTP_400_BAD_REQUEST
+    )
+
+
+def invalid_detail_response():
+    return Response(
+        {'error': f'Invalid detail level. Choose one of: {", ".join(DETAIL_LEVELS)}.'},
+        status=status.HTTP_400_BAD_REQUEST
+    )
+
+
+def cached_verdict(namespace, text, signature, compute, use_cache=True):
+    """
+    Verdict for ``text``, reusing earlier work where possible
+
+    Checks the in-process near-duplicate index, then the persistent verdict
+    store shared by all workers, and only then calls ``compute()``. Returns
+    the verdict and the NearDuplicateMatch it came from (or None).
+    """
+    if not use_cache:
+        return compute(), None
+
+    duplicate = near_duplicate_index.lookup(namespace, text, signature)
+    if duplicate is not None:
+        return dict(duplicate.verdict), duplicate
+
+    verdict = verdict_store.get(namespace, text)
+    if verdict is None:
+        verdict = compute()
+        if verdict.get('degraded') or verdict.get('skipped_stages'):
+            # Computed while a model was shedding load or with stages cut
+            # for time: serve it, but don't keep reusing it
+            return dict(verdict), None
+        verdict_store.put(namespace, text, verdict)
+    near_duplicate_index.add(namespace, text, verdict, signature)
+    return dict(verdict), None
 
 
 class SentimentAPIView(APIView):
+    renderer_classes = ANALYSIS_RENDERERS
+
     def __init__(self):
         super().__init__()
-        # Initialize the enhanced sentiment analyzer
-        self.enhanced_analyzer = EnhancedSentimentAnalyzer()
+        self.enhanced_analyzer = enhanced_analyzer
+    
+    def lexicon_response(self, text, **flags):
+        """Lexicon-only answer used when the selected model cannot be run"""
+        result = self.enhanced_analyzer.analyze_sentiment(text, explain=False)
+        return Response({
+            'sentiment': result['sentiment'],
+            'method': 'lexicon_only',
+            **flags
+        })
+
+    def degraded_response(self, text, model_name):
+        """Answer used when the model's admission gate sheds the request"""
+        print(f"⚠️ {model_name.upper()} model overloaded, answering from the lexicon")
+        return self.lexicon_response(text, degraded=True)
     
     def post(self, request):
+        response = self.respond(request)
+        # Whichever path produced the verdict: enhanced, the NB/SVC model or the lexicon
+        conversation_id = conversation_key(request.data)
+        if conversation_id and response.status_code == 200:
+            sentiment = response.data['sentiment']
+            score = response.data.get('score', LABEL_SCORES.get(sentiment, 0.0))
+            rollup_store.observe_sentiment(conversation_id, sentiment, score)
+        return response
+
+    def respond(self, request):
         print("🚀 Request received for sentiment analysis")
 
         model_name = request.data.get('model')
         text = request.data.get('text', '').strip()
         use_enhanced = request.data.get('use_enhanced', True)  # New option for enhanced analysis
+        detail = get_detail_level(request)
+        deadline = Deadline.from_request(request)
 
         if not text:
             return Response({'error': 'No text provided'}, status=status.HTTP_400_BAD_REQUEST)
+        if detail is None:
+            return invalid_detail_response()
+        if deadline.expired():
+            return deadline_exceeded_response(deadline)
 
         # If enhanced analysis is requested, use the context-aware analyzer
         if use_enhanced:
             try:
                 print(f"🔍 Using enhanced sentiment analysis for: '{text}'")
-                result = self.enhanced_analyzer.analyze_sentiment(text)
+                result = self.enhanced_analyzer.analyze_sentiment(text, explain=detail != 'minimal')
+                drift_monitor.observe_lexicon(text, result)
                 
-                return Response({
+                response = {
                     'sentiment': result['sentiment'],
                     'confidence': result['confidence'],
                     'score': result['score'],
                     'method': result['method'],
-                    'word_analysis': result['word_analysis'],
-                    'enhanced': True
-                })
+                }
+                if detail != 'minimal':
+                    response['word_analysis'] = result['word_analysis']
+                response['enhanced'] = True
+                return Response(response)
                 
             except Exception as e:
                 print(f"❌ Enhanced sentiment analysis error: {e}")
@@ -56,13 +210,19 @@ class SentimentAPIView(APIView):
                 # Fall back to regular model analysis
                 use_enhanced = False
 
+        # The model runs only if it still fits the budget, as in the enhanced endpoint's fallback
+        if model_name in ('nb', 'svc'):
+            if deadline.expired():
+                return deadline_exceeded_response(deadline)
+            if not deadline.allows('ml_fallback'):
+                print(f"⏱️ No time left for the {model_name.upper()} model, answering from the lexicon")
+                return self.lexicon_response(text, skipped_stages=list(deadline.skipped))
+
         # Handle Naive Bayes model
         if model_name == 'nb':
             try:
-                with open(NB_MODEL_PATH, 'rb') as f:
-                    nb_classifier = pickle.load(f)
-                    print("✅ NB model loaded successfully")
-                    print(f"📝 Model type: {type(nb_classifier)}")
+                nb_classifier = model_store.get_model('nb')
+                print(f"📝 Model type: {type(nb_classifier)}")
             except Exception as e:
                 print("❌ Failed to load NB model:")
                 print(f"❌ Error: {e}")
@@ -71,16 +231,15 @@ class SentimentAPIView(APIView):
 
             try:
                 print(f"🔍 Input text: '{text}'")
-                print(f"🔍 Text type: {type(text)}")
                 
-                # Ensure text is processed as expected by the custom NB classifier
-                # The custom classifier expects a list of strings
-                prediction = nb_classifier.predict([text])
+                with deadline.timed('ml_fallback'):  # Loaded above
+                    prediction, admitted = gated_predict('nb', model_input(text), max_wait=deadline.remaining())
+                if not admitted:
+                    return self.degraded_response(text, 'nb')
                 print(f"✅ NB prediction successful: {prediction}")
-                print(f"📝 Prediction type: {type(prediction)}")
                 
-                if prediction and len(prediction) > 0:
-                    return Response({'sentiment': prediction[0]})
+                if prediction is not None:
+                    return Response({'sentiment': prediction})
                 else:
                     print("❌ Empty prediction result")
                     return Response({'error': 'No prediction returned'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
@@ -94,19 +253,18 @@ class SentimentAPIView(APIView):
         # Handle SVC model (with TF-IDF vectorizer)
         elif model_name == 'svc':
             try:
-                with open(SVC_MODEL_PATH, 'rb') as f:
-                    tfidf_vectorizer, svm_classifier = pickle.load(f)
-                    print("✅ SVC model loaded successfully")
+                model_store.get_model('svc')
             except Exception:
                 print("❌ Failed to load SVC model:")
                 traceback.print_exc()
                 return Response({'error': 'SVC model not loaded'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
             try:
-                # Vectorize the input text using loaded TF-IDF vectorizer
-                X_input = tfidf_vectorizer.transform([text])
-                prediction = svm_classifier.predict(X_input)
-                return Response({'sentiment': prediction[0]})
+                with deadline.timed('ml_fallback'):  # Loaded above
+                    prediction, admitted = gated_predict('svc', model_input(text), max_wait=deadline.remaining())
+                if not admitted:
+                    return self.degraded_response(text, 'svc')
+                return Response({'sentiment': prediction})
             except Exception as e:
                 print(f"❌ SVC prediction error: {e}")
                 return Response({'error': f'SVC prediction failed: {str(e)}'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
@@ -116,10 +274,11 @@ class SentimentAPIView(APIView):
 
 
 class ToxicityAPIView(APIView):
+    renderer_classes = ANALYSIS_RENDERERS
+
     def __init__(self):
         super().__init__()
-        # Initialize the enhanced sentiment analyzer
-        self.enhanced_analyzer = EnhancedSentimentAnalyzer()
+        self.enhanced_analyzer = enhanced_analyzer
         # Define toxicity keywords and patterns
         self.profanity_keywords = [
             'fuck', 'shit', 'damn', 'hell', 'bitch', 'asshole', 'bastard', 'crap',
@@ -140,111 +299,186 @@ class ToxicityAPIView(APIView):
             'racist',
             # Add more carefully selected terms
         ]
+        
+        # Keyword -> categories it counts towards, for a single-pass scan;
+        # groups with their own lists get a matcher built on top of this one
+        self.keyword_categories = build_matcher({
+            'profanity': self.profanity_keywords,
+            'threat': self.threat_keywords,
+            'insult': self.hate_keywords,
+            'identity_attack': self.identity_attack_keywords,
+        })
+
+        # Output fields callers may request, and the stages behind them:
+        #   toxicity     <- keywords, plus sentiment only when a keyword was found
+        #   sentiment    <- lexicon (NB model if the analyzer fails)
+        #   explanations <- lexicon, run with per-word explanations
+        self.pipeline = Pipeline([
+            Stage('keywords', lambda run: self.analyze_keywords(run.text, run.options.get('matcher'))),
+            Stage('lexicon', self.lexicon_stage),
+            Stage('sentiment', self.sentiment_stage),
+            Stage('explanations', lambda run: run.get('lexicon')['word_analysis'], requires=['lexicon']),
+            Stage('toxicity', self.toxicity_stage, requires=['keywords']),
+        ], fields=TOXICITY_FIELDS)
 
-    def analyze_toxicity_with_ml(self, text):
+    def analyze_toxicity_with_ml(self, text, deadline=None, observe=True):
         """
         Analyze toxicity using ML models and keyword detection
+
+        Sentiment is only analyzed for messages with keyword hits, and the
+        boost is skipped when ``deadline`` leaves no time for it. Synthetic
+        texts (warm-up) pass ``observe=False`` to stay out of drift monitoring.
         """
+        run = self.pipeline.run(text, ['toxicity'], deadline=deadline, use_ml=True, observe=observe)
+        result = run.get('toxicity')
+        if run.degraded:
+            result['degraded'] = True
+        return result
+
+    def toxicity_stage(self, run):
+        """Keyword verdict, raised in severity when the message is also negative"""
+        toxicity_data = dict(run.get('keywords'))
+        # The sentiment only ever raises the severity of a toxic message
+        if not run.options.get('use_ml', True) or not toxicity_data['isToxic']:
+            return toxicity_data
+        
         try:
-            # First, get sentiment analysis
-            sentiment_score = self.get_sentiment_analysis(text)
+            run.deadline.check()
+            if not run.deadline.allows('toxicity_boost'):
+                return toxicity_data
             
-            # Keyword-based toxicity analysis
-            toxicity_data = self.analyze_keywords(text)
+            with run.deadline.timed('toxicity_boost'):
+                sentiment = run.get('sentiment')
+            if sentiment is None:
+                # The fallback model shed the request: keywords only
+                return toxicity_data
             
             # Combine ML sentiment with keyword analysis for better accuracy
-            if sentiment_score == 'negative':
+            if sentiment['sentiment'] == 'negative':
                 # If sentiment is negative and we have toxic keywords, increase severity
-                if toxicity_data['isToxic']:
-                    if toxicity_data['severity'] == 'warning':
-                        toxicity_data['severity'] = 'high'
-                    elif toxicity_data['severity'] == 'high':
-                        toxicity_data['severity'] = 'severe'
-                    
-                    # Increase toxicity score
-                    toxicity_data['toxicityScore'] = min(toxicity_data['toxicityScore'] + 0.2, 1.0)
-                # Note: Removed automatic toxicity flagging for negative sentiment
-                # as it was causing false positives for legitimate emotions like "sad"
+                if toxicity_data['severity'] == 'warning':
+                    toxicity_data['severity'] = 'high'
+                elif toxicity_data['severity'] == 'high':
+                    toxicity_data['severity'] = 'severe'
+                
+                # Increase toxicity score
+                toxicity_data['toxicityScore'] = min(toxicity_data['toxicityScore'] + 0.2, 1.0)
+            # Note: Removed automatic toxicity flagging for negative sentiment
+            # as it was causing false positives for legitimate emotions like "sad"
             
             return toxicity_data
             
+        except DeadlineExceeded:
+            raise
         except Exception as e:
             print(f"❌ ML toxicity analysis error: {e}")
             # Fallback to keyword-only analysis
-            return self.analyze_keywords(text)
+            return dict(run.get('keywords'))
 
-    def get_sentiment_analysis(self, text):
+    def lexicon_stage(self, run):
+        # Per-word explanations are only built when they were asked for
+        result = self.enhanced_analyzer.analyze_sentiment(run.text, explain=run.wants('explanations'))
+        if run.options.get('observe', True):
+            drift_monitor.observe_lexicon(run.text, result)
+        return result
+
+    def sentiment_stage(self, run):
         """
         Get sentiment analysis using enhanced analyzer first, then fallback to models
+
+        Returns None, and marks the run degraded, when the fallback model is
+        overloaded and sheds the request.
         """
         try:
             # First try enhanced analyzer (with negation handling)
-            result = self.enhanced_analyzer.analyze_sentiment(text)
-            return result['sentiment']
+            result = run.get('lexicon')
+            return {
+                'sentiment': result['sentiment'],
+                'confidence': result['confidence'],
+                'score': result['score'],
+            }
             
         except Exception as e:
             print(f"❌ Enhanced sentiment analysis error, falling back to NB model: {e}")
             
             try:
                 # Fallback to Naive Bayes model
-                with open(NB_MODEL_PATH, 'rb') as f:
-                    nb_classifier = pickle.load(f)
-                
-                prediction = nb_classifier.predict([text])
-                return prediction[0] if prediction else 'neutral'
+                prediction, admitted = gated_predict('nb', model_input(run.text), max_wait=run.deadline.remaining())
+                if not admitted:
+                    run.degraded = True
+                    return None
+                return {'sentiment': prediction or 'neutral', 'method': 'nb_fallback'}
                 
             except Exception as e2:
                 print(f"❌ NB model sentiment analysis error: {e2}")
-                return 'neutral'
+                return {'sentiment': 'neutral', 'method': 'nb_fallback'}
 
-    def analyze_keywords(self, text):
+    def toxicity_signature(self, text, use_ml=True, matcher=None):
+        """
+        Tokens that can change the toxicity verdict: toxic keywords, plus the
+        sentiment lexicon when the ML sentiment boost is used
+        """
+        matcher = self.keyword_categories if matcher is None else matcher
+        keywords = tuple(
+            word for word in islice(iter_tokens(text, WORD_TOKEN), MAX_WORDS)
+            if word in matcher
+        )
+        if use_ml:
+            return keywords + self.enhanced_analyzer.salient_tokens(text)
+        return keywords
+
+    def analyze_keywords(self, text, matcher=None):
         """
         Analyze text for toxic keywords and patterns
+
+        One pass over at most MAX_WORDS words, counting keywords per category
+        and keeping only the first few of each for ``detectedKeywords``.
+        ``matcher`` is a group's word -> categories map (see
+        sentiment.moderation_lists); the global keywords by default.
         """
-        text_lower = text.lower()
-        
-        # Remove special characters for better matching
-        clean_text = re.sub(r'[^\w\s]', ' ', text_lower)
-        words = clean_text.split()
+        matcher = self.keyword_categories if matcher is None else matcher
+        counts = dict.fromkeys(('profanity', 'threat', 'insult', 'identity_attack'), 0)
+        found = {category: [] for category in counts}
+        truncated = False
         
-        # Use exact word matching to avoid false positives (e.g., "hello" containing "hell")
-        found_profanity = [word for word in words if word in self.profanity_keywords]
-        found_threats = [word for word in words if word in self.threat_keywords]
-        found_hate = [word for word in words if word in self.hate_keywords]
-        found_identity_attacks = [word for word in words if word in self.identity_attack_keywords]
+        # Punctuation separates words; exact word matching avoids false
+        # positives (e.g., "hello" containing "hell")
+        for position, word in enumerate(iter_tokens(text, WORD_TOKEN)):
+            if position >= MAX_WORDS:
+                truncated = True
+                break
+            for category in matcher.get(word, ()):
+                counts[category] += 1
+                if len(found[category]) < 5:
+                    found[category].append(word)
         
-        all_found = found_profanity + found_threats + found_hate + found_identity_attacks
+        all_found = [word for category in counts for word in found[category]]
         
         # Determine categories
-        categories = []
-        if found_profanity:
-            categories.append('profanity')
-        if found_threats:
-            categories.append('threat')
-        if found_hate:
-            categories.append('insult')
-        if found_identity_attacks:
-            categories.append('identity_attack')
+        categories = [category for category, count in counts.items() if count]
         
         # Calculate toxicity score and severity
-        total_keywords = len(all_found)
+        total_keywords = sum(counts.values())
         
         if total_keywords == 0:
-            return {
+            result = {
                 'isToxic': False,
                 'toxicityScore': 0.0,
                 'severity': 'none',
                 'categories': [],
                 'detectedKeywords': []
             }
+            if truncated:
+                result['truncated'] = True
+            return result
         
         # Score calculation
         score = min(total_keywords * 0.25, 1.0)
         
         # Add weight for different types of toxicity
-        if found_threats:
+        if counts['threat']:
             score += 0.3  # Threats are more severe
-        if found_identity_attacks:
+        if counts['identity_attack']:
             score += 0.25  # Identity attacks are severe
         
         score = min(score, 1.0)
@@ -259,44 +493,121 @@ class ToxicityAPIView(APIView):
         else:
             severity = 'none'
         
-        return {
+        result = {
             'isToxic': total_keywords > 0,
             'toxicityScore': round(score, 2),
             'severity': severity,
             'categories': categories,
             'detectedKeywords': all_found[:5]  # Limit to first 5 keywords
         }
+        if truncated:
+            result['truncated'] = True
+        return result
 
     def post(self, request):
         print("🛡️ Request received for toxicity analysis")
         
         text = request.data.get('text', '').strip()
         use_ml = request.data.get('use_ml', True)  # Default to using ML
-        original_sentiment = request.data.get('sentiment', 'neutral')
+        original_sentiment = request.data.get('sentiment')
+        group_id = request.data.get('group_id')
+        detail = get_detail_level(request)
+        fields = get_fields(request, TOXICITY_FIELDS, default=['toxicity'])
+        deadline = Deadline.from_request(request)
         
         if not text:
             return Response({'error': 'No text provided'}, status=status.HTTP_400_BAD_REQUEST)
+        if detail is None:
+            return invalid_detail_response()
+        if fields is None:
+            return invalid_fields_response(TOXICITY_FIELDS)
+        if group_id is not None and not isinstance(group_id, str):
+            return Response({'error': 'group_id must be a string'}, status=status.HTTP_400_BAD_REQUEST)
+        if deadline.expired():
+            return deadline_exceeded_response(deadline)
         
         try:
-            if use_ml:
-                result = self.analyze_toxicity_with_ml(text)
-                result['method'] = 'ml_enhanced'
-            else:
-                result = self.analyze_keywords(text)
-                result['method'] = 'keyword_only'
+            started = time.perf_counter()
+            # The group's compiled matcher; the global one when it has no lists
+            matcher, list_version = matcher_pool.get(group_id, self.keyword_categories)
+
+            # Repeated and near-identical messages reuse an earlier verdict;
+            # debug responses always show a fresh computation
+            trace = {}
+
+            def compute():
+                run = self.pipeline.run(text, fields, deadline=deadline, use_ml=use_ml, matcher=matcher)
+                verdict = run.outputs()
+                trace['stages'] = run.executed
+                if 'toxicity' in verdict:
+                    verdict['toxicity']['method'] = 'ml_enhanced' if use_ml else 'keyword_only'
+                    drift_monitor.observe_toxicity(text, verdict['toxicity'])
+                if run.degraded:
+                    verdict['degraded'] = True
+                if deadline.skipped:
+                    verdict['skipped_stages'] = list(deadline.skipped)
+                return verdict
+
+            # Sentiment outputs depend on the lexicon words as well as the keywords
+            uses_lexicon = use_ml or fields != ('toxicity',)
+            namespace = f"toxicity:{'ml' if use_ml else 'keyword'}:{'+'.join(fields)}"
+            if list_version is not None:
+                # Verdicts under a group's lists are only reused for that list version
+                namespace += f'@{group_id}:v{list_version}'
+            verdict, duplicate = cached_verdict(
+                namespace,
+                text,
+                self.toxicity_signature(text, uses_lexicon, matcher),
+                compute,
+                use_cache=detail != 'debug'
+            )
             
-            # Auto-determine sentiment: toxic messages are always negative
-            final_sentiment = 'negative' if result['isToxic'] else original_sentiment
-            sentiment_overridden = result['isToxic'] and original_sentiment != 'negative'
+            result = verdict.get('toxicity')
+            analyzed = verdict.get('sentiment')
             
-            return Response({
-                'text': text,
-                'toxicity': result,
-                'sentiment': final_sentiment,
-                'sentimentOverridden': sentiment_overridden,
-                'timestamp': '2024-12-19T00:00:00Z'  # You might want to use datetime.now()
-            })
+            conversation_id = conversation_key(request.data)
+            if conversation_id and result is not None:
+                rollup_store.observe_toxicity(conversation_id, result['isToxic'], result['toxicityScore'])
+            # Reused verdicts count too: a raid repeating one slur is exactly a spike
+            if result is not None and result['isToxic']:
+                # Only global keywords: a group's own blocked words stay private
+                trending_terms.observe(keyword_hits(result, self.keyword_categories))
             
+            # Auto-determine sentiment: toxic messages are always negative,
+            # others keep the caller's sentiment (or the analyzed one)
+            if original_sentiment is None:
+                original_sentiment = analyzed['sentiment'] if analyzed else 'neutral'
+            is_toxic = result is not None and result['isToxic']
+            
+            response = {}
+            if detail != 'minimal':
+                response['text'] = text
+            if result is not None:
+                response['toxicity'] = result
+            response['sentiment'] = 'negative' if is_toxic else original_sentiment
+            response['sentimentOverridden'] = is_toxic and original_sentiment != 'negative'
+            if 'sentiment' in fields:
+                response['sentimentAnalysis'] = analyzed
+            if 'explanations' in fields:
+                response['wordAnalysis'] = verdict['explanations']
+            if detail != 'minimal':
+                response['timestamp'] = '2024-12-19T00:00:00Z'  # You might want to use datetime.now()
+            if verdict.get('degraded'):
+                response['degraded'] = True
+            if verdict.get('skipped_stages'):
+                response['skipped_stages'] = verdict['skipped_stages']
+            if duplicate is not None:
+                response.update(duplicate.reference())
+            if detail == 'debug':
+                response['debug'] = {
+                    'stages': trace.get('stages'),
+                    'moderation_list_version': list_version,
+                    'elapsed_ms': round((time.perf_counter() - started) * 1000, 3)
+                }
+            return Response(response)
+            
+        except DeadlineExceeded:
+            return deadline_exceeded_response(deadline)
         except Exception as e:
             print(f"❌ Toxicity analysis error: {e}")
             traceback.print_exc()
@@ -310,63 +621,135 @@ class EnhancedSentimentAPIView(APIView):
     """
     Dedicated endpoint for enhanced sentiment analysis with negation handling
     """
+    renderer_classes = ANALYSIS_RENDERERS
+
     def __init__(self):
         super().__init__()
-        self.enhanced_analyzer = EnhancedSentimentAnalyzer()
+        self.enhanced_analyzer = enhanced_analyzer
     
+    def analyze(self, text, model_name, explain=True, deadline=None):
+        """
+        Lexicon analysis, verified by the selected ML model when it is unsure
+
+        Returns the analyzer result plus the lexicon-only and ML labels; the
+        result is flagged ``degraded`` when the model shed the request. The
+        ML step is skipped when ``deadline`` leaves no time for it.
+        """
+        deadline = deadline or Deadline()
+        ml_sentiment = None
+
+        # First, use enhanced analyzer for negation handling
+        result = self.enhanced_analyzer.analyze_sentiment(text, explain=explain)
+        drift_monitor.observe_lexicon(text, result)
+        lexicon_sentiment = result['sentiment']
+        deadline.check()
+        
+        # If confidence is low or neutral, use the selected ML model for verification
+        needs_ml = result['confidence'] < 0.5 or result['sentiment'] == 'neutral'
+        if needs_ml and deadline.allows('ml_fallback'):
+            print(f"🔍 Low confidence or neutral, using {model_name} model for verification")
+            
+            try:
+                # Use the selected model, unless its admission gate sheds the request
+                ml_model = 'nb' if model_name == 'nb' else 'svc'
+                # A cold model load says nothing about the usual cost of this stage
+                with deadline.timed('ml_fallback', record=model_store.is_loaded(ml_model)):
+                    ml_sentiment, admitted = gated_predict(ml_model, model_input(text), max_wait=deadline.remaining())
+                if not admitted:
+                    print(f"⚠️ {ml_model.upper()} model overloaded, keeping the lexicon result")
+                    result['degraded'] = True
+                    return result, lexicon_sentiment, None
+                ml_sentiment = ml_sentiment or 'neutral'
+                
+                # Combine enhanced and ML results
+                if result['sentiment'] == 'neutral' and ml_sentiment != 'neutral':
+                    result['sentiment'] = ml_sentiment
+                    result['confidence'] = 0.6
+                    result['method'] = f'enhanced_with_{model_name}_fallback'
+                
+            except Exception as e:
+                print(f"❌ ML model verification failed: {e}")
+
+        return result, lexicon_sentiment, ml_sentiment
+
     def post(self, request):
         print("✨ Request received for enhanced sentiment analysis")
         
         text = request.data.get('text', '').strip()
         model_name = request.data.get('model', 'svc')  # Get model selection
+        detail = get_detail_level(request)
+        deadline = Deadline.from_request(request)
         
         if not text:
             return Response({'error': 'No text provided'}, status=status.HTTP_400_BAD_REQUEST)
+        if detail is None:
+            return invalid_detail_response()
+        if deadline.expired():
+            return deadline_exceeded_response(deadline)
         
         try:
-            # First, use enhanced analyzer for negation handling
-            result = self.enhanced_analyzer.analyze_sentiment(text)
-            
-            # If confidence is low or neutral, use the selected ML model for verification
-            if result['confidence'] < 0.5 or result['sentiment'] == 'neutral':
-                print(f"🔍 Low confidence or neutral, using {model_name} model for verification")
-                
-                try:
-                    # Use the selected model
-                    if model_name == 'nb':
-                        with open(NB_MODEL_PATH, 'rb') as f:
-                            nb_classifier = pickle.load(f)
-                        prediction = nb_classifier.predict([text])
-                        ml_sentiment = prediction[0] if prediction else 'neutral'
-                    else:  # svc
-                        with open(SVC_MODEL_PATH, 'rb') as f:
-                            tfidf_vectorizer, svm_classifier = pickle.load(f)
-                        X_input = tfidf_vectorizer.transform([text])
-                        prediction = svm_classifier.predict(X_input)
-                        ml_sentiment = prediction[0] if prediction else 'neutral'
-                    
-                    # Combine enhanced and ML results
-                    if result['sentiment'] == 'neutral' and ml_sentiment != 'neutral':
-                        result['sentiment'] = ml_sentiment
-                        result['confidence'] = 0.6
-                        result['method'] = f'enhanced_with_{model_name}_fallback'
-                    
-                except Exception as e:
-                    print(f"❌ ML model verification failed: {e}")
-            
-            return Response({
-                'text': text,
-                'sentiment': result['sentiment'],
-                'confidence': result['confidence'],
-                'score': result['score'],
-                'method': result.get('method', 'enhanced_context_aware'),
-                'model_used': model_name,
-                'word_analysis': result['word_analysis'],
-                'word_count': result['word_count'],
-                'sentiment_words_found': result['sentiment_words_found'],
-                'timestamp': '2024-12-19T00:00:00Z'
-            })
+            started = time.perf_counter()
+
+            # Repeated and near-identical messages reuse an earlier verdict;
+            # debug responses always show a fresh computation
+            trace = {}
+
+            def compute():
+                result, trace['lexicon_sentiment'], trace['ml_sentiment'] = self.analyze(
+                    text, model_name, explain=detail != 'minimal', deadline=deadline
+                )
+                verdict = {
+                    'sentiment': result['sentiment'],
+                    'confidence': result['confidence'],
+                    'score': result['score'],
+                    'method': result.get('method', 'enhanced_context_aware'),
+                    'model_used': model_name,
+                }
+                if detail != 'minimal':
+                    verdict.update({
+                        'word_analysis': result['word_analysis'],
+                        'word_count': result['word_count'],
+                        'sentiment_words_found': result['sentiment_words_found'],
+                    })
+                    if result.get('explanations_omitted'):
+                        verdict['explanations_omitted'] = result['explanations_omitted']
+                if result.get('truncated'):
+                    verdict['truncated'] = True
+                if result.get('degraded'):
+                    verdict['degraded'] = True
+                if deadline.skipped:
+                    verdict['skipped_stages'] = list(deadline.skipped)
+                return verdict
+
+            verdict, duplicate = cached_verdict(
+                f'enhanced:{model_name}:{detail}',
+                text,
+                self.enhanced_analyzer.salient_tokens(text),
+                compute,
+                use_cache=detail != 'debug'
+            )
+
+            conversation_id = conversation_key(request.data)
+            if conversation_id:
+                rollup_store.observe_sentiment(conversation_id, verdict['sentiment'], verdict['score'])
+
+            if detail == 'minimal':
+                response = verdict
+            else:
+                response = {'text': text, **verdict, 'timestamp': '2024-12-19T00:00:00Z'}
+            if duplicate is not None:
+                response.update(duplicate.reference())
+            if detail == 'debug':
+                response['debug'] = {
+                    'lexicon_sentiment': trace['lexicon_sentiment'],
+                    'lexicon_version': self.enhanced_analyzer.lexicon_version,
+                    'ml_sentiment': trace['ml_sentiment'],
+                    'elapsed_ms': round((time.perf_counter() - started) * 1000, 3)
+                }
+            return Response(response)
             
+        except DeadlineExceeded:
+            return deadline_exceeded_response(deadline)
         except Exception as e:
             print(f"❌ Enhanced sentiment analysis error: {e}")
             traceback.print_exc()